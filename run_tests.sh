@@ -24,6 +24,11 @@ source $VENV_PATH/bin/activate
 # install utilities
 $PIP install coverage flake8
 
+# datasets need numpy >= 1.17, which doesn't support Python 2
+if [ "$PYTHON_VERSION" = "3" ]; then
+	$PIP install numpy
+fi
+
 # install testgres' dependencies
 export PYTHONPATH=$(pwd)
 $PIP install .
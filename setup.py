@@ -16,6 +16,10 @@ if sys.version_info < (3, 4):
 if sys.version_info < (3, 3):
     install_requires.append("ipaddress")
 
+# Datasets need numpy.random.Generator (numpy 1.17+),
+# which isn't available for Python 2
+extras_require = {'numpy': ['numpy>=1.17; python_version >= "3.5"']}
+
 setup(
     name='testgres',
     packages=['testgres'],
@@ -27,4 +31,5 @@ setup(
     url='https://github.com/postgrespro/testgres',
     keywords=['testing', 'postgresql'],
     classifiers=[],
-    install_requires=install_requires)
+    install_requires=install_requires,
+    extras_require=extras_require)
@@ -1,5 +1,12 @@
 from .api import get_new_node
 from .backup import NodeBackup
+from .budget import ResourceBudget
+
+from .compare import \
+    compare_configs, \
+    ComparisonResult, \
+    MetricComparison
+
 from .config import TestgresConfig, configure_testgres
 
 from .connection import \
@@ -8,9 +15,56 @@ from .connection import \
     InternalError, \
     ProgrammingError
 
+from .copycodec import CopyEncoder, CopyDecoder
+from .dataset import Dataset
 from .exceptions import *
 from .node import NodeStatus, PostgresNode
 
+from .histogram import LatencyHistogram
+
+from .loader import LoadResult, WorkerStats
+
+from .metrics import \
+    OperationRecord, \
+    add_hook, \
+    remove_hook, \
+    global_metrics
+
+from .pgbench import \
+    PgbenchResult, \
+    PgbenchProcess, \
+    PgbenchProgress, \
+    PgbenchScript, \
+    PgbenchStatement, \
+    PgbenchInterval
+
+from .plan import QueryPlan, PlanNode, PlanChange, diff_plans
+from .procfs import ResourceUsage, ResourceDelta, ResourceMonitor
+from .profiles import get_profile_settings
+from .querystats import QueryStats, QueryStatsCollector
+from .replay import CapturedWorkload, CapturedSession, ReplayResult
+from .resources import \
+    CpuSet, \
+    HostResources, \
+    get_host_resources, \
+    split_cpus
+
+from .sampler import WaitEventSampler, WaitEventProfile
+
+from .settings import \
+    ConfigAction, \
+    ConfigFile, \
+    HbaFile, \
+    NodeSettings
+
+from .slowlog import SlowQuery, SlowQueryLog
+from .snapshot import StatsSnapshot, StatsDelta
+from .sweep import run_sweep, SweepResult
+
+from .tracing import ChromeTracer
+
+from .workload import Workload, WorkloadResult, TransactionStats
+
 from .utils import \
     reserve_port, \
     release_port, \
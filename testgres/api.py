@@ -33,10 +33,14 @@ typical flow may look like:
 Copyright (c) 2016, Postgres Professional
 """
 
+from .consts import STORAGE_DISK as _STORAGE_DISK
 from .node import PostgresNode
 
 
-def get_new_node(name=None, base_dir=None, use_logging=False):
+def get_new_node(name=None,
+                 base_dir=None,
+                 use_logging=False,
+                 storage=_STORAGE_DISK):
     """
     Create a new node (select port automatically).
 
@@ -44,9 +48,13 @@ def get_new_node(name=None, base_dir=None, use_logging=False):
         name: node's application name.
         base_dir: path to node's data directory.
         use_logging: enable python logging.
+        storage: where to keep files ('disk' | 'memory' | 'memory-wal').
 
     Returns:
         An instance of PostgresNode.
     """
 
-    return PostgresNode(name=name, base_dir=base_dir, use_logging=use_logging)
+    return PostgresNode(name=name,
+                        base_dir=base_dir,
+                        use_logging=use_logging,
+                        storage=storage)
@@ -13,12 +13,18 @@ from .consts import \
 
 from .exceptions import BackupException
 
+from .metrics import timed as _timed
+
 from .utils import \
     get_bin_path, \
     default_username as _default_username, \
     execute_utility as _execute_utility
 
 
+def _original_node(backup):
+    return backup.original_node
+
+
 class NodeBackup(object):
     """
     Smart object responsible for backups
@@ -114,6 +120,7 @@ class NodeBackup(object):
         # Return path to new node
         return dest_base_dir
 
+    @_timed('spawn_primary', get_node=_original_node)
     def spawn_primary(self, name=None, destroy=True, use_logging=False):
         """
         Create a primary node from a backup.
@@ -139,11 +146,12 @@ class NodeBackup(object):
         # New nodes should always remove dir tree
         node._should_rm_dirs = True
 
-        node.append_conf("postgresql.conf", "\n")
-        node.append_conf("postgresql.conf", "port = {}".format(node.port))
+        # replace master's port (no duplicates)
+        node.settings().set('port', node.port).save()
 
         return node
 
+    @_timed('spawn_replica', get_node=_original_node)
     def spawn_replica(self, name=None, destroy=True, use_logging=False):
         """
         Create a replica of the original node from a backup.
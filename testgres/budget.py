@@ -0,0 +1,311 @@
+# coding: utf-8
+
+import errno
+import fcntl
+import io
+import os
+import re
+import threading
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .exceptions import TimeoutException
+
+from .profiles import MB, format_size
+
+from .resources import get_host_resources
+
+# SEMMSL SEMMNS SEMOPM SEMMNI
+_SYSV_SEM_FILE = "/proc/sys/kernel/sem"
+
+# how much private memory an active backend might need
+_BACKEND_MEMORY = 2 * MB
+
+# smallest reasonable node
+_MIN_NODE_MEMORY = 64 * MB
+
+# units of memory settings
+_SIZE_RE = re.compile(r"^\s*(\d+)\s*(B|kB|MB|GB|TB)?\s*$")
+_SIZE_UNITS = {
+    'B': 1,
+    'kB': 1024,
+    'MB': 1024**2,
+    'GB': 1024**3,
+    'TB': 1024**4
+}
+
+# how often should we look at a host-wide registry
+_POLL_INTERVAL = 0.1
+
+# serializes claims of different processes
+_REGISTRY_LOCK_FILE = ".lock"
+
+
+def _clamp(value, lo, hi):
+    return int(max(lo, min(value, hi)))
+
+
+def parse_size(value, default_unit=1024):
+    """
+    Convert a memory setting (e.g. '128MB') into bytes.
+
+    Args:
+        value: value of a setting.
+        default_unit: size of a unit if value has none (8192 for buffers).
+    """
+
+    match = _SIZE_RE.match(str(value))
+    if not match:
+        raise ValueError('Bad memory size "{}"'.format(value))
+
+    number, unit = match.groups()
+    return int(number) * (_SIZE_UNITS[unit] if unit else default_unit)
+
+
+def _sysv_semaphore_sets():
+    try:
+        with io.open(_SYSV_SEM_FILE, 'r') as f:
+            return int(f.read().split()[3])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+def _pid_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def estimate_node_memory(node):
+    """
+    Estimate how much memory a node is going to use
+    (shared buffers + private memory of backends).
+    """
+
+    conf = node.settings()
+    shared_buffers = parse_size(conf.get('shared_buffers', '128MB'), 8192)
+    max_connections = int(conf.get('max_connections', 100))
+
+    return shared_buffers + max_connections * _BACKEND_MEMORY
+
+
+class ResourceBudget(object):
+    """
+    Shares host's resources between nodes running concurrently.
+
+    Nodes configured by default_conf() get a fair share of memory,
+    start() waits until there's enough room for one more node.
+    Use registry_dir to share a budget between processes:
+
+    >>> configure_testgres(resource_budget=ResourceBudget(
+    ...     registry_dir='/tmp/testgres_budget'))
+    """
+
+    def __init__(self,
+                 max_nodes=None,
+                 memory=None,
+                 registry_dir=None,
+                 timeout=None):
+        """
+        Create a new budget.
+
+        Args:
+            max_nodes: how many nodes may run at once (computed by default).
+            memory: memory (bytes) for all nodes (half of RAM by default).
+            registry_dir: directory shared by processes (host-wide budget).
+            timeout: how long should start() wait for resources? None == inf.
+        """
+
+        resources = get_host_resources()
+
+        self.memory = memory or resources.memory // 2
+        self.max_nodes = max_nodes or self._default_max_nodes()
+        self.registry_dir = registry_dir
+        self.timeout = timeout
+
+        # node key -> claimed memory
+        self._claims = {}
+        self._cond = threading.Condition()
+
+        if registry_dir and not os.path.exists(registry_dir):
+            try:
+                os.makedirs(registry_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def _default_max_nodes(self):
+        max_nodes = max(self.memory // _MIN_NODE_MEMORY, 1)
+
+        # each node needs a few SysV semaphore sets (PG < 10)
+        sem_sets = _sysv_semaphore_sets()
+        if sem_sets:
+            max_nodes = min(max_nodes, max(sem_sets // 8, 1))
+
+        return int(max_nodes)
+
+    @staticmethod
+    def _key(node):
+        return '{}-{}'.format(os.getpid(), node.port)
+
+    def _registry_entries(self):
+        """
+        Return {key: memory} for all live nodes of a host-wide registry.
+        """
+
+        entries = {}
+
+        for name in os.listdir(self.registry_dir):
+            path = os.path.join(self.registry_dir, name)
+
+            try:
+                pid = int(name.split('-')[0])
+                with io.open(path, 'r') as f:
+                    memory = int(f.read().strip() or 0)
+            except (IOError, OSError, ValueError):
+                continue
+
+            # drop claims of dead processes
+            if not _pid_is_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+
+            entries[name] = memory
+
+        return entries
+
+    def _usage(self):
+        if self.registry_dir:
+            claims = self._registry_entries()
+        else:
+            claims = self._claims
+
+        return len(claims), sum(claims.values())
+
+    @contextmanager
+    def _registry_lock(self):
+        if not self.registry_dir:
+            yield
+            return
+
+        path = os.path.join(self.registry_dir, _REGISTRY_LOCK_FILE)
+        with io.open(path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _try_claim(self, key, memory):
+        with self._registry_lock():
+            return self._claim(key, memory)
+
+    def _claim(self, key, memory):
+        nodes, used = self._usage()
+
+        # a single huge node should not wait forever
+        fits = used + memory <= self.memory or nodes == 0
+        if nodes >= self.max_nodes or not fits:
+            return False
+
+        if self.registry_dir:
+            path = os.path.join(self.registry_dir, key)
+            with io.open(path, 'w') as f:
+                f.write(u'{}\n'.format(memory))
+
+        self._claims[key] = memory
+        return True
+
+    def running(self):
+        """
+        Return number of running nodes (host-wide if registry is shared).
+        """
+
+        with self._cond:
+            return self._usage()[0]
+
+    def node_settings(self, allow_streaming=False):
+        """
+        Compute a fair share of resources for a new node.
+
+        Returns:
+            An OrderedDict of settings.
+        """
+
+        memory = self.memory // self.max_nodes
+
+        # private memory of backends takes 3/4 of node's share
+        max_connections = _clamp(memory * 3 // 4 // _BACKEND_MEMORY, 10, 100)
+
+        conf = OrderedDict()
+        conf['max_connections'] = max_connections
+        conf['shared_buffers'] = format_size(
+            _clamp(memory // 4 // MB, 2, 1024) * MB)
+        conf['work_mem'] = format_size(
+            _clamp(memory // 4 // max_connections, 64 * 1024, 4 * MB))
+
+        if allow_streaming:
+            conf['max_wal_senders'] = _clamp(max_connections // 4, 2, 10)
+
+        return conf
+
+    def acquire(self, node, timeout=None):
+        """
+        Wait until there are enough resources for a node.
+
+        Args:
+            node: PostgresNode which is going to be started.
+            timeout: how long should we wait? (see self.timeout)
+
+        Returns:
+            True if a new claim has been made.
+        """
+
+        key = self._key(node)
+        memory = estimate_node_memory(node)
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._cond:
+            # this node already has its share
+            if key in self._claims:
+                return False
+
+            while not self._try_claim(key, memory):
+                wait = _POLL_INTERVAL if self.registry_dir else None
+
+                if deadline is not None:
+                    left = deadline - time.time()
+                    if left <= 0:
+                        raise TimeoutException('Resource budget is exhausted')
+                    wait = min(wait or left, left)
+
+                self._cond.wait(wait)
+
+        return True
+
+    def release(self, node):
+        """
+        Return resources of a stopped node to the budget.
+        """
+
+        key = self._key(node)
+
+        with self._cond:
+            if self._claims.pop(key, None) is None:
+                return
+
+            if self.registry_dir:
+                try:
+                    os.remove(os.path.join(self.registry_dir, key))
+                except OSError:
+                    pass
+
+            self._cond.notify_all()
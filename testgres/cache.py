@@ -13,6 +13,8 @@ from .exceptions import \
     InitNodeException, \
     ExecUtilException
 
+from .metrics import measure as _measure
+
 from .utils import \
     get_bin_path, \
     execute_utility as _execute_utility
@@ -56,6 +58,7 @@ def cached_initdb(data_dir, initdb_logfile, initdb_params=[]):
 
         try:
             # Copy cached initdb to current data dir
-            shutil.copytree(cached_data_dir, data_dir)
+            with _measure('initdb_copy'):
+                shutil.copytree(cached_data_dir, data_dir)
         except Exception as e:
             raise_from(InitNodeException("Failed to copy files"), e)
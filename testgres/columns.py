@@ -0,0 +1,247 @@
+# coding: utf-8
+"""
+Column-oriented fetching of query results into numpy arrays.
+"""
+
+import io
+import sys
+
+from collections import OrderedDict
+from six import reraise
+
+from .copycodec import \
+    CopyDecoder as _CopyDecoder, \
+    get_type as _get_type, \
+    is_supported as _is_supported
+from .exceptions import TestgresException
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_BATCH_SIZE = 10000
+
+_CURSOR_NAME = 'testgres_columns'
+
+# type OID -> numpy dtype (other types are kept as objects)
+_OID_DTYPES = {
+    16: 'bool',                 # bool
+    20: 'int64',                # int8
+    21: 'int16',                # int2
+    23: 'int32',                # int4
+    26: 'uint32',               # oid
+    700: 'float32',             # float4
+    701: 'float64',             # float8
+    1700: 'float64',            # numeric (lossy)
+    1082: 'datetime64[D]',      # date
+    1114: 'datetime64[us]',     # timestamp
+    1184: 'datetime64[us]',     # timestamptz (UTC)
+}
+
+_TIMESTAMPTZ_OID = 1184
+
+
+def _require_numpy():
+    if np is None:
+        raise TestgresException('numpy is required to fetch columns')
+
+
+def _to_utc(values):
+    # numpy doesn't store time zones
+    return [v - v.utcoffset() if v is not None and v.utcoffset() else v
+            for v in values]
+
+
+def _convert(values, oid):
+    """
+    Convert a batch of column values into a numpy array.
+    """
+
+    dtype = _OID_DTYPES.get(oid)
+
+    if dtype is None:
+        result = np.empty(len(values), dtype=object)
+        result[:] = values
+        return result
+
+    if oid == _TIMESTAMPTZ_OID:
+        values = [v.replace(tzinfo=None) if v is not None else None
+                  for v in _to_utc(values)]
+
+    # integers and booleans can't be NULL, NaN / NaT are fine
+    if np.dtype(dtype).kind in 'iub' and any(v is None for v in values):
+        if np.dtype(dtype).kind == 'b':
+            return _convert(values, None)
+        dtype = 'float64'
+
+    return np.array(values, dtype=dtype)
+
+
+def _describe(con, query):
+    """
+    Return names and type OIDs of columns without running the query.
+    """
+
+    con.cursor.execute('select * from ({}) as q limit 0'.format(query))
+    description = con.cursor.description
+    con.cursor.fetchall()
+
+    return [d[0] for d in description], [d[1] for d in description]
+
+
+def _fetch_binary(con, query, oids, batch_size):
+    """
+    Fetch columns via binary COPY, fixed-width columns without NULLs
+    are read directly from the buffer (see CopyDecoder.arrays()),
+    others are decoded in batches of rows.
+    """
+
+    buf = io.BytesIO()
+    con.copy_to(query, output=buf, format='binary')
+
+    # don't copy the whole result once more
+    data = buf.getbuffer() if hasattr(buf, 'getbuffer') else buf.getvalue()
+
+    decoder = _CopyDecoder(oids)
+    arrays = decoder.arrays(data)
+    if arrays is not None:
+        return arrays
+
+    batches = [[] for _ in oids]
+    for rows in decoder.iter_rows(data, batch_size):
+        for i, values in enumerate(zip(*rows)):
+            batches[i].append(_convert(list(values), oids[i]))
+
+    return _concatenate(oids, batches)
+
+
+def _concatenate(oids, batches):
+    arrays = []
+    for oid, chunks in zip(oids, batches):
+        if chunks:
+            arrays.append(np.concatenate(chunks))
+        else:
+            arrays.append(np.empty(0, dtype=_OID_DTYPES.get(oid, object)))
+
+    return arrays
+
+
+def _fetch_cursor(con, query, args, batch_size):
+    """
+    Fetch columns in batches from a server-side cursor.
+    """
+
+    cursor = con.cursor
+    declare = 'declare {} no scroll cursor for {}'.format(_CURSOR_NAME, query)
+
+    # don't let drivers interpret '%' unless there are parameters
+    if args:
+        cursor.execute(declare, args)
+    else:
+        cursor.execute(declare)
+
+    names = None
+    oids = None
+    batches = None
+
+    try:
+        while True:
+            cursor.execute('fetch forward {} from {}'.format(
+                int(batch_size), _CURSOR_NAME))
+
+            if names is None:
+                names = [d[0] for d in cursor.description]
+                oids = [d[1] for d in cursor.description]
+                batches = [[] for _ in names]
+
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            for i, values in enumerate(zip(*rows)):
+                batches[i].append(_convert(list(values), oids[i]))
+
+            if len(rows) < batch_size:
+                break
+    except Exception:
+        exc_info = sys.exc_info()
+
+        # cursor can't be closed if transaction has failed
+        try:
+            cursor.execute('close {}'.format(_CURSOR_NAME))
+        except Exception:
+            pass
+
+        reraise(*exc_info)
+
+    cursor.execute('close {}'.format(_CURSOR_NAME))
+
+    return names, _concatenate(oids, batches)
+
+
+def fetch_columns(con,
+                  query,
+                  args=(),
+                  batch_size=DEFAULT_BATCH_SIZE,
+                  structured=False,
+                  binary=None):
+    """
+    Run a query and fetch its result as numpy arrays.
+    See NodeConnection.fetch_columns().
+    """
+
+    _require_numpy()
+
+    if binary and args:
+        raise TestgresException("Binary COPY doesn't support parameters")
+
+    use_copy = not args if binary is None else binary
+
+    if use_copy:
+        names, oids = _describe(con, query)
+
+        if not all(_is_supported(oid) for oid in oids):
+            if binary:
+                raise TestgresException('Unsupported types for binary COPY')
+
+            # fall back to cursor
+            use_copy = False
+
+        # only fixed-width columns are read without Python objects,
+        # others are better fetched by cursor in batches
+        elif binary is None and \
+                not all(_get_type(oid).fixed for oid in oids):
+            use_copy = False
+
+    if use_copy:
+        arrays = _fetch_binary(con, query, oids, batch_size)
+    else:
+        names, arrays = _fetch_cursor(con, query, args, batch_size)
+
+    if len(set(names)) != len(names):
+        raise TestgresException('Duplicate column names')
+
+    columns = OrderedDict(zip(names, arrays))
+
+    if structured:
+        return to_structured(columns)
+
+    return columns
+
+
+def to_structured(columns):
+    """
+    Convert {name: array} into a numpy structured array.
+    """
+
+    _require_numpy()
+
+    size = len(next(iter(columns.values()))) if columns else 0
+    dtype = [(str(name), values.dtype) for name, values in columns.items()]
+
+    result = np.empty(size, dtype=dtype)
+    for name, values in columns.items():
+        result[str(name)] = values
+
+    return result
@@ -0,0 +1,411 @@
+# coding: utf-8
+"""
+A/B comparison of two configurations of the same node.
+
+Both nodes share a bit-for-bit identical data directory and differ
+only in a config delta. Measurements are interleaved (ABBA order)
+so that drift of host's performance affects both sides equally.
+"""
+
+from __future__ import division
+
+import math
+
+from collections import OrderedDict
+
+from .exceptions import TestgresException
+
+from .pgbench import PgbenchResult
+from .workload import WorkloadResult
+
+# metric -> is higher value better?
+_HIGHER_IS_BETTER = {
+    'tps': True,
+}
+
+VERDICT_BETTER = 'better'
+VERDICT_WORSE = 'worse'
+VERDICT_SAME = 'same'
+
+# iterations of continued fraction
+_BETACF_MAX_ITER = 200
+_BETACF_EPS = 3e-12
+
+
+def _mean(values):
+    return sum(values) / len(values)
+
+
+def _variance(values):
+    if len(values) < 2:
+        return 0.0
+
+    mean = _mean(values)
+    return sum((v - mean)**2 for v in values) / (len(values) - 1)
+
+
+def _betacf(a, b, x):
+    """
+    Continued fraction for incomplete beta function (Lentz's method).
+    """
+
+    tiny = 1e-300
+
+    qab = a + b
+    qap = a + 1
+    qam = a - 1
+    c = 1.0
+    d = 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+
+    for m in range(1, _BETACF_MAX_ITER + 1):
+        m2 = 2 * m
+
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+
+        if abs(delta - 1.0) < _BETACF_EPS:
+            break
+
+    return h
+
+
+def _betainc(a, b, x):
+    """
+    Regularized incomplete beta function I_x(a, b).
+    """
+
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+
+    ln_front = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + \
+        a * math.log(x) + b * math.log(1 - x)
+    front = math.exp(ln_front)
+
+    # continued fraction converges fast only on one side
+    if x < (a + 1) / (a + b + 2):
+        return front * _betacf(a, b, x) / a
+
+    return 1.0 - front * _betacf(b, a, 1 - x) / b
+
+
+def _t_pvalue(t, df):
+    """
+    Two-sided p-value of Student's t distribution.
+    """
+
+    return _betainc(df / 2, 0.5, df / (df + t * t))
+
+
+def _t_quantile(p, df):
+    """
+    Value t such that P(|T| > t) == p (bisection).
+    """
+
+    lo, hi = 0.0, 1.0
+    while _t_pvalue(hi, df) > p:
+        hi *= 2
+
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if _t_pvalue(mid, df) > p:
+            lo = mid
+        else:
+            hi = mid
+
+    return (lo + hi) / 2
+
+
+def welch_test(a, b, alpha=0.05):
+    """
+    Compare means of two samples (Welch's unequal variances t-test).
+
+    Args:
+        a: values of the first sample.
+        b: values of the second sample.
+        alpha: significance level.
+
+    Returns:
+        A tuple of (difference of means (b - a), (ci_low, ci_high), p-value).
+    """
+
+    if len(a) < 2 or len(b) < 2:
+        raise ValueError('Each sample should contain at least 2 values')
+
+    diff = _mean(b) - _mean(a)
+
+    va = _variance(a) / len(a)
+    vb = _variance(b) / len(b)
+    se = math.sqrt(va + vb)
+
+    # all values are identical
+    if se == 0:
+        p_value = 1.0 if diff == 0 else 0.0
+        return diff, (diff, diff), p_value
+
+    # Welch-Satterthwaite degrees of freedom
+    df = (va + vb)**2 / (va**2 / (len(a) - 1) + vb**2 / (len(b) - 1))
+
+    p_value = _t_pvalue(diff / se, df)
+    margin = _t_quantile(alpha, df) * se
+
+    return diff, (diff - margin, diff + margin), p_value
+
+
+class MetricComparison(object):
+    """
+    Difference of a single metric (e.g. tps) between A and B.
+    Lower values are considered better for all metrics except tps.
+    """
+
+    def __init__(self, name, a, b, alpha=0.05):
+        self.name = name
+        self.a = list(a)
+        self.b = list(b)
+        self.alpha = alpha
+
+        self.mean_a = _mean(self.a)
+        self.mean_b = _mean(self.b)
+
+        self.diff, self.ci, self.p_value = welch_test(self.a, self.b, alpha)
+
+    def __repr__(self):
+        return '<MetricComparison {}: {:+.2f}% ({})>'.format(
+            self.name, self.diff_pct or 0, self.verdict)
+
+    @property
+    def diff_pct(self):
+        """
+        Relative difference (percents of A), None if A is zero.
+        """
+
+        if not self.mean_a:
+            return None
+
+        return self.diff / self.mean_a * 100
+
+    @property
+    def significant(self):
+        return self.p_value < self.alpha
+
+    @property
+    def verdict(self):
+        """
+        Is B better or worse than A ('better' | 'worse' | 'same')?
+        """
+
+        if not self.significant:
+            return VERDICT_SAME
+
+        higher_is_better = _HIGHER_IS_BETTER.get(self.name, False)
+        if (self.diff > 0) == higher_is_better:
+            return VERDICT_BETTER
+
+        return VERDICT_WORSE
+
+    def to_dict(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('a', self.a),
+            ('b', self.b),
+            ('mean_a', self.mean_a),
+            ('mean_b', self.mean_b),
+            ('diff', self.diff),
+            ('diff_pct', self.diff_pct),
+            ('ci', list(self.ci)),
+            ('p_value', self.p_value),
+            ('verdict', self.verdict),
+        ])
+
+
+class ComparisonResult(object):
+    """
+    Result of compare_configs(): a MetricComparison per metric.
+    """
+
+    def __init__(self, delta, rounds, samples_a, samples_b, alpha=0.05):
+        self.delta = delta
+        self.rounds = rounds
+
+        # metric name -> MetricComparison
+        self.metrics = OrderedDict()
+
+        for name in samples_a[0]:
+            a = [s[name] for s in samples_a if s.get(name) is not None]
+            b = [s[name] for s in samples_b if s.get(name) is not None]
+
+            if len(a) >= 2 and len(b) >= 2:
+                self.metrics[name] = MetricComparison(name, a, b, alpha)
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    def __str__(self):
+        lines = [
+            '{:<12} {:>12} {:>12} {:>9} {:>23} {:>8}  {}'.format(
+                'metric', 'A', 'B', 'diff %', 'CI of diff', 'p', 'verdict')
+        ]
+
+        for m in self.metrics.values():
+            pct = '' if m.diff_pct is None else '{:+.2f}'.format(m.diff_pct)
+            ci = '[{:.3f}, {:.3f}]'.format(*m.ci)
+
+            lines.append('{:<12} {:>12.3f} {:>12.3f} {:>9} {:>23} {:>8.4f}  {}'
+                         .format(m.name, m.mean_a, m.mean_b, pct, ci,
+                                 m.p_value, m.verdict))
+
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return OrderedDict([
+            ('delta', dict(self.delta)),
+            ('rounds', self.rounds),
+            ('metrics', [m.to_dict() for m in self.metrics.values()]),
+        ])
+
+
+def collect_metrics(result):
+    """
+    Convert output of a workload into {metric: value}.
+    """
+
+    if isinstance(result, PgbenchResult):
+        metrics = OrderedDict()
+        metrics['tps'] = result.tps
+        metrics['latency_avg'] = result.latency_avg
+
+        # available if pgbench was run with --log
+        if result.histogram is not None:
+            for p, value in sorted(result.percentiles((50, 95, 99)).items()):
+                metrics['latency_p{:g}'.format(p)] = value
+
+        return metrics
+
+    if isinstance(result, WorkloadResult):
+        return result.metrics()
+
+    if isinstance(result, dict):
+        return OrderedDict(result)
+
+    if isinstance(result, (int, float)):
+        return OrderedDict([('tps', result)])
+
+    raise TestgresException('Unsupported workload result {!r}'.format(result))
+
+
+def run_workload(node, workload, dbname='postgres'):
+    """
+    Run a workload (pgbench options or callable) and collect its metrics.
+    """
+
+    if callable(workload):
+        return collect_metrics(workload(node))
+
+    return collect_metrics(node.pgbench_run(dbname=dbname, options=workload))
+
+
+def compare_configs(workload,
+                    delta,
+                    base=None,
+                    rounds=5,
+                    setup=None,
+                    warmup=None,
+                    restart=True,
+                    dbname='postgres',
+                    alpha=0.05):
+    """
+    Measure how a config change (delta) affects a workload.
+
+    Node A is configured with 'base', node B with 'base' + 'delta';
+    data is prepared once by 'setup' and then cloned. Each round runs
+    the workload on both nodes, order alternates between rounds (ABBA).
+
+    Args:
+        workload: pgbench options (list) or callable(node) returning
+            a PgbenchResult, a dict {metric: value} or tps (number).
+        delta: settings of node B which differ from A (dict).
+        base: settings of both nodes (dict).
+        rounds: number of measurements per node (at least 2).
+        setup: callable(node) which prepares data (pgbench -i by default).
+        warmup: workload to be run before each measurement (not measured).
+        restart: start node before and stop it after each measurement,
+            otherwise both nodes keep running during all rounds.
+        dbname: database for pgbench workloads.
+        alpha: significance level.
+
+    Returns:
+        An instance of ComparisonResult.
+    """
+
+    from .api import get_new_node
+
+    if rounds < 2:
+        raise TestgresException('At least 2 rounds are required')
+
+    if setup is None and not callable(workload):
+
+        def setup(node):
+            node.pgbench_run(dbname=dbname, options=['-i'])
+
+    node_a = get_new_node('node_a')
+    node_b = None
+
+    try:
+        node_a.init()
+        node_a.settings().update(base or {}).save()
+
+        # prepare data once, B gets an exact copy
+        if setup is not None:
+            node_a.start()
+            setup(node_a)
+            node_a.stop()
+
+        node_b = node_a.clone('node_b')
+        node_b.settings().update(delta).save()
+
+        if not restart:
+            node_a.start()
+            node_b.start()
+
+        samples = {node_a: [], node_b: []}
+
+        for i in range(rounds):
+            order = (node_a, node_b) if i % 2 == 0 else (node_b, node_a)
+
+            for node in order:
+                if restart:
+                    node.start()
+
+                if warmup is not None:
+                    run_workload(node, warmup, dbname)
+
+                samples[node].append(run_workload(node, workload, dbname))
+
+                if restart:
+                    node.stop()
+
+        return ComparisonResult(delta=delta,
+                                rounds=rounds,
+                                samples_a=samples[node_a],
+                                samples_b=samples[node_b],
+                                alpha=alpha)
+    finally:
+        for node in (node_a, node_b):
+            if node is not None:
+                node.cleanup()
+                node.free_port()
@@ -11,6 +11,10 @@ class TestgresConfig:
         cached_initdb_dir:  shall we create a temp dir for cached initdb?
         node_cleanup_full:  shall we remove EVERYTHING (including logs)?
         error_log_lines:    N of log lines to be included into exception (0=inf).
+        resource_budget:    ResourceBudget shared by nodes (None = unlimited).
+        tmpfs_dir:          RAM-backed dir for nodes with 'memory' storage.
+        tmpfs_min_free:     min free space (bytes) in tmpfs_dir, else use disk.
+        collect_metrics:    shall we record timings of node operations?
     """
 
     cache_initdb = True
@@ -18,6 +22,10 @@ class TestgresConfig:
     cached_initdb_dir = None
     node_cleanup_full = True
     error_log_lines = 20
+    resource_budget = None
+    tmpfs_dir = "/dev/shm"
+    tmpfs_min_free = 256 * 1024 * 1024
+    collect_metrics = False
 
 
 def configure_testgres(**options):
@@ -9,9 +9,19 @@ except ImportError:
     except ImportError:
         raise ImportError("You must have psycopg2 or pg8000 modules installed")
 
+import io
+import itertools
+import re
+import threading
+import time
+
+from contextlib import contextmanager
 from enum import Enum
 
-from .exceptions import QueryException
+from .copycodec import \
+    CopyDecoder as _CopyDecoder, \
+    CopyEncoder as _CopyEncoder
+from .exceptions import QueryException, TestgresException
 from .utils import default_username as _default_username
 
 # export these exceptions
@@ -37,13 +47,17 @@ class NodeConnection(object):
                  dbname,
                  host="127.0.0.1",
                  username=None,
-                 password=None):
+                 password=None,
+                 query_stats=None):
 
         # Use default user if not specified
         username = username or _default_username()
 
         self.parent_node = parent_node
 
+        # QueryStatsCollector (optional)
+        self.query_stats = query_stats
+
         self.connection = pglib.connect(
             database=dbname,
             user=username,
@@ -107,6 +121,9 @@ class NodeConnection(object):
         return self
 
     def execute(self, query, *args):
+        if self.query_stats is not None:
+            return self._execute_timed(query, args)
+
         self.cursor.execute(query, args)
 
         try:
@@ -120,6 +137,262 @@ class NodeConnection(object):
         except Exception:
             return None
 
+    def _execute_timed(self, query, args):
+        started = time.time()
+        self.cursor.execute(query, args)
+
+        try:
+            # pg8000 might return lists
+            res = [tuple(t) for t in self.cursor.fetchall()]
+        except Exception:
+            # query returns nothing
+            res = None
+
+        self.query_stats.record(query, time.time() - started,
+                                len(res) if res else 0)
+
+        return res
+
+    def fetch_columns(self, query, *args, **kwargs):
+        """
+        Fetch result of a query as numpy arrays (requires numpy).
+        Queries without parameters whose columns are all fixed-width
+        (integers, floats, bool, date, timestamps) are fetched via binary
+        COPY, otherwise rows are fetched in batches from a server-side
+        cursor.
+
+        Args:
+            query: query to be executed.
+            args: query parameters.
+            batch_size: rows per fetch (keyword only).
+            structured: return a structured array (keyword only).
+            binary: use binary COPY (keyword only, None = see above);
+                the whole result is buffered, rows of variable-width
+                columns or NULLs are decoded in batches of batch_size.
+
+        Returns:
+            An OrderedDict {column: numpy array} or a structured array.
+            NULLs become NaN / NaT, numeric is converted to float64,
+            timestamptz to UTC, unknown types are kept as objects.
+        """
+
+        from .columns import fetch_columns
+        return fetch_columns(self, query, args, **kwargs)
+
+    def copy_from(self, table, data, columns=None, format='text', types=None):
+        """
+        Load data using COPY ... FROM STDIN.
+
+        Args:
+            table: name of a table.
+            data: bytes, binary file or iterable of bytes chunks;
+                rows (tuples) or {column: numpy array} if types are set.
+            columns: list of column names.
+            format: 'text' | 'csv' | 'binary'.
+            types: types of columns (e.g. ['int4', 'text']), data
+                is encoded into binary COPY format (see copycodec).
+
+        Returns:
+            Number of loaded rows.
+        """
+
+        if types is not None:
+            format = 'binary'
+            data = _encode_binary(data, types)
+
+        if isinstance(data, (bytes, bytearray)):
+            data = [data]
+
+        # drivers want file-like objects (at least some versions of them)
+        if not hasattr(data, 'read'):
+            data = _ChunkReader(data)
+
+        query = _copy_query(table, columns, 'from stdin', format)
+
+        # psycopg2 or pg8000?
+        if hasattr(self.cursor, 'copy_expert'):
+            self.cursor.copy_expert(query, data)
+        else:
+            self.cursor.execute(query, stream=data)
+
+        return self.cursor.rowcount
+
+    def copy_to(self,
+                source,
+                output=None,
+                columns=None,
+                format='text',
+                types=None):
+        """
+        Extract data using COPY ... TO STDOUT.
+
+        Args:
+            source: name of a table or a query.
+            output: binary file to be written.
+            columns: list of column names (tables only).
+            format: 'text' | 'csv' | 'binary'.
+            types: types of columns, binary COPY data is decoded
+                into a list of tuples (see copycodec).
+
+        Returns:
+            Contents (bytes) if output is None, else number of rows.
+        """
+
+        if types is not None:
+            if output is not None:
+                raise TestgresException("Can't decode rows into output")
+
+            data = self.copy_to(source, columns=columns, format='binary')
+            return _CopyDecoder(types).rows(data)
+
+        if not _IDENTIFIER_RE.match(source):
+            source = '({})'.format(source)
+
+        query = _copy_query(source, columns, 'to stdout', format)
+        result = output if output is not None else io.BytesIO()
+
+        if hasattr(self.cursor, 'copy_expert'):
+            self.cursor.copy_expert(query, result)
+        else:
+            self.cursor.execute(query, stream=result)
+
+        if output is None:
+            return result.getvalue()
+
+        return self.cursor.rowcount
+
     def close(self):
         self.cursor.close()
         self.connection.close()
+
+
+# table name (possibly qualified), not a query
+_IDENTIFIER_RE = re.compile(r'^[\w."]+$')
+
+_COPY_FORMATS = ('text', 'csv', 'binary')
+
+
+def _copy_query(target, columns, direction, format):
+    if format not in _COPY_FORMATS:
+        raise TestgresException('Unknown COPY format "{}"'.format(format))
+
+    if columns:
+        target = '{} ({})'.format(target, ', '.join(columns))
+
+    return 'copy {} {} with (format {})'.format(target, direction, format)
+
+
+def _encode_binary(data, types, batch_size=10000):
+    """
+    Return a generator of binary COPY chunks of rows or numpy columns.
+    """
+
+    # check types right away, not when the driver starts reading
+    encoder = _CopyEncoder(types)
+
+    def chunks():
+        yield encoder.header()
+
+        if isinstance(data, dict):
+            yield encoder.encode_columns(list(data.values()))
+        else:
+            rows = iter(data)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                yield encoder.encode_rows(batch)
+
+        yield encoder.trailer()
+
+    return chunks()
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Binary file over an iterable of bytes chunks (e.g. a generator).
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not len(self._buf):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buf = memoryview(chunk)
+
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+
+        return n
+
+
+class ConnectionPool(object):
+    """
+    Idle connections of a node, reused by helpers such as explain().
+    """
+
+    def __init__(self, node, max_idle=4):
+        self.node = node
+        self.max_idle = max_idle
+
+        self._lock = threading.Lock()
+        self._idle = {}    # (dbname, username) -> [NodeConnection]
+
+    @contextmanager
+    def connection(self, dbname='postgres', username=None):
+        """
+        Borrow a connection, open transaction is rolled back on return.
+        """
+
+        key = (dbname, username)
+
+        with self._lock:
+            idle = self._idle.get(key)
+            con = idle.pop() if idle else None
+
+        if con is None:
+            con = self.node.connect(dbname, username)
+
+        try:
+            yield con
+            con.rollback()
+        except Exception:
+            # state of connection is unknown
+            close_quietly(con)
+            raise
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(con)
+                con = None
+
+        if con is not None:
+            close_quietly(con)
+
+    def close(self):
+        """
+        Close all idle connections (e.g. before node is stopped).
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for con in connections:
+                close_quietly(con)
+
+
+def close_quietly(con):
+    try:
+        con.close()
+    except Exception:
+        pass
@@ -11,3 +11,19 @@ BACKUP_LOG_FILE = "backup.log"
 
 # default argument value
 DEFAULT_XLOG_METHOD = "fetch"
+
+# names for config files
+PG_CONF_FILE = "postgresql.conf"
+PG_AUTO_CONF_FILE = "postgresql.auto.conf"
+HBA_CONF_FILE = "pg_hba.conf"
+RECOVERY_CONF_FILE = "recovery.conf"
+
+# names of config profiles
+PROFILE_FAST_EPHEMERAL = "fast-ephemeral"
+PROFILE_BENCHMARK = "benchmark"
+PROFILE_DENSE = "dense"
+
+# where to keep node's files
+STORAGE_DISK = "disk"
+STORAGE_MEMORY = "memory"
+STORAGE_MEMORY_WAL = "memory-wal"
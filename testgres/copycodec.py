@@ -0,0 +1,543 @@
+# coding: utf-8
+"""
+Encoder and decoder of PostgreSQL binary COPY format.
+
+Rows of fixed-width types are packed by a single struct per row;
+numpy columns of such types are converted by a structured dtype
+without creating Python objects for each value.
+"""
+
+import datetime
+import decimal
+import re
+import struct
+import uuid
+
+from six import binary_type, integer_types, text_type
+
+from .exceptions import TestgresException
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+TRAILER = struct.pack('!h', -1)
+
+# PostgreSQL counts time from 2000-01-01
+_PG_EPOCH = datetime.datetime(2000, 1, 1)
+_PG_EPOCH_DATE = _PG_EPOCH.date()
+_PG_EPOCH_US = 946684800 * 1000000
+_PG_EPOCH_DAYS = 10957
+
+_NUMERIC_POS = 0x0000
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+_NUMERIC_PINF = 0xD000
+_NUMERIC_NINF = 0xF000
+
+_NUMERIC_HEAD = struct.Struct('!hhHh')
+_FIELD_SIZE = struct.Struct('!i')
+_FIELD_COUNT = struct.Struct('!h')
+
+
+class _UTC(datetime.tzinfo):
+    def utcoffset(self, dt):
+        return datetime.timedelta(0)
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return 'UTC'
+
+
+UTC = _UTC()
+
+
+def _micros(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _timestamp_to_wire(value):
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return _micros(value - _PG_EPOCH)
+
+
+def _timestamp_from_wire(value):
+    return _PG_EPOCH + datetime.timedelta(microseconds=value)
+
+
+def _timestamptz_from_wire(value):
+    return _timestamp_from_wire(value).replace(tzinfo=UTC)
+
+
+def _date_to_wire(value):
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return (value - _PG_EPOCH_DATE).days
+
+
+def _date_from_wire(value):
+    return _PG_EPOCH_DATE + datetime.timedelta(days=value)
+
+
+def _encode_text(value):
+    if isinstance(value, binary_type):
+        return value
+    return text_type(value).encode('utf-8')
+
+
+def _decode_bytea(buf):
+    # bytes(memoryview) is its repr on Python 2
+    return buf.tobytes()
+
+
+def _decode_text(buf):
+    return buf.tobytes().decode('utf-8')
+
+
+def _encode_uuid(value):
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(value)
+    return value.bytes
+
+
+def _decode_uuid(buf):
+    return uuid.UUID(bytes=buf.tobytes())
+
+
+def _encode_numeric(value):
+    if not isinstance(value, decimal.Decimal):
+        # repr() gives the shortest exact form of a float
+        value = decimal.Decimal(repr(value) if isinstance(value, float)
+                                else value)
+
+    if value.is_nan():
+        return _NUMERIC_HEAD.pack(0, 0, _NUMERIC_NAN, 0)
+    if value.is_infinite():
+        sign = _NUMERIC_NINF if value < 0 else _NUMERIC_PINF
+        return _NUMERIC_HEAD.pack(0, 0, sign, 0)
+
+    sign, digits, exp = value.as_tuple()
+    s = ''.join(str(d) for d in digits)
+
+    if exp >= 0:
+        int_s, frac_s = s + '0' * exp, ''
+    else:
+        s = s.rjust(-exp + 1, '0')
+        int_s, frac_s = s[:exp], s[exp:]
+
+    dscale = len(frac_s)
+
+    # digits are stored in base 10000 groups around decimal point
+    int_s = int_s.lstrip('0')
+    int_s = int_s.rjust((len(int_s) + 3) // 4 * 4, '0')
+    frac_s = frac_s.ljust((len(frac_s) + 3) // 4 * 4, '0')
+
+    groups = [int(int_s[i:i + 4]) for i in range(0, len(int_s), 4)] + \
+        [int(frac_s[i:i + 4]) for i in range(0, len(frac_s), 4)]
+    weight = len(int_s) // 4 - 1
+
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    head = _NUMERIC_HEAD.pack(len(groups), weight,
+                              _NUMERIC_NEG if sign else _NUMERIC_POS, dscale)
+    return head + struct.pack('!{}h'.format(len(groups)), *groups)
+
+
+def _decode_numeric(buf):
+    ndigits, weight, sign, dscale = _NUMERIC_HEAD.unpack_from(buf)
+
+    if sign == _NUMERIC_NAN:
+        return decimal.Decimal('NaN')
+    if sign == _NUMERIC_PINF:
+        return decimal.Decimal('Infinity')
+    if sign == _NUMERIC_NINF:
+        return decimal.Decimal('-Infinity')
+
+    value = 0
+    for d in struct.unpack_from('!{}h'.format(ndigits), buf, 8):
+        value = value * 10000 + d
+
+    with decimal.localcontext() as ctx:
+        # trailing zero groups are not stored, e.g. 1E+30 has one digit
+        ctx.prec = max(max(ndigits, weight + 1) * 4 + dscale + 4, 28)
+
+        result = decimal.Decimal(value).scaleb(4 * (weight - ndigits + 1))
+        result = result.quantize(decimal.Decimal(1).scaleb(-dscale))
+
+    # copy_negate() keeps all digits, unary minus rounds to context
+    return result.copy_negate() if sign == _NUMERIC_NEG else result
+
+
+class CopyType(object):
+    """
+    Binary representation of a PostgreSQL type.
+
+    Fixed-width types have a struct code (and converters of values),
+    variable-width ones have encode() and decode() functions.
+    """
+
+    def __init__(self,
+                 name,
+                 oid,
+                 code=None,
+                 dtype=None,
+                 to_wire=None,
+                 from_wire=None,
+                 encode=None,
+                 decode=None):
+        self.name = name
+        self.oid = oid
+        self.code = code
+        self.dtype = dtype    # numpy dtype of values
+        self.to_wire = to_wire
+        self.from_wire = from_wire
+        self.encode = encode
+        self.decode = decode
+        self.size = struct.calcsize('!' + code) if code else None
+
+    def __repr__(self):
+        return '<CopyType {}>'.format(self.name)
+
+    @property
+    def fixed(self):
+        return self.code is not None
+
+
+# yapf: disable
+_TYPES = [
+    CopyType('bool', 16, '?', 'bool'),
+    CopyType('bytea', 17, encode=bytes, decode=_decode_bytea),
+    CopyType('int8', 20, 'q', 'int64'),
+    CopyType('int2', 21, 'h', 'int16'),
+    CopyType('int4', 23, 'i', 'int32'),
+    CopyType('text', 25, encode=_encode_text, decode=_decode_text),
+    CopyType('float4', 700, 'f', 'float32'),
+    CopyType('float8', 701, 'd', 'float64'),
+    CopyType('varchar', 1043, encode=_encode_text, decode=_decode_text),
+    CopyType('date', 1082, 'i', 'datetime64[D]',
+             _date_to_wire, _date_from_wire),
+    CopyType('timestamp', 1114, 'q', 'datetime64[us]',
+             _timestamp_to_wire, _timestamp_from_wire),
+    CopyType('timestamptz', 1184, 'q', 'datetime64[us]',
+             _timestamp_to_wire, _timestamptz_from_wire),
+    CopyType('numeric', 1700, encode=_encode_numeric,
+             decode=_decode_numeric),
+    CopyType('uuid', 2950, encode=_encode_uuid, decode=_decode_uuid),
+]
+
+_ALIASES = {
+    'boolean': 'bool',
+    'bigint': 'int8',
+    'bigserial': 'int8',
+    'smallint': 'int2',
+    'int': 'int4',
+    'integer': 'int4',
+    'serial': 'int4',
+    'real': 'float4',
+    'double precision': 'float8',
+    'decimal': 'numeric',
+    'character varying': 'varchar',
+    'timestamp without time zone': 'timestamp',
+    'timestamp with time zone': 'timestamptz',
+}
+
+_BY_NAME = dict((t.name, t) for t in _TYPES)
+_BY_OID = dict((t.oid, t) for t in _TYPES)
+
+# e.g. numeric(10, 2) or varchar(20)
+_MODIFIERS_RE = re.compile(r'\(.*?\)')
+
+
+def get_type(type_):
+    """
+    Find CopyType by OID or SQL name (e.g. 23, 'integer', 'numeric(10,2)').
+    """
+
+    if isinstance(type_, CopyType):
+        return type_
+
+    if isinstance(type_, integer_types):
+        result = _BY_OID.get(type_)
+    else:
+        name = ' '.join(_MODIFIERS_RE.sub('', type_).lower().split())
+        result = _BY_NAME.get(_ALIASES.get(name, name))
+
+    if result is None:
+        raise TestgresException('Unsupported type {!r}'.format(type_))
+
+    return result
+
+
+def is_supported(type_):
+    try:
+        get_type(type_)
+        return True
+    except TestgresException:
+        return False
+
+
+def _fixed_dtype(types):
+    """
+    numpy dtype of a tuple which contains only fixed-width values.
+    """
+
+    fields = [('n', '>i2')]
+    for i, t in enumerate(types):
+        fields.append(('l{}'.format(i), '>i4'))
+        fields.append(('v{}'.format(i), '>' + t.code))
+
+    return np.dtype(fields)
+
+
+class CopyEncoder(object):
+    """
+    Encoder of rows (or numpy columns) of given types.
+
+    >>> enc = CopyEncoder(['int4', 'text'])
+    >>> data = enc.header() + enc.encode_rows([(1, 'a')]) + enc.trailer()
+    """
+
+    def __init__(self, types):
+        self.types = [get_type(t) for t in types]
+
+        self._fixed = all(t.fixed for t in self.types)
+        if self._fixed:
+            fmt = '!h' + ''.join('i' + t.code for t in self.types)
+            self._row = struct.Struct(fmt)
+
+    @staticmethod
+    def header():
+        return HEADER
+
+    @staticmethod
+    def trailer():
+        return TRAILER
+
+    def _encode_field(self, t, value, parts):
+        if value is None:
+            parts.append(_FIELD_SIZE.pack(-1))
+        elif t.fixed:
+            if t.to_wire is not None:
+                value = t.to_wire(value)
+            parts.append(struct.pack('!i' + t.code, t.size, value))
+        else:
+            data = t.encode(value)
+            parts.append(_FIELD_SIZE.pack(len(data)))
+            parts.append(data)
+
+    def encode_rows(self, rows):
+        """
+        Encode tuples (without header and trailer).
+        """
+
+        count = _FIELD_COUNT.pack(len(self.types))
+        types = self.types
+        parts = []
+
+        for row in rows:
+            # fast path: one struct for the whole row
+            if self._fixed and None not in row:
+                values = [len(types)]
+                for t, value in zip(types, row):
+                    if t.to_wire is not None:
+                        value = t.to_wire(value)
+                    values.append(t.size)
+                    values.append(value)
+                parts.append(self._row.pack(*values))
+                continue
+
+            parts.append(count)
+            for t, value in zip(types, row):
+                self._encode_field(t, value, parts)
+
+        return b''.join(parts)
+
+    def encode_columns(self, columns, masks=None):
+        """
+        Encode numpy arrays (without header and trailer).
+
+        Args:
+            columns: list of numpy arrays of the same length.
+            masks: list of boolean arrays of NULLs (or Nones).
+        """
+
+        if np is None:
+            raise TestgresException('numpy is required to encode columns')
+
+        masks = masks or [None] * len(columns)
+        has_nulls = any(m is not None and m.any() for m in masks)
+
+        if self._fixed and not has_nulls and \
+                not any(_has_nat(c) for c in columns):
+            size = len(columns[0]) if columns else 0
+            tuples = np.empty(size, dtype=_fixed_dtype(self.types))
+            tuples['n'] = len(self.types)
+
+            for i, (t, values) in enumerate(zip(self.types, columns)):
+                tuples['l{}'.format(i)] = t.size
+                tuples['v{}'.format(i)] = _to_wire_array(t, values)
+
+            return tuples.tobytes()
+
+        # slow path: Python values, NULLs
+        lists = []
+        for values, mask in zip(columns, masks):
+            values = values.tolist()
+            if mask is not None:
+                for i in np.flatnonzero(mask).tolist():
+                    values[i] = None
+            lists.append(values)
+
+        return self.encode_rows(zip(*lists))
+
+
+def _has_nat(values):
+    return values.dtype.kind == 'M' and np.isnat(values).any()
+
+
+def _to_wire_array(t, values):
+    if t.name in ('timestamp', 'timestamptz'):
+        return values.astype('datetime64[us]').astype(np.int64) - \
+            _PG_EPOCH_US
+    if t.name == 'date':
+        return values.astype('datetime64[D]').astype(np.int64) - \
+            _PG_EPOCH_DAYS
+
+    return values
+
+
+def _from_wire_array(t, values):
+    if t.name in ('timestamp', 'timestamptz'):
+        return (values.astype(np.int64) + _PG_EPOCH_US).astype(t.dtype)
+    if t.name == 'date':
+        return (values.astype(np.int64) + _PG_EPOCH_DAYS).astype(t.dtype)
+
+    # native byte order
+    return values.astype(t.dtype)
+
+
+class CopyDecoder(object):
+    """
+    Decoder of binary COPY data (bytes, bytearray or memoryview).
+    """
+
+    def __init__(self, types):
+        self.types = [get_type(t) for t in types]
+
+    def _body(self, data):
+        buf = memoryview(data)
+
+        if buf[:11].tobytes() != HEADER[:11]:
+            raise TestgresException('Invalid binary COPY header')
+
+        # skip flags and header extension
+        ext, = _FIELD_SIZE.unpack_from(buf, 15)
+        return buf, 19 + ext
+
+    def rows(self, data):
+        """
+        Decode all tuples into a list of Python tuples.
+        """
+
+        result = []
+        for batch in self.iter_rows(data):
+            result.extend(batch)
+
+        return result
+
+    def iter_rows(self, data, batch_size=None):
+        """
+        Yield lists of at most batch_size Python tuples (all if None),
+        so that only a batch of objects exists at a time.
+        """
+
+        buf, pos = self._body(data)
+        types = self.types
+        result = []
+
+        while True:
+            count, = _FIELD_COUNT.unpack_from(buf, pos)
+            pos += 2
+            if count == -1:
+                break
+
+            if count != len(types):
+                raise TestgresException(
+                    'Expected {} fields, got {}'.format(len(types), count))
+
+            row = []
+            for t in types:
+                size, = _FIELD_SIZE.unpack_from(buf, pos)
+                pos += 4
+
+                if size == -1:
+                    row.append(None)
+                    continue
+
+                if t.fixed:
+                    value, = struct.unpack_from('!' + t.code, buf, pos)
+                    if t.from_wire is not None:
+                        value = t.from_wire(value)
+                else:
+                    value = t.decode(buf[pos:pos + size])
+
+                row.append(value)
+                pos += size
+
+            result.append(tuple(row))
+
+            if batch_size and len(result) >= batch_size:
+                yield result
+                result = []
+
+        if result:
+            yield result
+
+    def arrays(self, data):
+        """
+        Decode columns of fixed-width types into numpy arrays
+        directly from the buffer.
+
+        Returns:
+            A list of numpy arrays, or None if some types are
+            variable-width or there are NULLs (use rows() then).
+        """
+
+        if np is None:
+            raise TestgresException('numpy is required to decode columns')
+
+        if not all(t.fixed for t in self.types):
+            return None
+
+        buf, pos = self._body(data)
+        dtype = _fixed_dtype(self.types)
+
+        body = len(buf) - pos - len(TRAILER)
+        if body < 0 or body % dtype.itemsize:
+            return None
+
+        tuples = np.frombuffer(buf, dtype=dtype, count=body // dtype.itemsize,
+                               offset=pos)
+
+        # NULLs would have shifted tuples and their sizes
+        if (tuples['n'] != len(self.types)).any():
+            return None
+        for i, t in enumerate(self.types):
+            if (tuples['l{}'.format(i)] != t.size).any():
+                return None
+
+        return [
+            _from_wire_array(t, tuples['v{}'.format(i)])
+            for i, t in enumerate(self.types)
+        ]
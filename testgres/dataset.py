@@ -0,0 +1,410 @@
+# coding: utf-8
+"""
+Synthetic datasets generated by numpy in chunks and loaded via COPY.
+
+>>> ds = Dataset('orders', seed=42)
+>>> ds.column('id', 'bigint', Sequence())
+>>> ds.column('customer', 'int', Zipf(10000, s=1.2))
+>>> ds.column('amount', 'numeric', Normal(100, 15, decimals=2))
+>>> ds.column('status', 'text', Categorical(['new', 'paid'], [0.2, 0.8]))
+>>> ds.load(node, rows=10**7, connections=4, create=True)
+"""
+
+from __future__ import division
+
+import functools
+import numbers
+import random
+
+from collections import OrderedDict
+
+from .copycodec import CopyEncoder as _CopyEncoder
+from .exceptions import TestgresException
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_CHUNK_SIZE = 100000
+
+# NULL and characters which have to be escaped in COPY text format
+_TEXT_NULL = '\\N'
+_TEXT_ESCAPES = {
+    ord('\\'): u'\\\\',
+    ord('\t'): u'\\t',
+    ord('\n'): u'\\n',
+    ord('\r'): u'\\r',
+}
+
+
+def _require_numpy():
+    # numpy.random.Generator has appeared in 1.17 (Python 3 only)
+    if np is None or not hasattr(np.random, 'default_rng'):
+        raise TestgresException(
+            'numpy >= 1.17 is required to generate datasets')
+
+
+def _escape(value):
+    return u'{}'.format(value).translate(_TEXT_ESCAPES)
+
+
+class Distribution(object):
+    """
+    Base class of column generators.
+    """
+
+    def generate(self, rng, size, offset, columns):
+        """
+        Return a numpy array of size values.
+
+        Args:
+            rng: numpy.random.Generator of this chunk.
+            size: number of rows.
+            offset: number of the first row (0-based).
+            columns: arrays of previous columns {name: array}.
+        """
+
+        raise NotImplementedError()
+
+
+class Sequence(Distribution):
+    """
+    Consecutive numbers (e.g. primary keys): start, start + step, ...
+    """
+
+    def __init__(self, start=1, step=1):
+        self.start = start
+        self.step = step
+
+    def generate(self, rng, size, offset, columns):
+        first = self.start + offset * self.step
+        return np.arange(size, dtype=np.int64) * self.step + first
+
+
+class Uniform(Distribution):
+    """
+    Uniform values in [low, high] (integers if both are integers).
+    """
+
+    def __init__(self, low, high, decimals=None):
+        self.low = low
+        self.high = high
+        self.decimals = decimals
+
+    def generate(self, rng, size, offset, columns):
+        if isinstance(self.low, numbers.Integral) and \
+                isinstance(self.high, numbers.Integral):
+            return rng.integers(self.low, self.high, size, endpoint=True)
+
+        values = rng.uniform(self.low, self.high, size)
+        if self.decimals is not None:
+            values = np.round(values, self.decimals)
+
+        return values
+
+
+class Normal(Distribution):
+    """
+    Normally distributed floats.
+    """
+
+    def __init__(self, mean, stddev, decimals=None):
+        self.mean = mean
+        self.stddev = stddev
+        self.decimals = decimals
+
+    def generate(self, rng, size, offset, columns):
+        values = rng.normal(self.mean, self.stddev, size)
+        if self.decimals is not None:
+            values = np.round(values, self.decimals)
+
+        return values
+
+
+class Zipf(Distribution):
+    """
+    Integers in [1, n], value k has probability proportional to 1 / k^s
+    (a few 'hot' values, long tail).
+    """
+
+    def __init__(self, n, s=1.0):
+        self.n = n
+        self.s = s
+        self._cdf = None
+
+    def generate(self, rng, size, offset, columns):
+        if self._cdf is None:
+            weights = 1.0 / np.power(np.arange(1, self.n + 1), self.s)
+            cdf = np.cumsum(weights)
+            self._cdf = cdf / cdf[-1]
+
+        idx = np.searchsorted(self._cdf, rng.random(size), side='right')
+        return np.minimum(idx, self.n - 1).astype(np.int64) + 1
+
+
+class Categorical(Distribution):
+    """
+    Values from a list, optionally with weights.
+    """
+
+    def __init__(self, values, weights=None):
+        self.values = list(values)
+        self.weights = weights
+
+    def generate(self, rng, size, offset, columns):
+        p = None
+        if self.weights is not None:
+            p = np.asarray(self.weights, dtype=float)
+            p = p / p.sum()
+
+        idx = rng.choice(len(self.values), size, p=p)
+
+        values = np.empty(len(self.values), dtype=object)
+        values[:] = self.values
+
+        return values[idx]
+
+
+class Text(Distribution):
+    """
+    Random lowercase strings of a given length.
+    """
+
+    def __init__(self, length=10):
+        self.length = length
+
+    def generate(self, rng, size, offset, columns):
+        codes = rng.integers(ord('a'), ord('z'), (size, self.length),
+                             dtype=np.uint8, endpoint=True)
+        return codes.view('S{}'.format(self.length)).ravel()
+
+
+class Timestamp(Distribution):
+    """
+    Uniform timestamps between start and end (ISO strings or datetimes).
+    """
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def generate(self, rng, size, offset, columns):
+        start = np.datetime64(self.start, 'us').astype(np.int64)
+        end = np.datetime64(self.end, 'us').astype(np.int64)
+        values = rng.integers(start, end, size, endpoint=True)
+        return values.astype('datetime64[us]')
+
+
+class Correlated(Distribution):
+    """
+    Function of another (previously defined) column plus optional noise.
+
+    >>> Correlated('amount', lambda a: a * 1.2, noise=Normal(0, 1))
+    """
+
+    def __init__(self, column, func, noise=None):
+        self.column = column
+        self.func = func
+        self.noise = noise
+
+    def generate(self, rng, size, offset, columns):
+        if self.column not in columns:
+            raise TestgresException(
+                'Column "{}" should be defined first'.format(self.column))
+
+        values = self.func(columns[self.column])
+        if self.noise is not None:
+            values = values + self.noise.generate(rng, size, offset, columns)
+
+        return values
+
+
+def _to_text(values):
+    """
+    Convert a column into a list of strings in COPY text format.
+    """
+
+    kind = values.dtype.kind
+
+    if kind == 'b':
+        return np.where(values, 't', 'f').tolist()
+
+    if kind == 'M':
+        return np.datetime_as_string(values, unit='us').tolist()
+
+    # random letters (see Text) need no escaping
+    if kind in 'iufS':
+        return values.astype('U').tolist()
+
+    # strings are often repeated (e.g. categories)
+    cache = {}
+    result = []
+    for v in values.tolist():
+        text = cache.get(v)
+        if text is None:
+            text = cache[v] = _escape(v) if v is not None else _TEXT_NULL
+        result.append(text)
+
+    return result
+
+
+class Dataset(object):
+    """
+    Schema of a table and distributions of its columns.
+    Each chunk is generated by its own generator seeded with
+    (seed, chunk number), so data doesn't depend on parallelism.
+    """
+
+    def __init__(self, table, seed=None):
+        """
+        Create an empty dataset.
+
+        Args:
+            table: name of a table.
+            seed: integer seed (random if None, see self.seed).
+        """
+
+        _require_numpy()
+
+        self.table = table
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.columns = OrderedDict()    # name -> (type, distribution, nulls)
+
+    def column(self, name, sql_type, distribution, nulls=0.0):
+        """
+        Add a column.
+
+        Args:
+            name: name of the column.
+            sql_type: SQL type (e.g. 'bigint').
+            distribution: an instance of Distribution.
+            nulls: fraction of NULLs.
+
+        Returns:
+            This instance of Dataset.
+        """
+
+        self.columns[name] = (sql_type, distribution, nulls)
+        return self
+
+    def create_table_sql(self, unlogged=False):
+        columns = ', '.join('{} {}'.format(name, sql_type)
+                            for name, (sql_type, _, _) in self.columns.items())
+
+        kind = 'unlogged table' if unlogged else 'table'
+        return 'create {} {} ({})'.format(kind, self.table, columns)
+
+    def generate(self, offset, size, chunk=0):
+        """
+        Generate a chunk of rows.
+
+        Returns:
+            An OrderedDict {column: numpy array}, NULLs are
+            returned separately as {column: boolean mask}.
+        """
+
+        rng = np.random.default_rng([self.seed, chunk])
+
+        arrays = OrderedDict()
+        masks = OrderedDict()
+
+        for name, (_, distribution, nulls) in self.columns.items():
+            arrays[name] = distribution.generate(rng, size, offset, arrays)
+
+            if nulls:
+                masks[name] = rng.random(size) < nulls
+
+        return arrays, masks
+
+    def encode(self, arrays, masks=None, format='text'):
+        """
+        Encode a chunk into COPY format ('text' or 'binary').
+        """
+
+        if format == 'binary':
+            types = [sql_type for sql_type, _, _ in self.columns.values()]
+            masks = [(masks or {}).get(name) for name in arrays]
+
+            encoder = _CopyEncoder(types)
+            return encoder.header() + \
+                encoder.encode_columns(list(arrays.values()), masks) + \
+                encoder.trailer()
+
+        if format != 'text':
+            raise TestgresException('Unsupported format "{}"'.format(format))
+
+        columns = []
+        for name, values in arrays.items():
+            text = _to_text(values)
+
+            mask = (masks or {}).get(name)
+            if mask is not None:
+                for i in np.flatnonzero(mask).tolist():
+                    text[i] = _TEXT_NULL
+
+            columns.append(text)
+
+        lines = u'\n'.join(u'\t'.join(row) for row in zip(*columns))
+        return (lines + u'\n').encode('utf-8') if lines else b''
+
+    def chunks(self, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yield (chunk number, offset, size) for a given number of rows.
+        """
+
+        for chunk, offset in enumerate(range(0, rows, chunk_size)):
+            yield chunk, offset, min(chunk_size, rows - offset)
+
+    def _encoded_chunk(self, chunk, offset, size, format):
+        arrays, masks = self.generate(offset, size, chunk)
+        return self.encode(arrays, masks, format)
+
+    def load(self,
+             node,
+             rows,
+             connections=1,
+             chunk_size=DEFAULT_CHUNK_SIZE,
+             create=False,
+             unlogged=False,
+             post_load=None,
+             analyze=False,
+             dbname='postgres',
+             username=None,
+             format='text'):
+        """
+        Generate rows and stream them into a table (see bulk_load()).
+
+        Args:
+            node: PostgresNode.
+            rows: total number of rows.
+            connections: number of parallel COPY streams.
+            chunk_size: rows per chunk (and per COPY).
+            create: create the table first.
+            unlogged: create an unlogged table.
+            post_load: statements to be run after the load.
+            analyze: ANALYZE the table afterwards.
+            dbname: database name to connect to.
+            username: database user name.
+            format: COPY format.
+
+        Returns:
+            A LoadResult.
+        """
+
+        if create:
+            node.execute(dbname, self.create_table_sql(unlogged), username)
+
+        # chunks are generated by workers, not under the lock
+        tasks = (functools.partial(self._encoded_chunk, *item, format=format)
+                 for item in self.chunks(rows, chunk_size))
+
+        return node.bulk_load(self.table,
+                              tasks,
+                              connections=connections,
+                              columns=list(self.columns),
+                              format=format,
+                              post_load=post_load,
+                              analyze=analyze,
+                              dbname=dbname,
+                              username=username)
@@ -0,0 +1,195 @@
+# coding: utf-8
+
+from __future__ import division
+
+import math
+
+# 2^7 sub-buckets per power of two: relative error is less than 1%
+DEFAULT_PRECISION = 7
+
+
+class LatencyHistogram(object):
+    """
+    Compact log-bucketed (HDR-style) histogram of latencies.
+
+    Values are non-negative integers (microseconds by convention).
+    Small values are stored exactly, larger ones are grouped into
+    buckets whose width grows with magnitude, so relative error
+    stays below 2^-(precision-1). Histograms are cheap to merge.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        """
+        Create an empty histogram.
+
+        Args:
+            precision: number of significant bits to be kept.
+        """
+
+        self.precision = precision
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+
+        # bucket index -> count
+        self.buckets = {}
+
+        # cached constants
+        self._sub = 1 << precision
+        self._half = self._sub >> 1
+
+    def __len__(self):
+        return self.count
+
+    def __add__(self, other):
+        result = LatencyHistogram(self.precision)
+        result.merge(self)
+        result.merge(other)
+        return result
+
+    def __repr__(self):
+        return '<LatencyHistogram count={} p50={} p99={} max={}>'.format(
+            self.count, self.percentile(50), self.percentile(99), self.max)
+
+    def _index(self, value):
+        if value < self._sub:
+            return value
+
+        shift = value.bit_length() - self.precision
+        return self._sub + (shift - 1) * self._half + \
+            (value >> shift) - self._half
+
+    def _bounds(self, index):
+        """
+        Return [lower, upper] values of a bucket.
+        """
+
+        if index < self._sub:
+            return index, index
+
+        shift = (index - self._sub) // self._half + 1
+        lower = ((index - self._sub) % self._half + self._half) << shift
+
+        return lower, lower + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        """
+        Add a value (several times if count > 1).
+        """
+
+        value = int(value)
+        if value < 0:
+            value = 0
+
+        idx = self._index(value)
+        self.buckets[idx] = self.buckets.get(idx, 0) + count
+
+        self.count += count
+        self.total += value * count
+        self.total_sq += value * value * count
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+        return self
+
+    def merge(self, other):
+        """
+        Add all values of another histogram (same precision).
+        """
+
+        if other.precision != self.precision:
+            raise ValueError('Histograms have different precision')
+
+        for idx, count in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+
+        if other.min is not None:
+            self.min = other.min if self.min is None \
+                else min(self.min, other.min)
+            self.max = other.max if self.max is None \
+                else max(self.max, other.max)
+
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+
+        mean = self.total / self.count
+        variance = max(self.total_sq / self.count - mean * mean, 0)
+        return math.sqrt(variance)
+
+    def percentile(self, p):
+        """
+        Return approximate value of p-th percentile (0..100).
+        """
+
+        if not self.count:
+            return None
+
+        # rank of the value we're looking for
+        rank = max(int(math.ceil(p / 100 * self.count)), 1)
+
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                lower, upper = self._bounds(idx)
+
+                # middle of the bucket, but within observed range
+                value = (lower + upper) // 2
+                return max(self.min, min(value, self.max))
+
+        return self.max
+
+    def percentiles(self, ps=(50, 95, 99, 99.9)):
+        """
+        Return a dict of {p: value}.
+        """
+
+        return dict((p, self.percentile(p)) for p in ps)
+
+    def to_dict(self):
+        """
+        Convert to a JSON-friendly dict.
+        """
+
+        return {
+            'precision': self.precision,
+            'count': self.count,
+            'total': self.total,
+            'total_sq': self.total_sq,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict((str(k), v) for k, v in self.buckets.items())
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a histogram from to_dict()'s output.
+        """
+
+        hist = cls(data['precision'])
+        hist.count = data['count']
+        hist.total = data['total']
+        hist.total_sq = data['total_sq']
+        hist.min = data['min']
+        hist.max = data['max']
+        hist.buckets = dict((int(k), v) for k, v in data['buckets'].items())
+
+        return hist
@@ -0,0 +1,273 @@
+# coding: utf-8
+"""
+Parallel bulk loading via several COPY streams.
+"""
+
+from __future__ import division
+
+import io
+import mmap
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from six import string_types
+
+from .exceptions import TestgresException
+
+
+def split_lines(buf, parts, skip_header=False):
+    """
+    Split a buffer (bytes or mmap) into ranges which end at line breaks.
+
+    Args:
+        buf: bytes-like object which supports find().
+        parts: desired number of ranges.
+        skip_header: skip the first line (e.g. CSV header).
+
+    Returns:
+        A list of (start, end) offsets (might be shorter than parts).
+    """
+
+    size = len(buf)
+    start = 0
+
+    if skip_header:
+        nl = buf.find(b'\n')
+        start = nl + 1 if nl >= 0 else size
+
+    bounds = [start]
+    for i in range(1, parts):
+        pos = max(start + (size - start) * i // parts, bounds[-1])
+
+        # move to the beginning of the next line
+        nl = buf.find(b'\n', pos)
+        bounds.append(nl + 1 if nl >= 0 else size)
+
+    bounds.append(size)
+
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+class _RangeReader(io.RawIOBase):
+    """
+    Binary file over a range of mmap, data isn't copied into bytes.
+    """
+
+    def __init__(self, mm, start, end):
+        try:
+            self._view = memoryview(mm)[start:end]
+        except TypeError:
+            # Python 2: mmap supports only the old buffer interface
+            self._view = buffer(mm, start, end - start)    # noqa: F821
+        self._pos = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        # mmap can't be closed while there are views
+        if hasattr(self._view, 'release'):
+            self._view.release()
+        super(_RangeReader, self).close()
+
+
+class WorkerStats(object):
+    """
+    Statistics of a loading connection.
+    """
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.tasks = 0
+        self.rows = 0
+        self.bytes = 0
+        self.duration = 0.0    # busy time (seconds)
+
+    def __repr__(self):
+        return '<WorkerStats {} rows={} rows/s={:.0f}>'.format(
+            self.worker, self.rows, self.rows_per_sec)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.duration if self.duration else 0.0
+
+
+class LoadResult(object):
+    """
+    Results of bulk_load().
+
+    Attributes:
+        workers: list of WorkerStats.
+        duration: time of COPY stage (seconds).
+        post_load: {statement: seconds} (indexes, constraints, ANALYZE).
+    """
+
+    def __init__(self, workers, duration):
+        self.workers = workers
+        self.duration = duration
+        self.post_load = OrderedDict()
+
+    def __repr__(self):
+        return '<LoadResult rows={} rows/s={:.0f} workers={}>'.format(
+            self.rows, self.rows_per_sec, len(self.workers))
+
+    @property
+    def rows(self):
+        return sum(w.rows for w in self.workers)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.duration if self.duration else 0.0
+
+
+def run_parallel(node, tasks, func, connections, dbname, username):
+    """
+    Call func(con, task, stats) for each task using several connections.
+
+    Returns:
+        A list of WorkerStats.
+    """
+
+    tasks = iter(tasks)
+    lock = threading.Lock()
+    errors = []
+    stats = [WorkerStats(i) for i in range(connections)]
+
+    def worker(worker_stats):
+        try:
+            with node.connect(dbname, username) as con:
+                while True:
+                    with lock:
+                        if errors:
+                            break
+                        task = next(tasks, None)
+
+                    if task is None:
+                        break
+
+                    started = time.time()
+                    func(con, task, worker_stats)
+                    worker_stats.duration += time.time() - started
+                    worker_stats.tasks += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(s, )) for s in stats]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise errors[0]
+
+    return stats
+
+
+def _run_statements(node, statements, connections, dbname, username):
+    durations = OrderedDict()
+
+    def execute(con, query, stats):
+        started = time.time()
+        con.execute(query)
+        con.commit()
+        durations[query] = time.time() - started
+
+    run_parallel(node, statements, execute,
+                 min(connections, len(statements)) or 1, dbname, username)
+
+    # keep original order
+    return OrderedDict((q, durations[q]) for q in statements)
+
+
+def bulk_load(node,
+              table,
+              source,
+              connections=4,
+              columns=None,
+              format='text',
+              header=False,
+              post_load=None,
+              analyze=True,
+              dbname='postgres',
+              username=None):
+    """
+    Load data into a table using several COPY streams at once.
+    See PostgresNode.bulk_load().
+    """
+
+    def copy(con, task, stats):
+        data = task() if callable(task) else task
+
+        try:
+            rows = con.copy_from(table, data, columns=columns, format=format)
+            con.commit()
+        finally:
+            if isinstance(data, _RangeReader):
+                stats.bytes += len(data)
+                data.close()
+
+        if isinstance(data, (bytes, bytearray)):
+            stats.bytes += len(data)
+
+        # some drivers don't report number of rows
+        if rows and rows > 0:
+            stats.rows += rows
+
+    started = time.time()
+
+    if isinstance(source, string_types):
+        # files are split at line breaks
+        if format == 'binary':
+            raise TestgresException("Binary files can't be loaded in parallel")
+
+        with io.open(source, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+
+            mm = None
+            tasks = []
+            if size > 0:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                ranges = split_lines(mm, connections, skip_header=header)
+                tasks = [_range_task(mm, a, b) for a, b in ranges]
+
+            try:
+                workers = run_parallel(node, tasks, copy, connections,
+                                       dbname, username)
+            finally:
+                if mm is not None:
+                    mm.close()
+    else:
+        workers = run_parallel(node, source, copy, connections, dbname,
+                               username)
+
+    result = LoadResult(workers, time.time() - started)
+
+    if post_load:
+        result.post_load.update(
+            _run_statements(node, list(post_load), connections, dbname,
+                            username))
+
+    if analyze:
+        tables = [table] if analyze is True else list(analyze)
+        result.post_load.update(
+            _run_statements(node, ['analyze {}'.format(t) for t in tables],
+                            connections, dbname, username))
+
+    return result
+
+
+def _range_task(mm, start, end):
+    return lambda: _RangeReader(mm, start, end)
@@ -0,0 +1,236 @@
+# coding: utf-8
+"""
+Timings of node operations and utilities.
+
+Nothing is collected unless TestgresConfig.collect_metrics is set
+or there's at least one hook (see add_hook()).
+"""
+
+from __future__ import division
+
+import functools
+import threading
+import time
+
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+from .config import TestgresConfig
+
+CATEGORY_NODE = 'node'
+CATEGORY_UTILITY = 'utility'
+
+OperationRecord = namedtuple('OperationRecord', [
+    'operation',      # e.g. 'start' or 'pg_ctl'
+    'category',       # 'node' | 'utility'
+    'node',           # name of the node (or None)
+    'thread',         # name of the thread
+    'started',        # unix timestamp
+    'duration',       # seconds
+    'exit_code',      # utilities only
+    'output_size',    # utilities only
+    'error'           # name of exception (or None)
+])
+
+# callbacks which receive each OperationRecord
+_hooks = []
+
+# nodes whose operations are in progress (per thread)
+_local = threading.local()
+
+
+def add_hook(callback):
+    """
+    Call callback(record) after each operation (see OperationRecord).
+    """
+
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    """
+    Remove a callback registered by add_hook().
+    """
+
+    _hooks.remove(callback)
+
+
+def metrics_enabled():
+    return TestgresConfig.collect_metrics or bool(_hooks)
+
+
+def current_node():
+    """
+    Return the node whose operation is in progress in this thread.
+    """
+
+    stack = getattr(_local, 'nodes', None)
+    return stack[-1] if stack else None
+
+
+class OperationStats(object):
+    """
+    Aggregated timings of an operation.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.errors = 0
+        self.output_bytes = 0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def add(self, record):
+        self.count += 1
+        self.total += record.duration
+        self.output_bytes += record.output_size or 0
+
+        if record.error is not None:
+            self.errors += 1
+
+        if self.min is None or record.duration < self.min:
+            self.min = record.duration
+        if self.max is None or record.duration > self.max:
+            self.max = record.duration
+
+    def to_dict(self):
+        return OrderedDict([
+            ('count', self.count),
+            ('total', self.total),
+            ('mean', self.mean),
+            ('min', self.min),
+            ('max', self.max),
+            ('errors', self.errors),
+            ('output_bytes', self.output_bytes),
+        ])
+
+
+class MetricsRegistry(object):
+    """
+    Thread-safe collection of OperationStats.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+
+    def add(self, record):
+        with self._lock:
+            stats = self._stats.get(record.operation)
+            if stats is None:
+                stats = self._stats[record.operation] = OperationStats()
+            stats.add(record)
+
+    def reset(self):
+        with self._lock:
+            self._stats = OrderedDict()
+
+    def summary(self):
+        """
+        Return an OrderedDict {operation: {count, total, mean, ...}}.
+        """
+
+        with self._lock:
+            return OrderedDict(
+                (op, stats.to_dict()) for op, stats in self._stats.items())
+
+
+# operations of all nodes
+global_metrics = MetricsRegistry()
+
+
+class _Span(object):
+    def __init__(self):
+        self.exit_code = None
+        self.output_size = None
+
+
+def _emit(record, node):
+    global_metrics.add(record)
+
+    registry = getattr(node, '_metrics', None)
+    if registry is not None:
+        registry.add(record)
+
+    for hook in list(_hooks):
+        hook(record)
+
+
+@contextmanager
+def measure(operation, node=None, category=CATEGORY_NODE):
+    """
+    Measure a block of code, yields an object with exit_code
+    and output_size attributes (or None if metrics are disabled).
+
+    Args:
+        operation: name of the operation.
+        node: PostgresNode (current node of this thread by default).
+        category: 'node' | 'utility'.
+    """
+
+    if not metrics_enabled():
+        yield None
+        return
+
+    if node is None:
+        node = current_node()
+
+    stack = getattr(_local, 'nodes', None)
+    if stack is None:
+        stack = _local.nodes = []
+
+    span = _Span()
+    error = None
+    started = time.time()
+
+    stack.append(node)
+    try:
+        yield span
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        stack.pop()
+
+        record = OperationRecord(
+            operation=operation,
+            category=category,
+            node=getattr(node, 'name', None),
+            thread=threading.current_thread().name,
+            started=started,
+            duration=time.time() - started,
+            exit_code=span.exit_code,
+            output_size=span.output_size,
+            error=error)
+
+        _emit(record, node)
+
+
+def timed(operation, get_node=None):
+    """
+    Decorator for methods of PostgresNode (or objects bound to a node).
+
+    Args:
+        operation: name of the operation.
+        get_node: function which returns node for 'self'.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            # fast path
+            if not metrics_enabled():
+                return func(self, *args, **kwargs)
+
+            node = get_node(self) if get_node else self
+            with measure(operation, node=node):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -7,6 +7,8 @@ import subprocess
 import tempfile
 import time
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import Enum
 from six import raise_from
 
@@ -15,6 +17,7 @@ from .cache import cached_initdb as _cached_initdb
 from .config import TestgresConfig
 
 from .connection import \
+    ConnectionPool as _ConnectionPool, \
     NodeConnection, \
     InternalError,  \
     ProgrammingError
@@ -23,18 +26,74 @@ from .consts import \
     DATA_DIR as _DATA_DIR, \
     LOGS_DIR as _LOGS_DIR, \
     PG_LOG_FILE as _PG_LOG_FILE, \
+    PG_CONF_FILE as _PG_CONF_FILE, \
+    HBA_CONF_FILE as _HBA_CONF_FILE, \
+    RECOVERY_CONF_FILE as _RECOVERY_CONF_FILE, \
     UTILS_LOG_FILE as _UTILS_LOG_FILE, \
-    DEFAULT_XLOG_METHOD as _DEFAULT_XLOG_METHOD
+    DEFAULT_XLOG_METHOD as _DEFAULT_XLOG_METHOD, \
+    STORAGE_DISK as _STORAGE_DISK, \
+    STORAGE_MEMORY as _STORAGE_MEMORY, \
+    STORAGE_MEMORY_WAL as _STORAGE_MEMORY_WAL
 
 from .exceptions import \
     CatchUpException,   \
     ExecUtilException,  \
     QueryException,     \
     StartNodeException, \
+    TestgresException,  \
     TimeoutException
 
+from .loader import bulk_load as _bulk_load
+
 from .logger import TestgresLogger
 
+from .metrics import \
+    MetricsRegistry as _MetricsRegistry, \
+    measure as _measure, \
+    timed as _timed
+
+from .pgbench import \
+    PgbenchResult, \
+    PgbenchProcess as _PgbenchProcess, \
+    choose_jobs as _choose_jobs, \
+    has_custom_scripts as _has_custom_scripts, \
+    parse_pgbench_logs as _parse_pgbench_logs, \
+    pgbench_log_files as _pgbench_log_files, \
+    prepare_log_options as _prepare_log_options, \
+    prepare_script_options as _prepare_script_options
+
+from .procfs import ResourceMonitor, ResourceUsage
+
+from .plan import QueryPlan
+
+from .profiles import get_profile_settings
+
+from .querystats import QueryStatsCollector as _QueryStatsCollector
+
+from .replay import CapturedWorkload
+
+from .resources import \
+    get_cpu_count as _get_cpu_count, \
+    isolate_command as _isolate_command
+
+from .sampler import WaitEventSampler
+
+from .settings import NodeSettings
+
+from .slowlog import \
+    SlowQueryLog, \
+    parse_slow_queries as _parse_slow_queries, \
+    read_log as _read_log
+
+from .snapshot import \
+    StatsSnapshot, \
+    StatsDelta, \
+    reset_stats as _reset_stats
+
+from .storage import \
+    make_temp_dir as _make_temp_dir, \
+    relocate_dir as _relocate_dir
+
 from .utils import \
     get_bin_path, \
     file_tail as _file_tail, \
@@ -43,7 +102,9 @@ from .utils import \
     release_port as _release_port, \
     default_username as _default_username, \
     generate_app_name as _generate_app_name, \
-    execute_utility as _execute_utility
+    execute_utility as _execute_utility, \
+    get_dump_format as _get_dump_format, \
+    write_utility_log as _write_utility_log
 
 
 class NodeStatus(Enum):
@@ -62,7 +123,12 @@ class NodeStatus(Enum):
 
 
 class PostgresNode(object):
-    def __init__(self, name=None, port=None, base_dir=None, use_logging=False):
+    def __init__(self,
+                 name=None,
+                 port=None,
+                 base_dir=None,
+                 use_logging=False,
+                 storage=_STORAGE_DISK):
         """
         Create a new node manually.
 
@@ -71,6 +137,7 @@ class PostgresNode(object):
             port: port to accept connections.
             base_dir: path to node's data directory.
             use_logging: enable python logging.
+            storage: where to keep files ('disk' | 'memory' | 'memory-wal').
         """
 
         global bound_ports
@@ -81,12 +148,18 @@ class PostgresNode(object):
         self.name = name or _generate_app_name()
         self.port = port or _reserve_port()
         self.base_dir = base_dir
+        self.storage = storage
+        self.query_stats = None    # see enable_query_stats()
 
         # private
         self._should_free_port = port is None
         self._should_rm_dirs = base_dir is None
         self._use_logging = use_logging
         self._logger = None
+        self._external_dirs = []    # WAL, tablespaces
+        self._metrics = _MetricsRegistry()
+        self._isolation = {}    # CPUs and priorities of postmaster
+        self._pool = _ConnectionPool(self)    # see explain()
 
         # create directories if needed
         self._prepare_dirs()
@@ -148,11 +221,16 @@ class PostgresNode(object):
             "standby_mode=on\n"
         ).format(conninfo)
 
-        self.append_conf("recovery.conf", line)
+        self.append_conf(_RECOVERY_CONF_FILE, line)
 
     def _prepare_dirs(self):
         if not self.base_dir:
-            self.base_dir = tempfile.mkdtemp()
+            memory = self.storage == _STORAGE_MEMORY
+            self.base_dir, in_memory = _make_temp_dir(memory=memory)
+
+            # tmpfs might be full, disk is our fallback
+            if memory and not in_memory:
+                self.storage = _STORAGE_DISK
 
         if not os.path.exists(self.base_dir):
             os.makedirs(self.base_dir)
@@ -160,6 +238,21 @@ class PostgresNode(object):
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
 
+    def _relocate_wal(self):
+        wal_dir = "pg_wal" if _pg_version_ge('10') else "pg_xlog"
+        new_dir = _relocate_dir(os.path.join(self.data_dir, wal_dir))
+
+        if new_dir:
+            self._external_dirs.append(new_dir)
+        else:
+            self.storage = _STORAGE_DISK
+
+    def _rm_external_dirs(self):
+        for path in self._external_dirs:
+            shutil.rmtree(path, ignore_errors=True)
+
+        self._external_dirs = []
+
     def _maybe_start_logger(self):
         if self._use_logging:
             # spawn new logger if it doesn't exist or stopped
@@ -171,12 +264,22 @@ class PostgresNode(object):
         if self._logger:
             self._logger.stop()
 
+    def _acquire_resources(self):
+        # wait for our share of host's resources
+        budget = TestgresConfig.resource_budget
+        return budget is not None and budget.acquire(self)
+
+    def _release_resources(self):
+        budget = TestgresConfig.resource_budget
+        if budget is not None:
+            budget.release(self)
+
     def _format_verbose_error(self, message=None):
         # list of important files + N of last lines
         files = [
-            (os.path.join(self.data_dir, "postgresql.conf"), 0),
-            (os.path.join(self.data_dir, "recovery.conf"), 0),
-            (os.path.join(self.data_dir, "pg_hba.conf"), 0),
+            (os.path.join(self.data_dir, _PG_CONF_FILE), 0),
+            (os.path.join(self.data_dir, _RECOVERY_CONF_FILE), 0),
+            (os.path.join(self.data_dir, _HBA_CONF_FILE), 0),
             (self.pg_log_name, TestgresConfig.error_log_lines)
         ]
 
@@ -205,11 +308,14 @@ class PostgresNode(object):
 
         return error_text
 
+    @_timed('init')
     def init(self,
              fsync=False,
              unix_sockets=True,
              allow_streaming=False,
-             initdb_params=[]):
+             initdb_params=[],
+             profile=None,
+             nodes=None):
         """
         Perform initdb for this node.
 
@@ -218,6 +324,8 @@ class PostgresNode(object):
             unix_sockets: should we enable UNIX sockets?
             allow_streaming: should this node add a hba entry for replication?
             initdb_params: parameters for initdb (list).
+            profile: config profile ('fast-ephemeral', 'benchmark', 'dense').
+            nodes: how many nodes are going to share this host?
 
         Returns:
             This instance of PostgresNode.
@@ -230,18 +338,27 @@ class PostgresNode(object):
         initdb_log = os.path.join(self.logs_dir, "initdb.log")
         _cached_initdb(self.data_dir, initdb_log, initdb_params)
 
+        # move WAL to tmpfs if asked to
+        if self.storage == _STORAGE_MEMORY_WAL:
+            self._relocate_wal()
+
         # initialize default config files
         self.default_conf(fsync=fsync,
                           unix_sockets=unix_sockets,
-                          allow_streaming=allow_streaming)
+                          allow_streaming=allow_streaming,
+                          profile=profile,
+                          nodes=nodes)
 
         return self
 
+    @_timed('default_conf')
     def default_conf(self,
                      fsync=False,
                      unix_sockets=True,
                      allow_streaming=True,
-                     log_statement='all'):
+                     log_statement='all',
+                     profile=None,
+                     nodes=None):
         """
         Apply default settings to this node.
 
@@ -250,93 +367,371 @@ class PostgresNode(object):
             unix_sockets: should we enable UNIX sockets?
             allow_streaming: should this node add a hba entry for replication?
             log_statement: one of ('all', 'off', 'mod', 'ddl').
+            profile: config profile ('fast-ephemeral', 'benchmark', 'dense'),
+                its settings take precedence over the ones above.
+            nodes: how many nodes are going to share this host?
 
         Returns:
             This instance of PostgresNode.
         """
 
-        postgres_conf = os.path.join(self.data_dir, "postgresql.conf")
-        hba_conf = os.path.join(self.data_dir, "pg_hba.conf")
+        budget = TestgresConfig.resource_budget
+
+        conf = self.settings()
+
+        # get rid of comments and blank lines in hba file
+        conf.hba.strip_comments()
+
+        # replication-related settings
+        if allow_streaming:
+            # get auth methods for host or local users
+            auth_local = conf.hba.auth_method('local')
+            auth_host = conf.hba.auth_method('host')
 
-        # filter lines in hba file
-        with io.open(hba_conf, "r+") as conf:
-            # get rid of comments and blank lines
-            lines = [
-                s for s in conf.readlines()
-                if len(s.strip()) > 0 and not s.startswith('#')
+            # yapf: disable
+            new_lines = [
+                u"local\treplication\tall\t\t\t{}\n".format(auth_local),
+                u"host\treplication\tall\t127.0.0.1/32\t{}\n".format(auth_host),
+                u"host\treplication\tall\t::1/128\t\t{}\n".format(auth_host)
             ]
 
-            # write filtered lines
-            conf.seek(0)
-            conf.truncate()
-            conf.writelines(lines)
-
-            # replication-related settings
-            if allow_streaming:
-                # get auth method for host or local users
-                def get_auth_method(t):
-                    return next((s.split()[-1] for s in lines
-                                 if s.startswith(t)), 'trust')
-
-                # get auth methods
-                auth_local = get_auth_method('local')
-                auth_host = get_auth_method('host')
-
-                # yapf: disable
-                new_lines = [
-                    u"local\treplication\tall\t\t\t{}\n".format(auth_local),
-                    u"host\treplication\tall\t127.0.0.1/32\t{}\n".format(auth_host),
-                    u"host\treplication\tall\t::1/128\t\t{}\n".format(auth_host)
-                ]
-
-                # write missing lines
-                for line in new_lines:
-                    if line not in lines:
-                        conf.write(line)
+            # add missing lines
+            for line in new_lines:
+                conf.hba.add(line)
 
         # overwrite postgresql.conf file
-        with io.open(postgres_conf, "w") as conf:
-            # remove old lines
-            conf.truncate()
+        conf.conf.clear()
 
-            if not fsync:
-                conf.write(u"fsync = off\n")
+        if not fsync:
+            conf['fsync'] = 'off'
 
-            # yapf: disable
-            conf.write(u"log_statement = {}\n"
-                       u"listen_addresses = '{}'\n"
-                       u"port = {}\n".format(log_statement,
-                                             self.host,
-                                             self.port))
-
-            # replication-related settings
-            if allow_streaming:
-
-                # select a proper wal_level for PostgreSQL
-                if _pg_version_ge('9.6'):
-                    wal_level = "replica"
-                else:
-                    wal_level = "hot_standby"
-
-                # yapf: disable
-                max_wal_senders = 10    # default in PG 10
-                wal_keep_segments = 20  # for convenience
-                conf.write(u"hot_standby = on\n"
-                           u"max_wal_senders = {}\n"
-                           u"wal_keep_segments = {}\n"
-                           u"wal_level = {}\n".format(max_wal_senders,
-                                                      wal_keep_segments,
-                                                      wal_level))
-
-            # disable UNIX sockets if asked to
-            if not unix_sockets:
-                conf.write(u"unix_socket_directories = ''\n")
+        conf['log_statement'] = log_statement
+
+        # default since PG 10, needed to tell sessions apart
+        if not _pg_version_ge('10'):
+            conf['log_line_prefix'] = '%m [%p] '
+        conf['listen_addresses'] = self.host
+        conf['port'] = self.port
+
+        # replication-related settings
+        if allow_streaming:
+
+            # select a proper wal_level for PostgreSQL
+            if _pg_version_ge('9.6'):
+                wal_level = "replica"
+            else:
+                wal_level = "hot_standby"
+
+            conf['hot_standby'] = 'on'
+            conf['max_wal_senders'] = 10       # default in PG 10
+            conf['wal_keep_segments'] = 20     # for convenience
+            conf['wal_level'] = wal_level
+
+        # disable UNIX sockets if asked to
+        if not unix_sockets:
+            conf['unix_socket_directories'] = ''
+
+        # settings computed from host resources
+        if profile:
+            if nodes is None and budget is not None:
+                nodes = budget.max_nodes
+
+            conf.update(get_profile_settings(profile,
+                                             nodes=nodes,
+                                             allow_streaming=allow_streaming))
+
+        # fair share of resources shared by nodes
+        elif budget is not None:
+            conf.update(budget.node_settings(allow_streaming=allow_streaming))
+
+        # write everything at once
+        conf.save()
 
         return self
 
+    def settings(self):
+        """
+        Load config files (postgresql.conf and its includes,
+        postgresql.auto.conf, pg_hba.conf) of this node.
+        Changes are written at once by apply() or save().
+
+        Returns:
+            An instance of NodeSettings.
+        """
+
+        return NodeSettings(self)
+
+    def stats_snapshot(self, dbname='postgres', username=None):
+        """
+        Read statistics views (pg_stat_database, pg_stat_user_tables etc)
+        in a single transaction. Subtract snapshots to get a delta.
+
+        Args:
+            dbname: database name to connect to.
+            username: database user name.
+
+        Returns:
+            An instance of StatsSnapshot.
+        """
+
+        with self.connect(dbname, username) as con:
+            return StatsSnapshot.take(con)
+
+    @contextmanager
+    def stats_delta(self, dbname='postgres', username=None, reset=False):
+        """
+        Measure what a block of code did on this node.
+        NOTE: backends report their statistics with a small delay.
+
+        Args:
+            dbname: database name to connect to.
+            username: database user name.
+            reset: reset statistics before the block.
+
+        Returns:
+            A StatsDelta, which is filled when the block exits.
+
+        >>> with node.stats_delta() as delta:
+        ...     node.pgbench_run(options=['-T10'])
+        >>> delta.blocks_read, delta.wal_bytes
+        """
+
+        delta = StatsDelta()
+
+        with self.connect(dbname, username) as con:
+            if reset:
+                _reset_stats(con)
+
+            before = StatsSnapshot.take(con)
+
+            yield delta
+
+            after = StatsSnapshot.take(con)
+            delta._compute(before, after)
+
+    @contextmanager
+    def capture_slow_queries(self,
+                             min_duration=0,
+                             auto_explain=False,
+                             analyze=False,
+                             dbname='postgres',
+                             username=None):
+        """
+        Log statements slower than min_duration (ms) during a block
+        and parse the part of server log written meanwhile.
+        Settings are reverted when the block exits; only new sessions
+        load auto_explain.
+
+        Args:
+            min_duration: log_min_duration_statement (ms).
+            auto_explain: log plans in JSON format too.
+            analyze: make auto_explain log actual rows, timings and buffers.
+            dbname: database name to connect to.
+            username: database user name.
+
+        Returns:
+            A SlowQueryLog, which is filled when the block exits.
+
+        >>> with node.capture_slow_queries(min_duration=50) as log:
+        ...     node.pgbench_run(options=['-T10'])
+        >>> assert not log.exceeding(500), log.slowest()
+        """
+
+        min_duration = int(min_duration)
+
+        new_values = {'log_min_duration_statement': min_duration}
+
+        conf = self.settings()
+        if auto_explain:
+            libs = [lib.strip() for lib in
+                    (conf.get('session_preload_libraries') or '').split(',')]
+            libs = [lib for lib in libs if lib]
+            if 'auto_explain' not in libs:
+                libs.append('auto_explain')
+
+            new_values.update({
+                'session_preload_libraries': ','.join(libs),
+                'auto_explain.log_min_duration': min_duration,
+                'auto_explain.log_format': 'json',
+                'auto_explain.log_analyze': 'on' if analyze else 'off',
+                'auto_explain.log_buffers': 'on' if analyze else 'off',
+            })
+
+        log = SlowQueryLog()
+
+        with self._logging_settings(conf, new_values, dbname, username):
+            offset = os.path.getsize(self.pg_log_name)
+
+            yield log
+
+            text = _read_log(self.pg_log_name, offset)
+            log.queries = _parse_slow_queries(text)
+
+    @contextmanager
+    def _logging_settings(self, conf, new_values, dbname, username):
+        """
+        Apply settings by reload for a block, revert them afterwards.
+        """
+
+        if not new_values:
+            yield
+            return
+
+        old_values = dict((name, conf.get(name)) for name in new_values)
+
+        # settings might already have the same values, so wait for
+        # config reload time to change instead
+        load_time = self.execute(dbname,
+                                 'select pg_conf_load_time()::text',
+                                 username=username)[0][0]
+
+        # auto_explain's settings are unknown to pg_settings, so reload
+        # the node directly instead of NodeSettings.apply()
+        conf.update(new_values).save()
+        self.reload()
+
+        try:
+            # wait until postmaster has reloaded config
+            self.poll_query_until(
+                dbname,
+                "select pg_conf_load_time() > '{}'".format(load_time),
+                username=username,
+                max_attempts=500,
+                sleep_time=0.01)
+
+            yield
+        finally:
+            conf = self.settings()
+            for name, value in old_values.items():
+                if value is None:
+                    conf.remove(name)
+                else:
+                    conf.set(name, value)
+
+            conf.save()
+            self.reload()
+
+    @contextmanager
+    def capture_workload(self, durations=True, dbname='postgres',
+                         username=None):
+        """
+        Parse statements logged during a block (see log_statement,
+        which is 'all' by default) into per-session streams.
+
+        Args:
+            durations: log durations of all statements meanwhile
+                (log_min_duration_statement = 0), see diff().
+            dbname: database name to connect to.
+            username: database user name.
+
+        Returns:
+            A CapturedWorkload, which is filled when the block exits.
+
+        >>> with node.capture_workload() as captured:
+        ...     run_tests(node)
+        >>> result = captured.replay(other_node, speed=None)
+        """
+
+        captured = CapturedWorkload()
+
+        new_values = {'log_min_duration_statement': 0} if durations else {}
+
+        with self._logging_settings(self.settings(), new_values, dbname,
+                                    username):
+            offset = os.path.getsize(self.pg_log_name)
+
+            yield captured
+
+            text = _read_log(self.pg_log_name, offset)
+            captured.sessions = CapturedWorkload.from_log(text).sessions
+
+    def wait_event_sampler(self,
+                           interval=0.01,
+                           dbname='postgres',
+                           username=None,
+                           all_backends=False):
+        """
+        Create a background sampler of backends' wait events.
+        Use it as a context manager or call start() and stop().
+
+        Args:
+            interval: time between samples (seconds).
+            dbname: database name to connect to.
+            username: database user name.
+            all_backends: sample background workers too.
+
+        Returns:
+            An instance of WaitEventSampler.
+        """
+
+        return WaitEventSampler(node=self,
+                                interval=interval,
+                                dbname=dbname,
+                                username=username,
+                                all_backends=all_backends)
+
+    def resource_usage(self, backend_types=True):
+        """
+        Read CPU time, memory (RSS/PSS), I/O bytes, context switches
+        and open files of postmaster and all its children (Linux only).
+
+        Args:
+            backend_types: ask pg_stat_activity for types of backends,
+                else guess them using process titles.
+
+        Returns:
+            An instance of ResourceUsage (subtract them to get a delta).
+        """
+
+        pid = self.get_pid()
+        if not pid:
+            raise TestgresException('Node is not running')
+
+        types = None
+        if backend_types and _pg_version_ge('10'):
+            query = 'select pid, backend_type from pg_stat_activity'
+            types = dict(self.execute('postgres', query, commit=False))
+
+        return ResourceUsage.collect(pid, types)
+
+    def resource_monitor(self, interval=1.0):
+        """
+        Create a background monitor of resource usage (see resource_usage()).
+        Use it as a context manager or call start() and stop().
+
+        Args:
+            interval: time between samples (seconds).
+
+        Returns:
+            An instance of ResourceMonitor.
+        """
+
+        return ResourceMonitor(node=self, interval=interval)
+
+    def metrics(self, reset=False):
+        """
+        Return timings of this node's operations and utilities
+        (see TestgresConfig.collect_metrics).
+
+        Args:
+            reset: clear collected metrics afterwards.
+
+        Returns:
+            An OrderedDict {operation: {count, total, mean, ...}},
+            durations are measured in seconds.
+        """
+
+        summary = self._metrics.summary()
+
+        if reset:
+            self._metrics.reset()
+
+        return summary
+
     def append_conf(self, filename, string):
         """
         Append line to a config file (i.e. postgresql.conf).
+        NOTE: see settings() for a way to change settings without duplicates.
 
         Args:
             filename: name of the config file.
@@ -411,12 +806,19 @@ class PostgresNode(object):
 
         return out_dict
 
-    def start(self, params=[]):
+    @_timed('start')
+    def start(self, params=[], cpus=None, nice=None, ionice=None):
         """
         Start this node using pg_ctl.
+        CPU set and priorities are inherited by all backends
+        and kept by restart().
 
         Args:
             params: additional arguments for pg_ctl.
+            cpus: set of CPUs for postmaster (see split_cpus()).
+            nice: niceness increment.
+            ionice: I/O class ('realtime' | 'best-effort' | 'idle'),
+                optionally (class, level) tuple.
 
         Returns:
             This instance of PostgresNode.
@@ -431,9 +833,18 @@ class PostgresNode(object):
             "start"
         ] + params
 
+        self._isolation = dict(cpus=cpus, nice=nice, ionice=ionice)
+        _params, preexec_fn = _isolate_command(_params, **self._isolation)
+
+        # this might block until resources are available
+        acquired = self._acquire_resources()
+
         try:
-            _execute_utility(_params, self.utils_log_name)
+            _execute_utility(_params, self.utils_log_name, preexec_fn)
         except ExecUtilException as e:
+            if acquired:
+                self._release_resources()
+
             msg = self._format_verbose_error('Cannot start node')
             raise_from(StartNodeException(msg), e)
 
@@ -441,6 +852,7 @@ class PostgresNode(object):
 
         return self
 
+    @_timed('stop')
     def stop(self, params=[]):
         """
         Stop this node using pg_ctl.
@@ -460,12 +872,17 @@ class PostgresNode(object):
             "stop"
         ] + params
 
+        # pooled connections won't survive
+        self._pool.close()
+
         _execute_utility(_params, self.utils_log_name)
 
+        self._release_resources()
         self._maybe_stop_logger()
 
         return self
 
+    @_timed('restart')
     def restart(self, params=[]):
         """
         Restart this node using pg_ctl.
@@ -486,9 +903,21 @@ class PostgresNode(object):
             "restart"
         ] + params
 
+        # new postmaster should run on the same CPUs
+        _params, preexec_fn = _isolate_command(_params, **self._isolation)
+
+        # pooled connections won't survive
+        self._pool.close()
+
+        # node might have been stopped
+        acquired = self._acquire_resources()
+
         try:
-            _execute_utility(_params, self.utils_log_name)
+            _execute_utility(_params, self.utils_log_name, preexec_fn)
         except ExecUtilException as e:
+            if acquired:
+                self._release_resources()
+
             msg = self._format_verbose_error('Cannot restart node')
             raise_from(StartNodeException(msg), e)
 
@@ -496,6 +925,7 @@ class PostgresNode(object):
 
         return self
 
+    @_timed('reload')
     def reload(self, params=[]):
         """
         Reload config files using pg_ctl.
@@ -545,6 +975,7 @@ class PostgresNode(object):
         if self._should_free_port:
             _release_port(self.port)
 
+    @_timed('cleanup')
     def cleanup(self, max_attempts=3):
         """
         Stop node if needed and remove its data directory.
@@ -570,6 +1001,9 @@ class PostgresNode(object):
 
             attempts += 1
 
+        # node is not running anymore
+        self._release_resources()
+
         # remove directory tree if necessary
         if self._should_rm_dirs:
 
@@ -581,8 +1015,43 @@ class PostgresNode(object):
 
             shutil.rmtree(rm_dir, ignore_errors=True)
 
+            # WAL and tablespaces live outside of base_dir
+            self._rm_external_dirs()
+
         return self
 
+    def create_tablespace(self,
+                          name,
+                          location=None,
+                          memory=False,
+                          dbname='postgres',
+                          username=None):
+        """
+        Create a tablespace in a new directory on a chosen mount point.
+        NOTE: backup() can't handle tablespaces of a node on the same host.
+
+        Args:
+            name: name of the tablespace.
+            location: parent dir (e.g. a mount point) for tablespace's dir.
+            memory: place tablespace on tmpfs (unless location is set)?
+            dbname: database name to connect to.
+            username: database user name.
+
+        Returns:
+            Path to tablespace's directory.
+        """
+
+        path, _ = _make_temp_dir(memory=memory, location=location)
+        self._external_dirs.append(path)
+
+        query = u"create tablespace {} location '{}'"
+        self.execute(dbname=dbname,
+                     username=username,
+                     query=query.format(name, path.replace("'", "''")))
+
+        return path
+
+    @_timed('psql')
     def psql(self,
              dbname,
              query=None,
@@ -661,7 +1130,13 @@ class PostgresNode(object):
 
         return out
 
-    def dump(self, dbname, username=None, filename=None):
+    @_timed('dump')
+    def dump(self,
+             dbname,
+             username=None,
+             filename=None,
+             format='plain',
+             jobs=None):
         """
         Dump database into a file using pg_dump.
         NOTE: the file is not removed automatically.
@@ -669,16 +1144,25 @@ class PostgresNode(object):
         Args:
             dbname: database name to connect to.
             username: database user name.
-            filename: output file.
+            filename: output file (or directory).
+            format: 'plain' | 'custom' | 'directory' | 'tar'.
+            jobs: number of parallel jobs for 'directory' (N of CPUs).
 
         Returns:
-            Path to a file containing dump.
+            Path to a file (or directory) containing dump.
         """
 
         # Set default arguments
         username = username or _default_username()
-        f, filename = filename or tempfile.mkstemp()
-        os.close(f)
+
+        if not filename:
+            if format == 'directory':
+                # pg_dump wants to create this directory itself
+                filename = tempfile.mkdtemp()
+                os.rmdir(filename)
+            else:
+                f, filename = tempfile.mkstemp()
+                os.close(f)
 
         # yapf: disable
         _params = [
@@ -687,24 +1171,180 @@ class PostgresNode(object):
             "-h", self.host,
             "-f", filename,
             "-U", username,
-            "-d", dbname
+            "-d", dbname,
+            "-F", format[0]    # p | c | d | t
         ]
 
+        # only directory format supports parallel dump
+        if format == 'directory':
+            _params += ["-j", str(jobs or _get_cpu_count())]
+
         _execute_utility(_params, self.utils_log_name)
 
         return filename
 
-    def restore(self, dbname, filename, username=None):
+    @_timed('restore')
+    def restore(self, dbname, filename, username=None, jobs=None):
         """
-        Restore database from pg_dump's file.
+        Restore database from pg_dump's file (or directory).
+        Archives are restored by pg_restore section by section.
 
         Args:
             dbname: database name to connect to.
             filename: database dump taken by pg_dump.
+            username: database user name.
+            jobs: number of parallel jobs for pg_restore (N of CPUs).
+
+        Returns:
+            An OrderedDict of {phase: seconds}.
         """
 
-        self.psql(dbname=dbname, filename=filename, username=username)
+        username = username or _default_username()
+        dump_format = _get_dump_format(filename)
+        timings = OrderedDict()
+
+        # yapf: disable
+        _conn_params = [
+            "-p", str(self.port),
+            "-h", self.host,
+            "-U", username,
+            "-d", dbname
+        ]
+
+        # plain SQL script, stop at first error
+        if dump_format == 'plain':
+            _params = [
+                get_bin_path("psql"),
+                "-X", "-q",
+                "-v", "ON_ERROR_STOP=1",
+                "-f", filename
+            ] + _conn_params
+
+            started = time.time()
+            _execute_utility(_params, self.utils_log_name)
+            timings['script'] = time.time() - started
+
+            return timings
+
+        # tar format doesn't support parallel restore
+        if dump_format == 'tar':
+            jobs = 1
+
+        for section in ('pre-data', 'data', 'post-data'):
+            _params = [
+                get_bin_path("pg_restore"),
+                "--section", section,
+                "-e",    # exit on error
+                "-j", str(jobs or _get_cpu_count())
+            ] + _conn_params + [filename]
+
+            started = time.time()
+            _execute_utility(_params, self.utils_log_name)
+            timings[section] = time.time() - started
+
+        return timings
+
+    def copy_database_to(self,
+                         other_node,
+                         dbname,
+                         target_dbname=None,
+                         username=None):
+        """
+        Copy a database to another node (pg_dump | pg_restore),
+        no temp files are created.
+
+        Args:
+            other_node: PostgresNode to copy database to.
+            dbname: database to be copied.
+            target_dbname: name of a new database (same as dbname).
+            username: database user name.
+
+        Returns:
+            An OrderedDict of {phase: seconds}.
+        """
+
+        username = username or _default_username()
+        target_dbname = target_dbname or dbname
+        timings = OrderedDict()
+
+        started = time.time()
+
+        # create target database if needed
+        with other_node.connect('postgres', username=username) as con:
+            query = u'select 1 from pg_database where datname = %s'
+            exists = con.execute(query, target_dbname)
+
+        if not exists:
+            name = target_dbname.replace('"', '""')
+            other_node.safe_psql('postgres',
+                                 u'create database "{}"'.format(name),
+                                 username=username)
+
+        timings['create'] = time.time() - started
+
+        # yapf: disable
+        dump_params = [
+            get_bin_path("pg_dump"),
+            "-p", str(self.port),
+            "-h", self.host,
+            "-U", username,
+            "-d", dbname,
+            "-F", "c"
+        ]
+
+        # yapf: disable
+        restore_params = [
+            get_bin_path("pg_restore"),
+            "-p", str(other_node.port),
+            "-h", other_node.host,
+            "-U", username,
+            "-d", target_dbname,
+            "-e"    # exit on error
+        ]
+
+        started = time.time()
+
+        with tempfile.TemporaryFile() as dump_err:
+            dump = subprocess.Popen(dump_params,
+                                    stdout=subprocess.PIPE,
+                                    stderr=dump_err)
+
+            restore = subprocess.Popen(restore_params,
+                                       stdin=dump.stdout,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT)
+
+            # let pg_dump receive SIGPIPE if pg_restore fails
+            dump.stdout.close()
+
+            out, _ = restore.communicate()
+            dump.wait()
+
+            dump_err.seek(0)
+            err = dump_err.read()
+
+        timings['copy'] = time.time() - started
+
+        # log both utilities, restore first (its error explains dump's)
+        errors = []
+        for args, text, proc in ((restore_params, out, restore),
+                                 (dump_params, err, dump)):
+            text = '' if not text else text.decode('utf-8')
+            _write_utility_log(self.utils_log_name, args, text)
+
+            if proc.returncode:
+                errors.append((u"{} failed with exit code {}\n"
+                               u"log:\n----\n{}\n").format(args[0],
+                                                           proc.returncode,
+                                                           text))
+
+        if errors:
+            exit_code = restore.returncode or dump.returncode
+            raise ExecUtilException(u''.join(errors), exit_code)
 
+        return timings
+
+    @_timed('poll_query_until')
     def poll_query_until(self,
                          dbname,
                          query,
@@ -767,11 +1407,13 @@ class PostgresNode(object):
                 if raise_internal_error:
                     raise e
 
-            time.sleep(sleep_time)
+            with _measure('wait', node=self):
+                time.sleep(sleep_time)
             attempts += 1
 
         raise TimeoutException('Query timeout')
 
+    @_timed('execute')
     def execute(self, dbname, query, username=None, commit=True):
         """
         Execute a query and return all rows as list.
@@ -792,6 +1434,95 @@ class PostgresNode(object):
                 node_con.commit()
             return res
 
+    @_timed('bulk_load')
+    def bulk_load(self,
+                  table,
+                  source,
+                  connections=4,
+                  columns=None,
+                  format='text',
+                  header=False,
+                  post_load=None,
+                  analyze=True,
+                  dbname='postgres',
+                  username=None):
+        """
+        Load data into a table using several COPY streams at once.
+        Files are mapped into memory (mmap) and split into ranges
+        at line breaks (so quoted CSV values shouldn't contain them).
+
+        Args:
+            table: name of a table.
+            source: path to a file, or an iterable of chunks which
+                contain whole rows (bytes, files, or functions
+                returning them, which are called by workers).
+            connections: number of parallel connections.
+            columns: list of column names.
+            format: 'text' | 'csv' | 'binary' (not for files).
+            header: skip the first line of a file.
+            post_load: statements to be run in parallel after the load
+                (e.g. CREATE INDEX, ALTER TABLE ... ADD CONSTRAINT).
+            analyze: ANALYZE the table (or a list of tables) in parallel.
+            dbname: database name to connect to.
+            username: database user name.
+
+        Returns:
+            A LoadResult with rows/sec per worker and post-load timings.
+        """
+
+        return _bulk_load(self,
+                          table,
+                          source,
+                          connections=connections,
+                          columns=columns,
+                          format=format,
+                          header=header,
+                          post_load=post_load,
+                          analyze=analyze,
+                          dbname=dbname,
+                          username=username)
+
+    @_timed('explain')
+    def explain(self,
+                dbname,
+                query,
+                username=None,
+                analyze=True,
+                buffers=True,
+                settings=True):
+        """
+        Run EXPLAIN (FORMAT JSON) over a pooled connection.
+        With analyze=True the query is executed in a transaction
+        which is rolled back afterwards.
+
+        Args:
+            dbname: database name to connect to.
+            query: query to be explained.
+            username: database user name.
+            analyze: execute query, collect actual rows and timings.
+            buffers: collect buffer usage (PG 13+ without analyze).
+            settings: report modified planner settings (PG 12+).
+
+        Returns:
+            QueryPlan (see diff_plans() for comparison).
+        """
+
+        options = ['format json']
+        if analyze:
+            options.append('analyze')
+        if buffers and (analyze or _pg_version_ge('13')):
+            options.append('buffers')
+        if settings and _pg_version_ge('12'):
+            options.append('settings')
+
+        query = 'explain ({}) {}'.format(', '.join(options), query)
+
+        with self._pool.connection(dbname, username) as con:
+            res = con.execute(query)
+
+        return QueryPlan.from_json(res[0][0])
+
+    @_timed('backup')
     def backup(self, username=None, xlog_method=_DEFAULT_XLOG_METHOD):
         """
         Perform pg_basebackup.
@@ -828,6 +1559,43 @@ class PostgresNode(object):
                                     destroy=True,
                                     use_logging=use_logging)
 
+    @_timed('clone')
+    def clone(self, name=None, storage=None, use_logging=False):
+        """
+        Create an independent copy of this (stopped) node.
+        Unlike backup(), this does not require a running server,
+        so the copy is bit-for-bit identical (e.g. for A/B benchmarks).
+
+        Args:
+            name: clone's application name.
+            storage: where to keep clone's files (same as this node's).
+            use_logging: enable python logging.
+
+        Returns:
+            New instance of PostgresNode.
+        """
+
+        if self.status() == NodeStatus.Running:
+            raise TestgresException('Node must be stopped')
+
+        node = PostgresNode(name=name,
+                            use_logging=use_logging,
+                            storage=storage or self.storage)
+
+        try:
+            # symlinks (WAL, tablespaces) are replaced with real dirs
+            shutil.copytree(self.data_dir, node.data_dir)
+
+            # replace original port (no duplicates)
+            node.settings().set('port', node.port).save()
+        except Exception:
+            node.cleanup()
+            node.free_port()
+            raise
+
+        return node
+
+    @_timed('catchup')
     def catchup(self, dbname='postgres', username=None):
         """
         Wait until async replica catches up with its master.
@@ -859,7 +1627,34 @@ class PostgresNode(object):
         except Exception as e:
             raise_from(CatchUpException('Failed to catch up'), e)
 
-    def pgbench(self, dbname='postgres', stdout=None, stderr=None, options=[]):
+    def _pgbench_params(self, dbname, options, scripts, jobs, tmp_dir,
+                        cpus=None):
+        options = list(options) + _prepare_script_options(scripts, tmp_dir)
+
+        # pick number of threads automatically
+        if jobs is None:
+            jobs = _choose_jobs(options, len(cpus) if cpus else _get_cpu_count())
+        if jobs:
+            options += ["-j", str(jobs)]
+
+        # yapf: disable
+        return [
+            get_bin_path("pgbench"),
+            "-p", str(self.port),
+            "-h", self.host,
+        ] + options + [dbname]
+
+    def pgbench(self,
+                dbname='postgres',
+                stdout=None,
+                stderr=None,
+                options=[],
+                scripts=None,
+                jobs=None,
+                progress=None,
+                cpus=None,
+                nice=None,
+                ionice=None):
         """
         Spawn a pgbench process.
 
@@ -868,44 +1663,138 @@ class PostgresNode(object):
             stdout: stdout file to be used by Popen.
             stderr: stderr file to be used by Popen.
             options: additional options for pgbench (list).
+            scripts: custom scripts: SQL text or builtin names
+                ('tpcb-like' etc), optionally (script, weight) tuples.
+            jobs: number of threads (-j), depends on CPUs and clients.
+            progress: show progress every N seconds (-P), see
+                PgbenchProcess.progress(); implies stdout and stderr pipes.
+            cpus: set of CPUs for pgbench (see split_cpus()).
+            nice: niceness increment.
+            ionice: I/O class (see start()).
 
         Returns:
-            Process created by subprocess.Popen.
+            Process created by subprocess.Popen (PgbenchProcess).
         """
 
-        # yapf: disable
-        _params = [
-            get_bin_path("pgbench"),
-            "-p", str(self.port),
-            "-h", self.host,
-        ] + options + [dbname]
+        # temp files are needed only for SQL scripts
+        script_dir = None
+        if _has_custom_scripts(scripts):
+            script_dir = tempfile.mkdtemp()
 
-        proc = subprocess.Popen(_params, stdout=stdout, stderr=stderr)
+        try:
+            _params = self._pgbench_params(dbname, options, scripts, jobs,
+                                           script_dir, cpus)
+
+            # progress is reported to stderr
+            if progress:
+                _params[1:1] = ["-P", str(progress)]
+                stdout, stderr = subprocess.PIPE, subprocess.STDOUT
+
+            _params, preexec_fn = _isolate_command(_params,
+                                                   cpus=cpus,
+                                                   nice=nice,
+                                                   ionice=ionice)
+
+            proc = _PgbenchProcess(_params,
+                                   script_dir=script_dir,
+                                   stdout=stdout,
+                                   stderr=stderr,
+                                   preexec_fn=preexec_fn)
+        except Exception:
+            if script_dir is not None:
+                shutil.rmtree(script_dir, ignore_errors=True)
+            raise
 
         return proc
 
-    def pgbench_run(self, dbname='postgres', options=[]):
+    @_timed('pgbench_run')
+    def pgbench_run(self,
+                    dbname='postgres',
+                    options=[],
+                    scripts=None,
+                    jobs=None,
+                    cpus=None,
+                    nice=None,
+                    ionice=None):
         """
         Run pgbench with some options.
         This event is logged (see self.utils_log_name).
+        Per-transaction logs (--log) are parsed into a latency histogram
+        and removed, unless --log-prefix is specified (then only files
+        written by this run are parsed).
 
         Args:
             dbname: database name to connect to.
             options: additional options for pgbench (list).
+            scripts: custom scripts (see pgbench()).
+            jobs: number of threads (-j), depends on CPUs and clients.
+            cpus: set of CPUs for pgbench (see split_cpus()).
+            nice: niceness increment.
+            ionice: I/O class (see start()).
 
         Returns:
-            Stdout produced by pgbench.
+            An instance of PgbenchResult (str() returns stdout of pgbench).
         """
 
-        # yapf: disable
-        _params = [
-            get_bin_path("pgbench"),
-            "-p", str(self.port),
-            "-h", self.host,
-        ] + options + [dbname]
+        tmp_dir = tempfile.mkdtemp()
 
-        return _execute_utility(_params, self.utils_log_name)
+        try:
+            options, log_prefix, aggregate = \
+                _prepare_log_options(options, tmp_dir)
+
+            _params = self._pgbench_params(dbname, options, scripts, jobs,
+                                           tmp_dir, cpus)
+
+            _params, preexec_fn = _isolate_command(_params,
+                                                   cpus=cpus,
+                                                   nice=nice,
+                                                   ionice=ionice)
+
+            # user's --log-prefix may point to logs of previous runs
+            previous = _pgbench_log_files(log_prefix) if log_prefix else {}
+
+            out = _execute_utility(_params, self.utils_log_name, preexec_fn)
+            result = PgbenchResult(out)
+
+            if log_prefix:
+                _parse_pgbench_logs(log_prefix,
+                                    result,
+                                    aggregate=aggregate,
+                                    previous=previous)
+
+            return result
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def enable_query_stats(self, collector=None):
+        """
+        Record client-side latencies of queries executed by
+        connections of this node (including execute()).
+
+        Args:
+            collector: QueryStatsCollector (possibly shared by nodes).
+
+        Returns:
+            QueryStatsCollector of this node.
+        """
+
+        self.query_stats = collector or self.query_stats or \
+            _QueryStatsCollector()
+
+        return self.query_stats
+
+    def disable_query_stats(self):
+        """
+        Stop recording latencies of new connections.
+
+        Returns:
+            QueryStatsCollector with statistics gathered so far.
+        """
+
+        collector, self.query_stats = self.query_stats, None
+        return collector
 
+    @_timed('connect')
     def connect(self, dbname='postgres', username=None):
         """
         Connect to a database.
@@ -921,4 +1810,5 @@ class PostgresNode(object):
         return NodeConnection(parent_node=self,
                               host=self.host,
                               dbname=dbname,
-                              username=username)
+                              username=username,
+                              query_stats=self.query_stats)
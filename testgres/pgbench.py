@@ -0,0 +1,510 @@
+# coding: utf-8
+
+from __future__ import division
+
+import glob
+import io
+import os
+import re
+import shutil
+import subprocess
+
+from collections import namedtuple
+
+from .exceptions import TestgresException
+from .histogram import LatencyHistogram
+
+# yapf: disable
+_SUMMARY_RE = [
+    ('transaction_type', re.compile(r"^transaction type: (.+)$"), str),
+    ('scaling_factor', re.compile(r"^scaling factor: (\d+)"), int),
+    ('query_mode', re.compile(r"^query mode: (\w+)"), str),
+    ('clients', re.compile(r"^number of clients: (\d+)"), int),
+    ('threads', re.compile(r"^number of threads: (\d+)"), int),
+    ('max_tries', re.compile(r"^maximum number of tries: (\d+)"), int),
+    ('duration', re.compile(r"^duration: (\d+) s"), int),
+    ('transactions', re.compile(r"^number of transactions actually processed: (\d+)"), int),
+    ('failed_transactions', re.compile(r"^number of failed transactions: (\d+)"), int),
+    ('retried_transactions', re.compile(r"^number of transactions retried: (\d+)"), int),
+    ('total_retries', re.compile(r"^total number of retries: (\d+)"), int),
+    ('latency_avg', re.compile(r"^latency average = ([\d.]+) ms"), float),
+    ('latency_stddev', re.compile(r"^latency stddev = ([\d.]+) ms"), float),
+    ('initial_connection_time', re.compile(r"^initial connection time = ([\d.]+) ms"), float),
+    ('tps', re.compile(r"^tps = ([\d.]+) \((?:without initial connection time|excluding connections establishing)\)"), float),
+    ('tps_including_connections', re.compile(r"^tps = ([\d.]+) \(including connections establishing\)"), float),
+]
+
+# yapf: disable
+_SCRIPT_RE = [
+    ('weight', re.compile(r"^ - weight: (\d+)"), int),
+    ('transactions', re.compile(r"^ - (\d+) transactions"), int),
+    ('tps', re.compile(r"^ - \d+ transactions .*tps = ([\d.]+)\)"), float),
+    ('failed_transactions', re.compile(r"^ - number of failed transactions: (\d+)"), int),
+    ('retried_transactions', re.compile(r"^ - number of transactions retried: (\d+)"), int),
+    ('total_retries', re.compile(r"^ - total number of retries: (\d+)"), int),
+    ('latency_avg', re.compile(r"^ - latency average = ([\d.]+) ms"), float),
+    ('latency_stddev', re.compile(r"^ - latency stddev = ([\d.]+) ms"), float),
+]
+
+_SCRIPT_HEADER_RE = re.compile(r"^SQL script (\d+): (.+)$")
+_STATEMENTS_HEADER_RE = re.compile(r"^\s*-?\s*statement latencies in milliseconds")
+_STATEMENT_RE = re.compile(r"^\s+([\d.]+)\s+(?:(\d+)\s+)?(?:(\d+)\s+)?(\S.*)$")
+
+_LOG_PREFIX = "pgbench_log"
+
+# pgbench names log files 'prefix.pid' and 'prefix.pid.thread'
+_LOG_SUFFIX_RE = re.compile(r'^\.\d+(\.\d+)?$')
+
+_PROGRESS_RE = re.compile(r"^progress: ([\d.]+) s, ([\d.]+) tps, "
+                          r"lat ([\d.]+) ms stddev ([\d.]+|NaN)"
+                          r"(?:, (\d+) failed)?")
+_PROGRESS_LAG_RE = re.compile(r", lag ([\d.]+) ms")
+
+BUILTIN_SCRIPTS = ('tpcb-like', 'simple-update', 'select-only')
+
+PgbenchProgress = namedtuple('PgbenchProgress',
+                             ['time', 'tps', 'latency', 'stddev', 'failed',
+                              'lag'])
+
+PgbenchStatement = namedtuple('PgbenchStatement',
+                              ['latency', 'failures', 'retries', 'command'])
+
+PgbenchInterval = namedtuple('PgbenchInterval', [
+    'start', 'transactions', 'latency_sum', 'latency_sum_sq', 'latency_min',
+    'latency_max'
+])
+
+
+class PgbenchScript(object):
+    """
+    Per-script results of pgbench (-b / -f with weights)
+    """
+
+    def __init__(self, number, name):
+        self.number = number
+        self.name = name
+        self.weight = None
+        self.transactions = None
+        self.tps = None
+        self.failed_transactions = None
+        self.retried_transactions = None
+        self.total_retries = None
+        self.latency_avg = None
+        self.latency_stddev = None
+        self.statements = []
+
+
+class PgbenchResult(object):
+    """
+    Parsed results of pgbench.
+    Latencies are in milliseconds unless stated otherwise.
+
+    Attributes:
+        output: raw output of pgbench.
+        tps: TPS without initial connection time.
+        tps_including_connections: TPS with connections (PG < 14).
+        initial_connection_time: connection time, ms (PG 14+).
+        transactions: number of processed transactions.
+        failed_transactions: number of failed transactions.
+        retried_transactions: number of retried transactions.
+        latency_avg, latency_stddev: latency stats.
+        statements: per-statement latencies (-r) for a single script.
+        scripts: list of PgbenchScript if several scripts were used.
+        histogram: LatencyHistogram (usec) built from --log files.
+        intervals: list of PgbenchInterval (--aggregate-interval).
+    """
+
+    def __init__(self, output):
+        self.output = output
+
+        self.transaction_type = None
+        self.scaling_factor = None
+        self.query_mode = None
+        self.clients = None
+        self.threads = None
+        self.max_tries = None
+        self.duration = None
+        self.transactions = None
+        self.failed_transactions = None
+        self.retried_transactions = None
+        self.total_retries = None
+        self.latency_avg = None
+        self.latency_stddev = None
+        self.initial_connection_time = None
+        self.tps = None
+        self.tps_including_connections = None
+
+        self.statements = []
+        self.scripts = []
+        self.histogram = None
+        self.intervals = []
+
+        self._parse(output)
+
+    def __str__(self):
+        return self.output
+
+    def __repr__(self):
+        return '<PgbenchResult tps={} latency_avg={}>'.format(
+            self.tps, self.latency_avg)
+
+    def _parse(self, output):
+        script = None
+        statements = self.statements
+
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+
+            match = _SCRIPT_HEADER_RE.match(line)
+            if match:
+                script = PgbenchScript(int(match.group(1)), match.group(2))
+                statements = script.statements
+                self.scripts.append(script)
+                continue
+
+            if _STATEMENTS_HEADER_RE.match(line):
+                continue
+
+            if script is not None and line.startswith(' - '):
+                _parse_fields(script, _SCRIPT_RE, line)
+                continue
+
+            match = _STATEMENT_RE.match(line)
+            if match:
+                latency, failures, retries, command = match.groups()
+                statements.append(PgbenchStatement(
+                    latency=float(latency),
+                    failures=int(failures) if failures else None,
+                    retries=int(retries) if retries else None,
+                    command=command))
+                continue
+
+            _parse_fields(self, _SUMMARY_RE, line)
+
+        # old versions don't report failures
+        if self.transactions is not None and self.failed_transactions is None:
+            self.failed_transactions = 0
+
+    def percentiles(self, ps=(50, 95, 99, 99.9)):
+        """
+        Return latency percentiles (ms) computed from --log files.
+        """
+
+        if self.histogram is None:
+            raise TestgresException('pgbench has been run without --log')
+
+        return dict((p, v / 1000) for p, v in
+                    self.histogram.percentiles(ps).items())
+
+
+def _parse_fields(obj, regexes, line):
+    # a line might contain several values
+    for name, regex, cast in regexes:
+        match = regex.match(line)
+        if match:
+            setattr(obj, name, cast(match.group(1)))
+
+
+def parse_pgbench_log(path, histogram=None, aggregate=False):
+    """
+    Stream-parse a pgbench log file (without loading it into memory).
+
+    Args:
+        path: path to a log file.
+        histogram: LatencyHistogram to be filled (per-transaction logs).
+        aggregate: is it an aggregated log (--aggregate-interval)?
+
+    Returns:
+        A list of PgbenchInterval for aggregated logs, else None.
+    """
+
+    intervals = [] if aggregate else None
+
+    with io.open(path, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 6:
+                continue
+
+            if aggregate:
+                intervals.append(PgbenchInterval(
+                    start=int(fields[0]),
+                    transactions=int(fields[1]),
+                    latency_sum=int(fields[2]),
+                    latency_sum_sq=int(fields[3]),
+                    latency_min=int(fields[4]),
+                    latency_max=int(fields[5])))
+
+            # skip 'skipped' and 'failed' transactions
+            elif histogram is not None and fields[2].isdigit():
+                histogram.record(int(fields[2]))
+
+    return intervals
+
+
+def pgbench_log_files(prefix):
+    """
+    Find log files of pgbench runs with this prefix ('prefix.pid' and
+    'prefix.pid.thread').
+
+    Returns:
+        A dict of {path: modification time}.
+    """
+
+    files = {}
+    for path in glob.glob(prefix + '.*'):
+        if _LOG_SUFFIX_RE.match(path[len(prefix):]):
+            files[path] = os.path.getmtime(path)
+
+    return files
+
+
+def parse_pgbench_logs(prefix, result, aggregate=False, previous=None):
+    """
+    Parse all log files (one per thread) of a pgbench run into result.
+
+    Args:
+        prefix: log prefix (--log-prefix).
+        result: PgbenchResult to be filled.
+        aggregate: logs contain aggregated intervals.
+        previous: files which existed before the run (see
+            pgbench_log_files()), unless rewritten they are skipped.
+    """
+
+    if not aggregate:
+        result.histogram = LatencyHistogram()
+
+    previous = previous or {}
+    files = pgbench_log_files(prefix)
+
+    for path in sorted(files):
+        if previous.get(path) == files[path]:
+            continue
+
+        intervals = parse_pgbench_log(path, result.histogram, aggregate)
+        if intervals:
+            result.intervals.extend(intervals)
+
+    # intervals of different threads should be ordered
+    result.intervals.sort(key=lambda i: i.start)
+
+    return result
+
+
+def _option_value(options, name):
+    """
+    Find value of a long option ('--name=value' or '--name value').
+    """
+
+    for i, opt in enumerate(options):
+        if opt.startswith(name + '='):
+            return opt.partition('=')[2]
+        if opt == name and i + 1 < len(options):
+            return options[i + 1]
+
+    return None
+
+
+def prepare_log_options(options, log_dir):
+    """
+    Make pgbench write --log files into log_dir (unless there's a prefix).
+
+    Returns:
+        A tuple of (new options, log prefix or None, is it aggregated?).
+    """
+
+    options = list(options)
+
+    if not any(opt in ('-l', '--log') for opt in options):
+        return options, None, False
+
+    aggregate = _option_value(options, '--aggregate-interval') is not None
+
+    prefix = _option_value(options, '--log-prefix')
+    if prefix is None:
+        prefix = os.path.join(log_dir, _LOG_PREFIX)
+        options.append('--log-prefix={}'.format(prefix))
+
+    return options, prefix, aggregate
+
+
+def has_custom_scripts(scripts):
+    """
+    Check if some scripts are SQL text, i.e. need temp files.
+    """
+
+    for item in scripts or []:
+        script = item[0] if isinstance(item, tuple) else item
+        if script not in BUILTIN_SCRIPTS:
+            return True
+
+    return False
+
+
+def prepare_script_options(scripts, script_dir):
+    """
+    Convert custom scripts into pgbench options (-b / -f with weights).
+
+    Args:
+        scripts: list of scripts (or (script, weight) tuples); a script
+            is either a builtin name (e.g. 'select-only') or SQL text.
+        script_dir: where to put temp files with scripts.
+
+    Returns:
+        A list of options.
+    """
+
+    options = []
+
+    for i, item in enumerate(scripts or []):
+        script, weight = item if isinstance(item, tuple) else (item, 1)
+
+        if script in BUILTIN_SCRIPTS:
+            options += ['-b', '{}@{}'.format(script, weight)]
+            continue
+
+        path = os.path.join(script_dir, 'script_{}.sql'.format(i))
+        with io.open(path, 'w') as f:
+            f.write(u'{}\n'.format(script))
+
+        options += ['-f', '{}@{}'.format(path, weight)]
+
+    return options
+
+
+def _short_option_value(options, short, long):
+    for i, opt in enumerate(options):
+        if opt == short and i + 1 < len(options):
+            return options[i + 1]
+        if opt.startswith(short) and opt != short and not opt.startswith('--'):
+            return opt[len(short):]
+
+    return _option_value(options, long)
+
+
+def choose_jobs(options, cpus):
+    """
+    Pick number of pgbench threads (-j) for given options.
+
+    Returns:
+        Number of threads or None if -j should not be added.
+    """
+
+    # already set or not needed (initialization)
+    if _short_option_value(options, '-j', '--jobs') is not None:
+        return None
+    if '-i' in options or '--initialize' in options:
+        return None
+
+    clients = int(_short_option_value(options, '-c', '--client') or 1)
+
+    # old versions want clients to be a multiple of threads
+    jobs = max(min(clients, cpus), 1)
+    while clients % jobs:
+        jobs -= 1
+
+    return jobs
+
+
+def parse_progress(line):
+    """
+    Parse a progress line (-P), return PgbenchProgress or None.
+    """
+
+    match = _PROGRESS_RE.match(line)
+    if not match:
+        return None
+
+    elapsed, tps, latency, stddev, failed = match.groups()
+    lag = _PROGRESS_LAG_RE.search(line)
+
+    return PgbenchProgress(
+        time=float(elapsed),
+        tps=float(tps),
+        latency=float(latency),
+        stddev=float(stddev) if stddev != 'NaN' else None,
+        failed=int(failed) if failed else 0,
+        lag=float(lag.group(1)) if lag else None)
+
+
+class PgbenchProcess(subprocess.Popen):
+    """
+    Running pgbench (a subclass of subprocess.Popen).
+    Temp files (custom scripts) are removed once it's finished
+    (see wait() and poll()).
+    """
+
+    def __init__(self, args, script_dir=None, **kwargs):
+        super(PgbenchProcess, self).__init__(args, **kwargs)
+
+        self._script_dir = script_dir
+        self._output = []
+        self._finished = False
+
+    def _remove_scripts(self):
+        if self._script_dir:
+            shutil.rmtree(self._script_dir, ignore_errors=True)
+            self._script_dir = None
+
+    def wait(self, *args, **kwargs):
+        res = super(PgbenchProcess, self).wait(*args, **kwargs)
+        self._remove_scripts()
+        return res
+
+    def poll(self):
+        res = super(PgbenchProcess, self).poll()
+        if res is not None:
+            self._remove_scripts()
+        return res
+
+    def _lines(self):
+        if self.stdout is None:
+            raise TestgresException('pgbench has been started without pipes')
+
+        # don't use iterator, it reads ahead in Python 2.x
+        for line in iter(self.stdout.readline, b''):
+            yield line.decode('utf-8')
+
+        self._finished = True
+        self.wait()
+
+    def progress(self):
+        """
+        Yield PgbenchProgress samples (-P) as soon as they're printed.
+        Call terminate() to stop pgbench early.
+        """
+
+        for line in self._lines():
+            sample = parse_progress(line)
+            if sample:
+                yield sample
+            else:
+                self._output.append(line)
+
+    def stop(self):
+        """
+        Stop pgbench and wait until it exits.
+        """
+
+        if self.poll() is None:
+            self.terminate()
+
+        self.wait()
+
+        return self
+
+    def result(self):
+        """
+        Wait until pgbench exits and parse its output.
+
+        Returns:
+            An instance of PgbenchResult.
+        """
+
+        if not self._finished:
+            for line in self._lines():
+                if not parse_progress(line):
+                    self._output.append(line)
+
+        return PgbenchResult(u''.join(self._output))
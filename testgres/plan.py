@@ -0,0 +1,242 @@
+# coding: utf-8
+"""
+Query plans (EXPLAIN (FORMAT JSON)) and comparison of their shapes.
+"""
+
+from __future__ import division
+
+import hashlib
+import json
+
+from collections import namedtuple, OrderedDict
+
+from six import string_types
+from six.moves import zip_longest
+
+# properties which define plan's shape (but not costs or row counts)
+_SHAPE_KEYS = [
+    'Node Type',
+    'Parent Relationship',
+    'Relation Name',
+    'Index Name',
+    'Join Type',
+    'Strategy',
+    'Partial Mode',
+    'Scan Direction',
+    'CTE Name',
+    'Function Name',
+    'Subplan Name',
+]
+
+PlanChange = namedtuple('PlanChange', [
+    'path',      # position of a node, e.g. '0.1' (second child of root)
+    'before',    # label of a node in the first plan (or None)
+    'after'      # label of a node in the second plan (or None)
+])
+
+
+def _snake(name):
+    return name.lower().replace(' ', '_')
+
+
+class PlanNode(object):
+    """
+    Node of a plan tree.
+
+    Attributes:
+        node_type: e.g. 'Seq Scan' or 'Hash Join'.
+        relation: name of a scanned relation (or None).
+        index: name of a scanned index (or None).
+        plan_rows: estimated number of rows.
+        actual_rows: rows per loop (ANALYZE only).
+        actual_loops: number of loops (ANALYZE only).
+        actual_time: total time of a loop in ms (ANALYZE + TIMING only).
+        buffers: {'shared_hit_blocks': N, ...} (BUFFERS only).
+        children: list of PlanNodes.
+        raw: original JSON object.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.node_type = raw['Node Type']
+        self.relation = raw.get('Relation Name')
+        self.index = raw.get('Index Name')
+        self.startup_cost = raw.get('Startup Cost')
+        self.total_cost = raw.get('Total Cost')
+        self.plan_rows = raw.get('Plan Rows')
+        self.actual_rows = raw.get('Actual Rows')
+        self.actual_loops = raw.get('Actual Loops')
+        self.actual_time = raw.get('Actual Total Time')
+
+        self.buffers = OrderedDict(
+            (_snake(k), v) for k, v in raw.items() if k.endswith(' Blocks'))
+
+        self.children = [PlanNode(p) for p in raw.get('Plans', [])]
+
+    def __repr__(self):
+        return '<PlanNode "{}">'.format(self.label)
+
+    @property
+    def label(self):
+        """
+        Short description, e.g. 'Index Scan using t_pkey on t'.
+        """
+
+        label = self.node_type
+        if self.raw.get('Join Type') and 'Join' in label:
+            label = '{} {}'.format(self.raw['Join Type'], label)
+        if self.raw.get('Strategy'):
+            label = '{} {}'.format(self.raw['Strategy'], label)
+        if self.index:
+            label += ' using {}'.format(self.index)
+        if self.relation:
+            label += ' on {}'.format(self.relation)
+
+        return label
+
+    @property
+    def row_error(self):
+        """
+        Ratio of actual rows to estimated rows (>= 1), None without ANALYZE.
+        """
+
+        if self.actual_rows is None or not self.actual_loops:
+            return None
+
+        # estimates are per loop too
+        actual = max(self.actual_rows, 1)
+        planned = max(self.plan_rows or 0, 1)
+
+        return max(actual / planned, planned / actual)
+
+    def shape(self):
+        """
+        Return nested lists of shape properties (see _SHAPE_KEYS).
+        """
+
+        props = [self.raw.get(key) for key in _SHAPE_KEYS]
+        return [props, [child.shape() for child in self.children]]
+
+    def walk(self):
+        """
+        Iterate over this node and all its descendants (depth-first).
+        """
+
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+
+class QueryPlan(object):
+    """
+    Parsed output of EXPLAIN (FORMAT JSON).
+
+    Attributes:
+        root: top PlanNode.
+        planning_time: ms (ANALYZE only).
+        execution_time: ms (ANALYZE only).
+        settings: modified planner settings (SETTINGS, PG 12+).
+        raw: original JSON object.
+    """
+
+    def __init__(self, raw):
+        # EXPLAIN returns a list of one element
+        if isinstance(raw, list):
+            raw = raw[0]
+
+        self.raw = raw
+        self.root = PlanNode(raw['Plan'])
+        self.planning_time = raw.get('Planning Time')
+        self.execution_time = raw.get('Execution Time')
+        self.settings = raw.get('Settings', {})
+
+    def __repr__(self):
+        return '<QueryPlan {} {}>'.format(self.fingerprint()[:12],
+                                          self.root.label)
+
+    def __str__(self):
+        lines = []
+
+        def _format(node, depth):
+            line = '  ' * depth + node.label
+            if node.actual_rows is not None:
+                line += ' (rows={} est={} loops={})'.format(
+                    node.actual_rows, node.plan_rows, node.actual_loops)
+            lines.append(line)
+
+            for child in node.children:
+                _format(child, depth + 1)
+
+        _format(self.root, 0)
+        return '\n'.join(lines)
+
+    @classmethod
+    def from_json(cls, data):
+        if isinstance(data, string_types):
+            data = json.loads(data)
+
+        return cls(data)
+
+    def nodes(self):
+        return list(self.root.walk())
+
+    def find(self, node_type):
+        """
+        Return all nodes of a given type (e.g. 'Seq Scan').
+        """
+
+        return [n for n in self.root.walk() if n.node_type == node_type]
+
+    def fingerprint(self):
+        """
+        Return a hash of plan's shape: node types, relations, indexes,
+        join types etc. Costs, row counts and timings are ignored.
+        """
+
+        shape = json.dumps(self.root.shape(), sort_keys=True)
+        return hashlib.sha1(shape.encode('utf-8')).hexdigest()
+
+    def misestimates(self, factor=10):
+        """
+        Return nodes whose actual rows differ from estimates
+        more than factor times (ANALYZE only).
+        """
+
+        return [
+            n for n in self.root.walk()
+            if n.row_error is not None and n.row_error >= factor
+        ]
+
+
+def _diff_nodes(a, b, path, changes):
+    before = a.label if a is not None else None
+    after = b.label if b is not None else None
+
+    if a is None or b is None:
+        changes.append(PlanChange(path, before, after))
+        return
+
+    # parent relationship matters too (e.g. 'Inner' vs 'Outer')
+    if a.shape()[0] != b.shape()[0]:
+        changes.append(PlanChange(path, before, after))
+
+    for i, (x, y) in enumerate(zip_longest(a.children, b.children)):
+        _diff_nodes(x, y, '{}.{}'.format(path, i), changes)
+
+
+def diff_plans(a, b):
+    """
+    Compare shapes of two QueryPlans.
+
+    Returns:
+        A list of PlanChanges (empty if shapes are equal).
+
+    >>> diff_plans(old_plan, new_plan)
+    [PlanChange(path='0', before='Index Scan using t_pkey on t',
+                after='Seq Scan on t')]
+    """
+
+    changes = []
+    _diff_nodes(a.root, b.root, '0', changes)
+    return changes
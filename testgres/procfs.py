@@ -0,0 +1,378 @@
+# coding: utf-8
+"""
+OS-level resource usage of a node's processes (Linux /proc).
+"""
+
+from __future__ import division
+
+import io
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from six import raise_from
+
+from .exceptions import TestgresException
+
+_PROC_DIR = "/proc"
+
+# known values of pg_stat_activity.backend_type (and process titles)
+_BACKEND_TYPES = [
+    'autovacuum launcher',
+    'autovacuum worker',
+    'logical replication launcher',
+    'logical replication worker',
+    'parallel worker',
+    'background writer',
+    'checkpointer',
+    'walwriter',
+    'walsender',
+    'walreceiver',
+    'walsummarizer',
+    'wal writer',
+    'wal sender',
+    'wal receiver',
+    'archiver',
+    'startup',
+    'stats collector',
+    'logger',
+    'io worker',
+    'writer',
+]
+
+# old titles -> backend_type
+_TITLE_ALIASES = {
+    'wal writer': 'walwriter',
+    'wal sender': 'walsender',
+    'wal receiver': 'walreceiver',
+    'writer': 'background writer',
+}
+
+POSTMASTER = 'postmaster'
+CLIENT_BACKEND = 'client backend'
+
+# counters (deltas make sense) vs gauges (current values)
+COUNTERS = [
+    'cpu_user',
+    'cpu_system',
+    'read_bytes',
+    'write_bytes',
+    'voluntary_ctxt_switches',
+    'nonvoluntary_ctxt_switches',
+]
+
+GAUGES = ['processes', 'rss', 'pss', 'open_fds']
+
+
+def _read(path):
+    with io.open(path, 'rb') as f:
+        return f.read().decode('utf-8', 'replace')
+
+
+def _clock_ticks():
+    return os.sysconf('SC_CLK_TCK')
+
+
+def get_children(pid):
+    """
+    Return PIDs of all descendants of a process.
+    """
+
+    parents = {}
+
+    for name in os.listdir(_PROC_DIR):
+        if not name.isdigit():
+            continue
+
+        try:
+            stat = _read(os.path.join(_PROC_DIR, name, 'stat'))
+        except (IOError, OSError):
+            continue    # process has exited
+
+        # comm may contain spaces and parens
+        fields = stat[stat.rfind(')') + 2:].split()
+        parents.setdefault(int(fields[1]), []).append(int(name))
+
+    result = []
+    queue = [pid]
+    while queue:
+        children = parents.get(queue.pop(), [])
+        result.extend(children)
+        queue.extend(children)
+
+    return result
+
+
+def backend_type_from_title(title):
+    """
+    Guess backend_type from process title (e.g. 'postgres: checkpointer').
+    """
+
+    if not title.startswith('postgres:'):
+        return POSTMASTER
+
+    title = title[len('postgres:'):].strip()
+
+    # title might be prefixed with cluster_name
+    for candidate in (title, title.split(': ', 1)[-1]):
+        for backend_type in _BACKEND_TYPES:
+            if candidate.startswith(backend_type):
+                return _TITLE_ALIASES.get(backend_type, backend_type)
+
+    return CLIENT_BACKEND
+
+
+def read_process(pid):
+    """
+    Read resource usage of a single process.
+
+    Returns:
+        An OrderedDict (see COUNTERS and GAUGES), None if process is gone.
+    """
+
+    base = os.path.join(_PROC_DIR, str(pid))
+    ticks = _clock_ticks()
+
+    try:
+        stat = _read(os.path.join(base, 'stat'))
+        status = _read(os.path.join(base, 'status'))
+        cmdline = _read(os.path.join(base, 'cmdline'))
+    except (IOError, OSError):
+        return None
+
+    fields = stat[stat.rfind(')') + 2:].split()
+
+    usage = OrderedDict()
+    usage['pid'] = pid
+    usage['title'] = cmdline.replace('\0', ' ').strip()
+    usage['processes'] = 1
+    usage['cpu_user'] = int(fields[11]) / ticks
+    usage['cpu_system'] = int(fields[12]) / ticks
+    usage['rss'] = 0
+    usage['pss'] = None
+    usage['read_bytes'] = None
+    usage['write_bytes'] = None
+    usage['voluntary_ctxt_switches'] = 0
+    usage['nonvoluntary_ctxt_switches'] = 0
+    usage['open_fds'] = None
+
+    for line in status.splitlines():
+        name, _, value = line.partition(':')
+        if name == 'VmRSS':
+            usage['rss'] = int(value.split()[0]) * 1024
+        elif name in ('voluntary_ctxt_switches',
+                      'nonvoluntary_ctxt_switches'):
+            usage[name] = int(value)
+
+    # the following files might be unavailable
+    try:
+        for line in _read(os.path.join(base, 'smaps_rollup')).splitlines():
+            if line.startswith('Pss:'):
+                usage['pss'] = int(line.split()[1]) * 1024
+                break
+    except (IOError, OSError):
+        pass
+
+    try:
+        for line in _read(os.path.join(base, 'io')).splitlines():
+            name, _, value = line.partition(':')
+            if name in ('read_bytes', 'write_bytes'):
+                usage[name] = int(value)
+    except (IOError, OSError):
+        pass
+
+    try:
+        usage['open_fds'] = len(os.listdir(os.path.join(base, 'fd')))
+    except (IOError, OSError):
+        pass
+
+    return usage
+
+
+def _add(total, usage):
+    for name in COUNTERS + GAUGES:
+        value = usage.get(name)
+        if value is not None:
+            total[name] = (total.get(name) or 0) + value
+
+
+def _empty():
+    return OrderedDict((name, None) for name in GAUGES + COUNTERS)
+
+
+class ResourceUsage(object):
+    """
+    Resource usage of postmaster and its children.
+
+    Attributes:
+        time: unix timestamp.
+        processes: list of per-process OrderedDicts (see read_process()).
+        total: sum over all processes.
+        by_backend_type: {backend_type: sum over processes}.
+
+    Memory is measured in bytes, CPU time in seconds. Sum of RSS
+    counts shared buffers many times, prefer PSS (Linux 4.14+).
+    """
+
+    def __init__(self, processes, backend_types=None):
+        self.time = time.time()
+        self.processes = processes
+        self.total = _empty()
+        self.by_backend_type = OrderedDict()
+
+        backend_types = backend_types or {}
+
+        for usage in processes:
+            backend_type = backend_types.get(usage['pid']) or \
+                backend_type_from_title(usage['title'])
+            usage['backend_type'] = backend_type
+
+            _add(self.total, usage)
+            _add(self.by_backend_type.setdefault(backend_type, _empty()),
+                 usage)
+
+    def __repr__(self):
+        return '<ResourceUsage processes={} cpu={:.2f}s rss={}>'.format(
+            self.total['processes'],
+            (self.total['cpu_user'] or 0) + (self.total['cpu_system'] or 0),
+            self.total['rss'])
+
+    def __sub__(self, other):
+        return ResourceDelta(other, self)
+
+    @classmethod
+    def collect(cls, pid, backend_types=None):
+        """
+        Read usage of a process (postmaster) and all its descendants.
+
+        Args:
+            pid: PID of postmaster.
+            backend_types: {pid: backend_type} (e.g. from pg_stat_activity).
+        """
+
+        if not os.path.isdir(_PROC_DIR):
+            raise TestgresException('{} is not available'.format(_PROC_DIR))
+
+        processes = []
+        for p in [pid] + get_children(pid):
+            usage = read_process(p)
+            if usage is not None:
+                processes.append(usage)
+
+        return cls(processes, backend_types)
+
+
+def _diff(old, new):
+    result = OrderedDict()
+
+    for name in GAUGES:
+        result[name] = new.get(name)
+
+    for name in COUNTERS:
+        a, b = old.get(name), new.get(name)
+        result[name] = b - (a or 0) if b is not None else None
+
+    return result
+
+
+class ResourceDelta(object):
+    """
+    Difference between two ResourceUsages: counters are subtracted,
+    gauges (rss, pss, open_fds, processes) show the latest values.
+    NOTE: counters of processes which have exited are lost.
+    """
+
+    def __init__(self, before, after):
+        self.duration = after.time - before.time
+        self.total = _diff(before.total, after.total)
+        self.by_backend_type = OrderedDict(
+            (backend_type, _diff(before.by_backend_type.get(backend_type, {}),
+                                 usage))
+            for backend_type, usage in after.by_backend_type.items())
+
+
+class ResourceMonitor(threading.Thread):
+    """
+    Background thread which samples resource usage of a node via /proc.
+    """
+
+    def __init__(self, node, interval=1.0):
+        """
+        Create a new monitor (call start() to run it).
+
+        Args:
+            node: PostgresNode to be monitored.
+            interval: time between samples (seconds).
+        """
+
+        super(ResourceMonitor, self).__init__()
+        self.daemon = True
+
+        self.node = node
+        self.interval = interval
+        self.samples = []
+        self.error = None
+
+        self._stop_event = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def run(self):
+        try:
+            # postmaster's pid won't change
+            pid = self.node.get_pid()
+            if not pid:
+                raise TestgresException('Node is not running')
+
+            while True:
+                self.samples.append(ResourceUsage.collect(pid))
+                if self._stop_event.wait(self.interval):
+                    break
+
+            self.samples.append(ResourceUsage.collect(pid))
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        """
+        Stop sampling and wait for the thread.
+
+        Returns:
+            ResourceDelta between the first and the last samples.
+        """
+
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+        if self.error is not None:
+            raise_from(TestgresException('Monitor has failed'), self.error)
+
+        return self.delta()
+
+    def delta(self):
+        if len(self.samples) < 2:
+            return None
+
+        return self.samples[-1] - self.samples[0]
+
+    def peak(self, name='pss', backend_type=None):
+        """
+        Return max value of a gauge (e.g. 'rss') over all samples.
+        """
+
+        values = []
+        for sample in self.samples:
+            usage = sample.total if backend_type is None \
+                else sample.by_backend_type.get(backend_type, {})
+            if usage.get(name) is not None:
+                values.append(usage[name])
+
+        return max(values) if values else None
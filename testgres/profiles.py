@@ -0,0 +1,199 @@
+# coding: utf-8
+"""
+Configuration profiles for default_conf().
+
+Each profile is a function which takes HostResources, number of nodes
+sharing this host and a few node properties, and returns an OrderedDict
+of settings.
+"""
+
+from collections import OrderedDict
+
+from .consts import \
+    PROFILE_FAST_EPHEMERAL, \
+    PROFILE_BENCHMARK, \
+    PROFILE_DENSE
+
+from .exceptions import TestgresException
+
+from .resources import get_host_resources
+
+from .utils import pg_version_ge as _pg_version_ge
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+
+def format_size(size):
+    """
+    Convert size in bytes into a postgresql.conf value (e.g. '64MB').
+    """
+
+    if size % GB == 0:
+        return '{}GB'.format(size // GB)
+
+    if size % MB == 0:
+        return '{}MB'.format(size // MB)
+
+    return '{}kB'.format(max(size // KB, 1))
+
+
+def _clamp(value, lo, hi):
+    return int(max(lo, min(value, hi)))
+
+
+def _round_mb(size):
+    return max(size // MB, 1) * MB
+
+
+def _wal_settings(conf, allow_streaming):
+    # minimal WAL is only possible without replication
+    if not allow_streaming:
+        conf['wal_level'] = 'minimal'
+        conf['max_wal_senders'] = 0
+        conf['archive_mode'] = 'off'
+
+
+def _quiet_logging(conf):
+    conf['log_statement'] = 'none'
+    conf['log_min_duration_statement'] = -1
+    conf['log_checkpoints'] = 'off'
+    conf['log_autovacuum_min_duration'] = -1
+
+
+def fast_ephemeral(resources, nodes, allow_streaming):
+    """
+    Durability is not important, everything should be as fast as possible.
+    """
+
+    memory = resources.memory // nodes
+
+    conf = OrderedDict()
+    conf['fsync'] = 'off'
+    conf['synchronous_commit'] = 'off'
+    conf['full_page_writes'] = 'off'
+    conf['shared_buffers'] = format_size(
+        _round_mb(_clamp(memory // 16, 16 * MB, 256 * MB)))
+
+    # avoid checkpoints as long as possible
+    conf['checkpoint_timeout'] = '1h'
+    if _pg_version_ge('9.5'):
+        conf['max_wal_size'] = format_size(
+            _round_mb(_clamp(memory // 8, 64 * MB, 4 * GB)))
+
+    _wal_settings(conf, allow_streaming)
+    _quiet_logging(conf)
+
+    return conf
+
+
+def benchmark(resources, nodes, allow_streaming):
+    """
+    Make the most of host's resources (statement logging is disabled).
+    """
+
+    memory = resources.memory // nodes
+    cpus = max(resources.cpus // nodes, 1)
+    max_connections = 100    # default
+
+    conf = OrderedDict()
+    conf['max_connections'] = max_connections
+    conf['shared_buffers'] = format_size(
+        _round_mb(_clamp(memory // 4, 32 * MB, 16 * GB)))
+    conf['effective_cache_size'] = format_size(
+        _round_mb(_clamp(memory * 3 // 4, 64 * MB, 64 * GB)))
+    conf['work_mem'] = format_size(
+        _round_mb(_clamp(memory // 4 // max_connections, 4 * MB, 256 * MB)))
+    conf['maintenance_work_mem'] = format_size(
+        _round_mb(_clamp(memory // 16, 64 * MB, 2 * GB)))
+
+    conf['checkpoint_completion_target'] = 0.9
+    if _pg_version_ge('9.5'):
+        conf['max_wal_size'] = format_size(
+            _round_mb(_clamp(memory // 4, 1 * GB, 16 * GB)))
+
+    # parallelism should match CPUs of this node
+    conf['max_worker_processes'] = max(cpus, 8)
+    if _pg_version_ge('9.6'):
+        conf['max_parallel_workers_per_gather'] = _clamp(cpus // 2, 0, 8)
+    if _pg_version_ge('10'):
+        conf['max_parallel_workers'] = cpus
+
+    _quiet_logging(conf)
+
+    return conf
+
+
+def dense(resources, nodes, allow_streaming):
+    """
+    Tiny footprint for running hundreds of nodes.
+    """
+
+    memory = resources.memory // nodes
+    cpus = max(resources.cpus // nodes, 1)
+
+    # a connection per 16MB of this node's share of memory
+    max_connections = _clamp(memory // (16 * MB), 5, 20)
+
+    conf = OrderedDict()
+    conf['max_connections'] = max_connections
+    conf['superuser_reserved_connections'] = 1
+    conf['shared_buffers'] = format_size(
+        _round_mb(_clamp(memory // 64, 2 * MB, 32 * MB)))
+    conf['temp_buffers'] = '800kB'
+    conf['work_mem'] = format_size(
+        _round_mb(_clamp(memory // 8 // max_connections, 1 * MB, 4 * MB)))
+    conf['max_worker_processes'] = _clamp(cpus, 2, 4)
+    conf['autovacuum_max_workers'] = 1
+    conf['max_locks_per_transaction'] = 32
+    conf['max_prepared_transactions'] = 0
+
+    if _pg_version_ge('9.5'):
+        conf['min_wal_size'] = '32MB'
+        conf['max_wal_size'] = '64MB'
+    if _pg_version_ge('9.6'):
+        conf['max_parallel_workers_per_gather'] = 0
+
+    if allow_streaming:
+        conf['max_wal_senders'] = 2
+    else:
+        _wal_settings(conf, allow_streaming)
+
+    _quiet_logging(conf)
+
+    return conf
+
+
+# yapf: disable
+_profiles = {
+    PROFILE_FAST_EPHEMERAL: fast_ephemeral,
+    PROFILE_BENCHMARK: benchmark,
+    PROFILE_DENSE: dense
+}
+
+
+def get_profile_settings(profile,
+                         nodes=1,
+                         allow_streaming=False,
+                         resources=None):
+    """
+    Compute settings of a configuration profile.
+
+    Args:
+        profile: name of the profile (e.g. 'fast-ephemeral').
+        nodes: how many nodes are going to share this host?
+        allow_streaming: will this node be used for replication?
+        resources: HostResources (detected automatically by default).
+
+    Returns:
+        An OrderedDict of settings.
+    """
+
+    if profile not in _profiles:
+        raise TestgresException('Unknown config profile "{}"'.format(profile))
+
+    resources = resources or get_host_resources()
+    nodes = max(nodes or 1, 1)
+
+    return _profiles[profile](resources, nodes, allow_streaming)
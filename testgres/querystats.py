@@ -0,0 +1,216 @@
+# coding: utf-8
+"""
+Client-side latency statistics of queries (see NodeConnection).
+
+Queries are grouped by normalized text (literals are replaced with '?'),
+latencies are kept in LatencyHistograms (microseconds).
+"""
+
+from __future__ import division
+
+import re
+import threading
+
+from collections import OrderedDict
+
+from .histogram import LatencyHistogram
+
+# yapf: disable
+_NORMALIZE_RES = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),                     # strings
+    (re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?(?:e-?\d+)?\b",
+                re.IGNORECASE), "?"),                         # numbers
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),  # IN lists
+    (re.compile(r"\s+"), " "),                                # whitespace
+]
+
+# don't let cache of normalized queries grow infinitely
+_NORMALIZE_CACHE_SIZE = 4096
+_normalize_cache = {}
+
+
+def normalize_query(query):
+    """
+    Replace literals with '?', collapse whitespace.
+
+    >>> normalize_query("select * from t where id in (1, 2) and s = 'x'")
+    'select * from t where id in (?, ...) and s = ?'
+    """
+
+    result = _normalize_cache.get(query)
+    if result is not None:
+        return result
+
+    result = query
+    for regex, repl in _NORMALIZE_RES:
+        result = regex.sub(repl, result)
+    result = result.strip().rstrip(';').rstrip()
+
+    if len(_normalize_cache) >= _NORMALIZE_CACHE_SIZE:
+        _normalize_cache.clear()
+    _normalize_cache[query] = result
+
+    return result
+
+
+class QueryStats(object):
+    """
+    Statistics of a normalized query.
+
+    Attributes:
+        count: number of executions.
+        rows: number of rows returned.
+        total: LatencyHistogram of total time, including fetch (us).
+
+    Time to the first row isn't recorded: both drivers receive the whole
+    result in cursor.execute(), so it can't be told apart on the client.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.count = 0
+        self.rows = 0
+        self.total = LatencyHistogram()
+
+    def __repr__(self):
+        return '<QueryStats "{}" count={} p99={}us>'.format(
+            self.query, self.count, self.total.percentile(99))
+
+    def record(self, total, rows):
+        """
+        Add an execution (duration is measured in seconds).
+        """
+
+        self.count += 1
+        self.rows += rows
+        self.total.record(total * 1e6)
+
+    def merge(self, other):
+        self.count += other.count
+        self.rows += other.rows
+        self.total.merge(other.total)
+
+        return self
+
+    def percentiles(self, ps=(50, 95, 99)):
+        """
+        Return total latency percentiles (ms).
+        """
+
+        return dict((p, v / 1000) for p, v in
+                    self.total.percentiles(ps).items())
+
+    def to_dict(self):
+        return OrderedDict([
+            ('query', self.query),
+            ('count', self.count),
+            ('rows', self.rows),
+            ('total', self.total.to_dict()),
+        ])
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['query'])
+        stats.count = data['count']
+        stats.rows = data['rows']
+        stats.total = LatencyHistogram.from_dict(data['total'])
+
+        return stats
+
+
+class QueryStatsCollector(object):
+    """
+    Thread-safe collection of QueryStats, may be shared by connections.
+
+    >>> stats = node.enable_query_stats()
+    >>> node.execute('postgres', 'select 1')
+    >>> stats['select ?'].percentiles()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+
+    def __getitem__(self, query):
+        return self._stats[query]
+
+    def __contains__(self, query):
+        return query in self._stats
+
+    def __iter__(self):
+        return iter(list(self._stats.values()))
+
+    def __len__(self):
+        return len(self._stats)
+
+    def __add__(self, other):
+        result = QueryStatsCollector()
+        result.merge(self)
+        result.merge(other)
+        return result
+
+    def _get(self, query):
+        stats = self._stats.get(query)
+        if stats is None:
+            stats = self._stats[query] = QueryStats(query)
+        return stats
+
+    def record(self, query, total, rows):
+        """
+        Add an execution of a query (duration is measured in seconds).
+        """
+
+        query = normalize_query(query)
+
+        with self._lock:
+            self._get(query).record(total, rows)
+
+    def merge(self, other):
+        """
+        Add all statistics of another collector.
+        """
+
+        with self._lock:
+            for stats in other:
+                self._get(stats.query).merge(stats)
+
+        return self
+
+    def reset(self):
+        with self._lock:
+            self._stats = OrderedDict()
+
+    def diff(self, baseline, ps=(50, 95, 99)):
+        """
+        Compare latencies with another (e.g. previous) run.
+
+        Returns:
+            An OrderedDict {query: {p: (baseline ms, current ms)}}
+            for queries present in both collectors.
+        """
+
+        result = OrderedDict()
+
+        for stats in self:
+            if stats.query not in baseline:
+                continue
+
+            old = baseline[stats.query].percentiles(ps)
+            new = stats.percentiles(ps)
+            result[stats.query] = OrderedDict(
+                (p, (old[p], new[p])) for p in ps)
+
+        return result
+
+    def to_dict(self):
+        with self._lock:
+            return [s.to_dict() for s in self._stats.values()]
+
+    @classmethod
+    def from_dict(cls, data):
+        collector = cls()
+        for item in data:
+            stats = QueryStats.from_dict(item)
+            collector._stats[stats.query] = stats
+
+        return collector
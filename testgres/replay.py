@@ -0,0 +1,439 @@
+# coding: utf-8
+"""
+Capture of statements from server logs and their replay on another node.
+
+Statements are logged by log_statement = 'all' (see default_conf())
+and/or log_min_duration_statement = 0 (which gives original durations).
+Both stderr (log_line_prefix with %m and %p) and csvlog formats are
+understood.
+"""
+
+from __future__ import division
+
+import csv
+import datetime
+import io
+import json
+import re
+import threading
+import time
+
+from collections import namedtuple, OrderedDict
+
+from six import string_types
+
+from .connection import close_quietly as _close_quietly
+from .histogram import LatencyHistogram
+from .querystats import QueryStatsCollector
+
+CapturedStatement = namedtuple('CapturedStatement', [
+    'time',        # seconds since epoch (in server's timezone)
+    'query',       # query text, parameters are substituted
+    'duration'     # original duration, ms (None if unknown)
+])
+
+# e.g. "2024-01-01 00:00:00.123 UTC [42] LOG:  statement: select 1"
+_STDERR_RE = re.compile(
+    r'^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?)(?: \S+)? '
+    r'\[(?P<pid>\d+)[^\]]*\] .*?(?P<severity>[A-Z]+):  (?P<message>.*)$')
+
+_STATEMENT_RE = re.compile(
+    r'^(?:duration: (?P<duration>\d+(?:\.\d+)?) ms  )?'
+    r'(?P<kind>statement|execute [^:]+): (?P<query>.*)$', re.DOTALL)
+
+# logged if the statement has been logged by log_statement
+_BARE_DURATION_RE = re.compile(r'^duration: (?P<duration>\d+(?:\.\d+)?) ms$')
+
+_PARAM_RE = re.compile(r"\$(\d+) = ('(?:[^']|'')*'|NULL)")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# columns of csvlog
+_CSV_TIME = 0
+_CSV_USER = 1
+_CSV_DATABASE = 2
+_CSV_SESSION = 5
+_CSV_SEVERITY = 11
+_CSV_MESSAGE = 13
+_CSV_DETAIL = 14
+
+
+def _parse_time(text):
+    # timezone is the same for all lines, so it's ignored
+    text = ' '.join(text.split()[:2])
+    fmt = '%Y-%m-%d %H:%M:%S.%f' if '.' in text else '%Y-%m-%d %H:%M:%S'
+    dt = datetime.datetime.strptime(text, fmt)
+    return (dt - _EPOCH).total_seconds()
+
+
+def _substitute(query, detail):
+    """
+    Replace $N with parameters from 'parameters: $1 = '...', ...' detail.
+    """
+
+    params = dict((int(n), value) for n, value in _PARAM_RE.findall(detail))
+    if not params:
+        return query
+
+    def repl(m):
+        return params.get(int(m.group(1)), m.group(0))
+
+    # $1 shouldn't match $10
+    return re.sub(r'\$(\d+)(?!\d)', repl, query)
+
+
+class CapturedSession(object):
+    """
+    Statements of a single session in original order.
+    """
+
+    def __init__(self, session_id, dbname=None, username=None):
+        self.session_id = session_id
+        self.dbname = dbname
+        self.username = username
+        self.statements = []
+
+    def __repr__(self):
+        return '<CapturedSession {} statements={}>'.format(
+            self.session_id, len(self.statements))
+
+    def _add(self, time, message, detail=None):
+        m = _BARE_DURATION_RE.match(message)
+        if m:
+            # duration of the last statement logged by log_statement
+            if self.statements and self.statements[-1].duration is None:
+                duration = float(m.group('duration'))
+                self.statements[-1] = \
+                    self.statements[-1]._replace(duration=duration)
+                return True
+            return False
+
+        m = _STATEMENT_RE.match(message)
+        if not m:
+            return False
+
+        query = m.group('query')
+        if m.group('kind') != 'statement' and detail:
+            query = _substitute(query, detail)
+
+        duration = m.group('duration')
+        if duration is not None:
+            duration = float(duration)
+
+            # duration is logged after statement has finished
+            time -= duration / 1000
+
+        self.statements.append(CapturedStatement(time, query, duration))
+        return True
+
+
+class CapturedWorkload(object):
+    """
+    Per-session statement streams parsed from server logs.
+
+    >>> with node.capture_workload() as captured:
+    ...     run_tests(node)
+    >>> captured.replay(other_node, speed=2).diff(captured)
+    """
+
+    def __init__(self, sessions=None):
+        self.sessions = sessions or []
+
+    def __repr__(self):
+        return '<CapturedWorkload sessions={} statements={}>'.format(
+            len(self.sessions), self.statement_count)
+
+    @property
+    def statement_count(self):
+        return sum(len(s.statements) for s in self.sessions)
+
+    @property
+    def start_time(self):
+        times = [s.statements[0].time for s in self.sessions if s.statements]
+        return min(times) if times else None
+
+    @property
+    def duration(self):
+        """
+        Time between the first and the last statements (seconds).
+        """
+
+        times = [s.statements[-1].time for s in self.sessions if s.statements]
+        return max(times) - self.start_time if times else 0
+
+    @classmethod
+    def from_log(cls, text):
+        """
+        Parse stderr log (log_line_prefix should contain %m and %p).
+        """
+
+        sessions = OrderedDict()
+        last = None    # (session, time, message lines)
+
+        def flush(item, detail=None):
+            session, t, lines = item
+            session._add(t, '\n'.join(lines), detail)
+
+        for line in text.splitlines():
+            # message continues on lines starting with tab
+            if line.startswith('\t'):
+                if last is not None:
+                    last[2].append(line[1:])
+                continue
+
+            m = _STDERR_RE.match(line)
+            if not m:
+                continue
+
+            pid = int(m.group('pid'))
+
+            # parameters of extended protocol's execute
+            if m.group('severity') == 'DETAIL' and last is not None:
+                if last[0].session_id == pid:
+                    flush(last, m.group('message'))
+                    last = None
+                continue
+
+            if last is not None:
+                flush(last)
+                last = None
+
+            if m.group('severity') != 'LOG':
+                continue
+
+            session = sessions.get(pid)
+            if session is None:
+                session = sessions[pid] = CapturedSession(pid)
+
+            last = (session, _parse_time(m.group('time')),
+                    [m.group('message')])
+
+        if last is not None:
+            flush(last)
+
+        return cls([s for s in sessions.values() if s.statements])
+
+    @classmethod
+    def from_csvlog(cls, paths):
+        """
+        Parse csvlog file(s) (log_destination = 'csvlog').
+        """
+
+        if isinstance(paths, string_types):
+            paths = [paths]
+
+        sessions = OrderedDict()
+
+        for path in paths:
+            with open(path) as f:
+                for row in csv.reader(f):
+                    if len(row) <= _CSV_DETAIL:
+                        continue
+
+                    if row[_CSV_SEVERITY] != 'LOG':
+                        continue
+
+                    key = row[_CSV_SESSION]
+                    session = sessions.get(key)
+                    if session is None:
+                        session = sessions[key] = CapturedSession(
+                            key,
+                            dbname=row[_CSV_DATABASE] or None,
+                            username=row[_CSV_USER] or None)
+
+                    session._add(_parse_time(row[_CSV_TIME]),
+                                 row[_CSV_MESSAGE],
+                                 row[_CSV_DETAIL])
+
+        return cls([s for s in sessions.values() if s.statements])
+
+    def filter(self, predicate):
+        """
+        Return a copy with statements for which predicate(query) is true.
+        """
+
+        sessions = []
+        for s in self.sessions:
+            copy = CapturedSession(s.session_id, s.dbname, s.username)
+            copy.statements = [st for st in s.statements if predicate(st.query)]
+            if copy.statements:
+                sessions.append(copy)
+
+        return CapturedWorkload(sessions)
+
+    def query_stats(self):
+        """
+        Return original latencies (QueryStatsCollector), only statements
+        logged with durations are taken into account.
+        """
+
+        collector = QueryStatsCollector()
+
+        for session in self.sessions:
+            for st in session.statements:
+                if st.duration is not None:
+                    seconds = st.duration / 1000
+                    collector.record(st.query, seconds, 0)
+
+        return collector
+
+    def to_dict(self):
+        return [
+            OrderedDict([
+                ('session_id', s.session_id),
+                ('dbname', s.dbname),
+                ('username', s.username),
+                ('statements', [list(st) for st in s.statements]),
+            ]) for s in self.sessions
+        ]
+
+    @classmethod
+    def from_dict(cls, data):
+        sessions = []
+        for item in data:
+            s = CapturedSession(item['session_id'], item['dbname'],
+                                item['username'])
+            s.statements = [CapturedStatement(*st) for st in item['statements']]
+            sessions.append(s)
+
+        return cls(sessions)
+
+    def save(self, path):
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.to_dict(), ensure_ascii=False))
+
+        return self
+
+    @classmethod
+    def load(cls, path):
+        with io.open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def replay(self, node, speed=1.0, dbname=None, username=None):
+        """
+        Re-issue statements, one connection per original session
+        (in autocommit mode, so logged BEGIN/COMMIT work as before).
+
+        Args:
+            node: PostgresNode to replay the workload on.
+            speed: 1.0 = original timing, 2.0 = twice as fast,
+                None = as fast as possible.
+            dbname: override database names of sessions.
+            username: override user names of sessions.
+
+        Returns:
+            An instance of ReplayResult.
+        """
+
+        result = ReplayResult(len(self.sessions))
+        origin = self.start_time
+
+        # connect first, so that sessions start in time
+        cons = []
+        try:
+            for session in self.sessions:
+                con = node.connect(dbname or session.dbname or 'postgres',
+                                   username or session.username)
+                con.connection.autocommit = True
+                cons.append(con)
+
+            started = time.time()
+
+            threads = [
+                threading.Thread(target=self._replay_session,
+                                 args=(con, session, result, started,
+                                       origin, speed))
+                for con, session in zip(cons, self.sessions)
+            ]
+
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            result.duration = time.time() - started
+        finally:
+            for con in cons:
+                _close_quietly(con)
+
+        return result
+
+    @staticmethod
+    def _replay_session(con, session, result, started, origin, speed):
+        for st in session.statements:
+            lag = 0
+            if speed:
+                scheduled = started + (st.time - origin) / speed
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag = -delay
+
+            error = None
+            rows = 0
+            begin = time.time()
+            try:
+                # don't use NodeConnection.execute(): no args, no '%' escaping
+                con.cursor.execute(st.query)
+                if con.cursor.description is not None:
+                    rows = len(con.cursor.fetchall())
+            except Exception as e:
+                error = type(e).__name__
+
+            result._record(st.query, time.time() - begin, rows, lag, error)
+
+
+class ReplayResult(object):
+    """
+    Results of CapturedWorkload.replay().
+
+    Attributes:
+        query_stats: QueryStatsCollector of replayed statements.
+        errors: {exception class name: count}.
+        lag: LatencyHistogram of delays after original timing (us).
+        duration: total time of replay (seconds).
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.query_stats = QueryStatsCollector()
+        self.errors = OrderedDict()
+        self.lag = LatencyHistogram()
+        self.duration = None
+
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<ReplayResult sessions={} statements={} errors={}>'.format(
+            self.sessions, self.statement_count, sum(self.errors.values()))
+
+    @property
+    def statement_count(self):
+        return sum(s.count for s in self.query_stats)
+
+    def _record(self, query, duration, rows, lag, error):
+        if error is not None:
+            with self._lock:
+                self.errors[error] = self.errors.get(error, 0) + 1
+        else:
+            self.query_stats.record(query, duration, rows)
+
+        with self._lock:
+            self.lag.record(lag * 1e6)
+
+    def diff(self, baseline, ps=(50, 95, 99)):
+        """
+        Compare latencies with a baseline: another ReplayResult,
+        CapturedWorkload (original durations) or QueryStatsCollector.
+
+        Returns:
+            An OrderedDict {query: {p: (baseline ms, current ms)}}.
+        """
+
+        if isinstance(baseline, CapturedWorkload):
+            baseline = baseline.query_stats()
+        elif isinstance(baseline, ReplayResult):
+            baseline = baseline.query_stats
+
+        return self.query_stats.diff(baseline, ps)
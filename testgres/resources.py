@@ -0,0 +1,233 @@
+# coding: utf-8
+
+import ctypes
+import io
+import multiprocessing
+import os
+import platform
+import sys
+
+from collections import namedtuple
+
+from .exceptions import TestgresException
+
+# cgroup memory limits (v2 and v1)
+_CGROUP_MEMORY_LIMITS = [
+    "/sys/fs/cgroup/memory.max",
+    "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+]
+
+# I/O scheduling classes (IOPRIO_CLASS_RT, _BE, _IDLE)
+_IOPRIO_CLASSES = ['realtime', 'best-effort', 'idle']
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_DEFAULT_LEVEL = 4
+
+# glibc has no wrapper of ioprio_set(), so it's called by number
+_IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'riscv64': 30,
+    'armv7l': 314,
+    'ppc64': 273,
+    'ppc64le': 273,
+    's390x': 282,
+}
+
+HostResources = namedtuple('HostResources', ['cpus', 'memory'])
+
+# CPUs of a node and its load generator (e.g. pgbench)
+CpuSet = namedtuple('CpuSet', ['server', 'client'])
+
+
+def _cgroup_memory_limit():
+    for path in _CGROUP_MEMORY_LIMITS:
+        try:
+            with io.open(path, 'r') as f:
+                value = f.read().strip()
+        except (IOError, OSError):
+            continue
+
+        # 'max' means no limit
+        if value.isdigit():
+            return int(value)
+
+    return None
+
+
+def get_cpu_count():
+    """
+    Return number of CPUs available to this process.
+    """
+
+    # respect affinity mask (python 3.3+)
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+
+    return multiprocessing.cpu_count()
+
+
+def get_cpu_list():
+    """
+    Return sorted list of CPUs (ids) available to this process.
+    """
+
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+
+    return list(range(multiprocessing.cpu_count()))
+
+
+def _split_cpus(count, cpus=None):
+    """
+    Split CPUs into 'count' disjoint sets of equal size.
+    Leftover CPUs are not used; returns None if there are too few CPUs.
+    """
+
+    cpus = cpus if cpus is not None else get_cpu_list()
+    size = len(cpus) // count
+
+    if size == 0:
+        return None
+
+    return [set(cpus[i * size:(i + 1) * size]) for i in range(count)]
+
+
+def split_cpus(nodes, clients=True, client_share=0.25, cpus=None):
+    """
+    Split CPUs into disjoint sets for several nodes and their clients.
+
+    Args:
+        nodes: number of nodes.
+        clients: reserve CPUs for load generators (pgbench)?
+        client_share: fraction of node's CPUs given to its clients.
+        cpus: list of CPUs to be split (available CPUs by default).
+
+    Returns:
+        A list of CpuSet(server, client), client is None if not clients.
+    """
+
+    parts = _split_cpus(nodes, cpus)
+    if parts is None:
+        raise TestgresException('Not enough CPUs for {} nodes'.format(nodes))
+
+    result = []
+    for part in parts:
+        part = sorted(part)
+
+        if not clients:
+            result.append(CpuSet(server=set(part), client=None))
+            continue
+
+        if len(part) < 2:
+            raise TestgresException('Not enough CPUs for nodes and clients')
+
+        n_client = max(int(round(len(part) * client_share)), 1)
+        n_client = min(n_client, len(part) - 1)
+
+        result.append(CpuSet(server=set(part[:-n_client]),
+                             client=set(part[-n_client:])))
+
+    return result
+
+
+def _ioprio_setter(ionice):
+    """
+    Return a function which sets I/O priority of the current process.
+    """
+
+    io_class, level = ionice if isinstance(ionice, tuple) else (ionice, None)
+
+    if io_class not in _IOPRIO_CLASSES:
+        raise TestgresException('Unknown I/O class "{}"'.format(io_class))
+
+    number = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if not sys.platform.startswith('linux') or number is None:
+        raise TestgresException('I/O priority is not supported')
+
+    if level is None:
+        level = 0 if io_class == 'idle' else _IOPRIO_DEFAULT_LEVEL
+
+    value = (_IOPRIO_CLASSES.index(io_class) + 1) << _IOPRIO_CLASS_SHIFT
+    value |= int(level)
+
+    # load libc here, child process should only make the call
+    syscall = ctypes.CDLL(None, use_errno=True).syscall
+
+    def set_ioprio():
+        if syscall(number, _IOPRIO_WHO_PROCESS, 0, value) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    return set_ioprio
+
+
+def isolate_command(args, cpus=None, nice=None, ionice=None):
+    """
+    Prepare a command to be run on given CPUs with lower priority.
+    Children (e.g. postmaster started by pg_ctl) inherit all of these.
+
+    Priorities are set by preexec_fn of subprocess.Popen, which isn't
+    safe if other threads may hold locks during fork(), so don't use
+    cpus, nice or ionice for nodes started from several threads.
+
+    Args:
+        args: utility + arguments (list).
+        cpus: set of CPUs (sched_setaffinity).
+        nice: niceness increment.
+        ionice: I/O scheduling class ('realtime' | 'best-effort' | 'idle'),
+            optionally (class, level) tuple (Linux ioprio_set).
+
+    Returns:
+        A tuple of (args, preexec_fn) for subprocess.Popen.
+    """
+
+    args = list(args)
+
+    if cpus is None and not nice and ionice is None:
+        return args, None
+
+    if cpus is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            raise TestgresException('CPU affinity is not supported')
+        cpus = set(cpus)
+
+    set_ioprio = _ioprio_setter(ionice) if ionice is not None else None
+
+    def preexec_fn():
+        if cpus is not None:
+            os.sched_setaffinity(0, cpus)
+        if nice:
+            os.nice(nice)
+        if set_ioprio is not None:
+            set_ioprio()
+
+    return args, preexec_fn
+
+
+def get_total_memory():
+    """
+    Return amount of memory (bytes) available to this host or container.
+    """
+
+    memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+    # containers might be limited even further
+    limit = _cgroup_memory_limit()
+    if limit is not None:
+        memory = min(memory, limit)
+
+    return memory
+
+
+def get_host_resources():
+    """
+    Detect resources of this host.
+
+    Returns:
+        HostResources(cpus, memory), memory is measured in bytes.
+    """
+
+    return HostResources(cpus=get_cpu_count(), memory=get_total_memory())
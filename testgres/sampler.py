@@ -0,0 +1,227 @@
+# coding: utf-8
+"""
+Sampling profiler of backends' wait events (pg_stat_activity).
+"""
+
+from __future__ import division
+
+import array
+import threading
+import time
+
+from collections import OrderedDict
+from six import raise_from
+
+from .exceptions import TestgresException
+from .querystats import normalize_query
+from .utils import pg_version_ge as _pg_version_ge
+
+# label of active backends which don't wait for anything
+CPU_EVENT = 'CPU'
+
+_PREPARE_QUERY = """
+prepare testgres_sample as
+select wait_event_type, wait_event, query
+from pg_stat_activity
+where pid <> pg_backend_pid() and state is distinct from 'idle' {}
+"""
+
+# only client backends should be sampled by default
+_CLIENT_BACKENDS = "and backend_type = 'client backend'"
+
+
+class WaitEventProfile(object):
+    """
+    Summary of samples: {(wait_event_type, wait_event, query): count}.
+    """
+
+    def __init__(self, counts, samples, duration):
+        self.counts = counts
+        self.samples = samples
+        self.duration = duration
+
+    def __repr__(self):
+        return '<WaitEventProfile samples={} events={}>'.format(
+            self.samples, len(self.counts))
+
+    def top(self, n=10, by_query=False):
+        """
+        Return n most frequent (key, count) pairs.
+
+        Args:
+            n: how many pairs to return.
+            by_query: keep query in key, else group by event only.
+        """
+
+        totals = OrderedDict()
+        for (event_type, event, query), count in self.counts.items():
+            key = (event_type, event, query) if by_query \
+                else (event_type, event)
+            totals[key] = totals.get(key, 0) + count
+
+        return sorted(totals.items(), key=lambda kv: -kv[1])[:n]
+
+    def folded(self):
+        """
+        Return lines in 'folded stacks' format (query;type;event count),
+        which is understood by flamegraph.pl and speedscope.
+        """
+
+        lines = []
+        for (event_type, event, query), count in self.counts.items():
+            frames = [query or '?', event_type]
+            if event != event_type:
+                frames.append(event)
+
+            # ';' separates frames
+            frames = [f.replace(';', ',') for f in frames]
+            lines.append('{} {}'.format(';'.join(frames), count))
+
+        return lines
+
+    def save_folded(self, path):
+        with open(path, 'w') as f:
+            for line in self.folded():
+                f.write(line + '\n')
+
+        return self
+
+
+class WaitEventSampler(threading.Thread):
+    """
+    Background thread which samples pg_stat_activity on a dedicated
+    connection using a prepared statement.
+
+    >>> with node.wait_event_sampler(interval=0.005) as sampler:
+    ...     node.pgbench_run(options=['-T10', '-c8'])
+    >>> sampler.profile().top()
+    """
+
+    def __init__(self,
+                 node,
+                 interval=0.01,
+                 dbname='postgres',
+                 username=None,
+                 all_backends=False):
+        """
+        Create a new sampler (call start() to run it).
+
+        Args:
+            node: PostgresNode to be sampled.
+            interval: time between samples (seconds).
+            dbname: database name to connect to.
+            username: database user name.
+            all_backends: sample background workers too.
+        """
+
+        super(WaitEventSampler, self).__init__()
+        self.daemon = True
+
+        self.node = node
+        self.interval = interval
+        self.dbname = dbname
+        self.username = username
+        self.all_backends = all_backends
+        self.error = None
+
+        # key -> index in self._counts
+        self._index = {}
+        self._keys = []
+        self._counts = array.array('L')
+        self._samples = 0
+        self._start_time = None
+        self._stop_time = None
+
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def _add(self, event_type, event, query):
+        key = (event_type, event, query)
+
+        idx = self._index.get(key)
+        if idx is None:
+            idx = self._index[key] = len(self._keys)
+            self._keys.append(key)
+            self._counts.append(0)
+
+        self._counts[idx] += 1
+
+    def _prepare(self, con):
+        backends = ''
+        if not self.all_backends and _pg_version_ge('10'):
+            backends = _CLIENT_BACKENDS
+
+        con.execute(_PREPARE_QUERY.format(backends))
+        con.commit()
+
+    def run(self):
+        try:
+            with self.node.connect(self.dbname, self.username) as con:
+                self._prepare(con)
+                self._sample(con)
+        except Exception as e:
+            self.error = e
+
+    def _sample(self, con):
+        self._start_time = time.time()
+        deadline = self._start_time
+
+        while not self._stop_event.is_set():
+            rows = con.execute('execute testgres_sample')
+
+            # pg_stat_activity is cached until end of transaction
+            con.rollback()
+
+            with self._lock:
+                for event_type, event, query in rows or []:
+                    # active backend which doesn't wait
+                    if event_type is None:
+                        event_type = event = CPU_EVENT
+
+                    self._add(event_type, event, normalize_query(query or ''))
+
+                self._samples += 1
+
+            # keep steady pace
+            deadline += self.interval
+            self._stop_event.wait(max(deadline - time.time(), 0))
+
+        self._stop_time = time.time()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the thread.
+
+        Returns:
+            WaitEventProfile.
+        """
+
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+        if self.error is not None:
+            raise_from(TestgresException('Sampler has failed'), self.error)
+
+        return self.profile()
+
+    def profile(self):
+        """
+        Return current WaitEventProfile (may be called while running).
+        """
+
+        with self._lock:
+            counts = OrderedDict(zip(self._keys, self._counts))
+            samples = self._samples
+
+        finished = self._stop_time or time.time()
+        duration = finished - self._start_time if self._start_time else 0
+
+        return WaitEventProfile(counts, samples, duration)
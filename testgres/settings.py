@@ -0,0 +1,586 @@
+# coding: utf-8
+
+import glob
+import io
+import os
+import re
+import tempfile
+
+from enum import Enum
+from six import string_types
+
+from .consts import \
+    PG_CONF_FILE as _PG_CONF_FILE, \
+    PG_AUTO_CONF_FILE as _PG_AUTO_CONF_FILE, \
+    HBA_CONF_FILE as _HBA_CONF_FILE
+
+# GUC names are case-insensitive, values may be followed by a comment
+_SETTING_RE = re.compile(r"^\s*([A-Za-z_][\w.\-]*)\s*=?\s*(.*)$")
+
+# values that can be written without quotes (see guc-file.l)
+_UNQUOTED_RE = re.compile(r"^([A-Za-z_][\w\-.:/]*|-?\d+(\.\d*)?[A-Za-z]*)$")
+
+# directives that pull in other files
+_INCLUDE_DIRECTIVES = ('include', 'include_if_exists', 'include_dir')
+
+# same as CONF_FILE_MAX_DEPTH in PostgreSQL
+_MAX_INCLUDE_DEPTH = 10
+
+# contexts of settings that take effect after reload
+_RELOAD_CONTEXTS = ('sighup', 'superuser-backend', 'backend', 'superuser',
+                    'user')
+
+
+class ConfigAction(Enum):
+    """
+    What has been done to apply new settings
+    """
+
+    Nothing, Reload, Restart = range(3)
+
+
+def format_value(value):
+    """
+    Convert a python value into a postgresql.conf value.
+    """
+
+    if isinstance(value, bool):
+        return 'on' if value else 'off'
+
+    if not isinstance(value, string_types):
+        value = str(value)
+
+    if _UNQUOTED_RE.match(value):
+        return value
+
+    return u"'{}'".format(value.replace("'", "''"))
+
+
+def _parse_value(text):
+    """
+    Split raw value into (value, comment) and unquote it.
+    """
+
+    text = text.strip()
+
+    if text.startswith("'"):
+        value = []
+        i = 1
+        while i < len(text):
+            c = text[i]
+            if c == "'":
+                # doubled quote means a literal one
+                if text[i + 1:i + 2] == "'":
+                    value.append(c)
+                    i += 2
+                    continue
+                break
+            elif c == '\\' and i + 1 < len(text):
+                value.append(text[i + 1])
+                i += 2
+                continue
+            value.append(c)
+            i += 1
+
+        return u''.join(value), text[i + 1:].strip()
+
+    value, _, comment = text.partition('#')
+    return value.strip(), comment
+
+
+def _atomic_write(path, lines):
+    """
+    Replace file contents in one step (write a temp file, then rename it).
+    """
+
+    dir_name = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix='.tmp_')
+
+    try:
+        # keep permissions of the original file
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+
+        with io.open(fd, 'w') as f:
+            f.writelines(lines)
+
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+class _ConfigLine(object):
+    __slots__ = ('name', 'value', 'raw')
+
+    def __init__(self, raw, name=None, value=None):
+        self.raw = raw
+        self.name = name
+        self.value = value
+
+
+class ConfigFile(object):
+    """
+    A postgresql.conf-style file which keeps comments and order of lines
+    """
+
+    def __init__(self, path):
+        """
+        Load a config file (missing file is treated as empty).
+
+        Args:
+            path: path to the config file.
+        """
+
+        self.path = path
+        self.dirty = False
+        self._lines = []
+
+        if os.path.exists(path):
+            with io.open(path, 'r') as f:
+                for raw in f.readlines():
+                    self._lines.append(self._parse_line(raw))
+
+    @staticmethod
+    def _parse_line(raw):
+        stripped = raw.strip()
+
+        # comments and blank lines are kept as is
+        if not stripped or stripped.startswith('#'):
+            return _ConfigLine(raw)
+
+        match = _SETTING_RE.match(stripped)
+        if not match:
+            return _ConfigLine(raw)
+
+        name, rest = match.groups()
+        value, _ = _parse_value(rest)
+
+        return _ConfigLine(raw, name.lower(), value)
+
+    def entries(self):
+        """
+        Return a list of (name, value) pairs in file order.
+        """
+
+        return [(ln.name, ln.value) for ln in self._lines if ln.name]
+
+    def get(self, name, default=None):
+        """
+        Return the last value of a setting defined in this file.
+        """
+
+        name = name.lower()
+        for line in reversed(self._lines):
+            if line.name == name:
+                return line.value
+
+        return default
+
+    def set(self, name, value):
+        """
+        Set a setting, removing its duplicates.
+
+        Args:
+            name: name of the setting.
+            value: new value (python value or string).
+
+        Returns:
+            True if file contents have changed.
+        """
+
+        name = name.lower()
+        value = format_value(value)
+        raw = u"{} = {}\n".format(name, value)
+
+        # find every definition of this setting
+        found = [ln for ln in self._lines if ln.name == name]
+
+        # nothing to do if it's already defined once with the same value
+        if len(found) == 1 and found[0].raw == raw:
+            return False
+
+        if found:
+            # update the last definition in place, drop the rest
+            for line in found[:-1]:
+                self._lines.remove(line)
+            last = found[-1]
+        else:
+            last = _ConfigLine(raw)
+            self._lines.append(last)
+
+        # make sure previous line ends with newline
+        idx = self._lines.index(last)
+        if idx > 0 and not self._lines[idx - 1].raw.endswith('\n'):
+            self._lines[idx - 1].raw += u'\n'
+
+        last.raw = raw
+        last.name = name
+        last.value = _parse_value(value)[0]
+
+        self.dirty = True
+        return True
+
+    def remove(self, name):
+        """
+        Remove all definitions of a setting.
+
+        Returns:
+            True if file contents have changed.
+        """
+
+        name = name.lower()
+        lines = [ln for ln in self._lines if ln.name != name]
+        changed = len(lines) != len(self._lines)
+
+        self._lines = lines
+        self.dirty = self.dirty or changed
+        return changed
+
+    def clear(self):
+        """
+        Remove everything, including comments.
+        """
+
+        self.dirty = self.dirty or bool(self._lines)
+        self._lines = []
+
+    def save(self):
+        """
+        Write this file to disk if it has been modified.
+        """
+
+        if self.dirty:
+            _atomic_write(self.path, [ln.raw for ln in self._lines])
+            self.dirty = False
+
+
+class HbaFile(object):
+    """
+    pg_hba.conf file represented as a list of lines
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        self.lines = []
+
+        if os.path.exists(path):
+            with io.open(path, 'r') as f:
+                self.lines = [
+                    ln if ln.endswith('\n') else ln + u'\n'
+                    for ln in f.readlines()
+                ]
+
+    @staticmethod
+    def _split(line):
+        return line.split('#')[0].split()
+
+    def rules(self):
+        """
+        Return a list of non-comment lines.
+        """
+
+        return [ln for ln in self.lines if self._split(ln)]
+
+    def auth_method(self, conn_type, default='trust'):
+        """
+        Return auth method of the first rule of the given type
+        (e.g. 'local' or 'host').
+        """
+
+        for line in self.rules():
+            fields = self._split(line)
+            if fields[0] == conn_type:
+                return fields[-1]
+
+        return default
+
+    def strip_comments(self):
+        """
+        Get rid of comments and blank lines.
+        """
+
+        rules = self.rules()
+        if rules != self.lines:
+            self.lines = rules
+            self.dirty = True
+
+    def add(self, line):
+        """
+        Append a rule unless an equivalent one is already present.
+
+        Returns:
+            True if file contents have changed.
+        """
+
+        fields = self._split(line)
+        if any(self._split(ln) == fields for ln in self.lines):
+            return False
+
+        if not line.endswith('\n'):
+            line += u'\n'
+
+        self.lines.append(line)
+        self.dirty = True
+        return True
+
+    def remove(self, line):
+        """
+        Remove all rules equivalent to the given one.
+
+        Returns:
+            True if file contents have changed.
+        """
+
+        fields = self._split(line)
+        lines = [ln for ln in self.lines if self._split(ln) != fields]
+        changed = len(lines) != len(self.lines)
+
+        self.lines = lines
+        self.dirty = self.dirty or changed
+        return changed
+
+    def save(self):
+        if self.dirty:
+            _atomic_write(self.path, self.lines)
+            self.dirty = False
+
+
+class NodeSettings(object):
+    """
+    In-memory model of node's configuration files.
+
+    Changes are kept in memory until apply() (or save()) is called,
+    after which every modified file is rewritten at once. apply() also
+    reloads or restarts a running node, but only if it's really needed.
+
+    >>> with node.settings() as conf:
+    ...     conf['work_mem'] = '64MB'        # reload is enough
+    ...     conf.hba.add('local all all trust')
+    """
+
+    def __init__(self, node):
+        """
+        Load configuration files of a node.
+
+        Args:
+            node: an instance of PostgresNode.
+        """
+
+        self.node = node
+        self.conf = ConfigFile(os.path.join(node.data_dir, _PG_CONF_FILE))
+        self.auto_conf = ConfigFile(
+            os.path.join(node.data_dir, _PG_AUTO_CONF_FILE))
+        self.hba = HbaFile(os.path.join(node.data_dir, _HBA_CONF_FILE))
+
+        # path -> ConfigFile, filled lazily by _walk()
+        self._includes = {}
+
+        # used to figure out what has changed
+        self._original = self._effective()
+        self._original_hba = list(self.hba.lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.apply()
+
+    def __getitem__(self, name):
+        values = self._effective()
+        return values[name.lower()]
+
+    def __setitem__(self, name, value):
+        self.set(name, value)
+
+    def __delitem__(self, name):
+        self.remove(name)
+
+    def __contains__(self, name):
+        return name.lower() in self._effective()
+
+    def _include(self, path):
+        # missing files are skipped, like include_if_exists does
+        if path not in self._includes:
+            if not os.path.exists(path):
+                return None
+            self._includes[path] = ConfigFile(path)
+
+        return self._includes[path]
+
+    def _walk(self, config_file, depth=0):
+        """
+        Yield (file, name, value) in the order PostgreSQL reads them.
+        """
+
+        if depth > _MAX_INCLUDE_DEPTH:
+            return
+
+        base = os.path.dirname(config_file.path)
+
+        for name, value in config_file.entries():
+            if name not in _INCLUDE_DIRECTIVES:
+                yield config_file, name, value
+                continue
+
+            path = os.path.join(base, value)
+
+            if name == 'include_dir':
+                files = sorted(glob.glob(os.path.join(path, '*.conf')))
+            else:
+                files = [path]
+
+            for f in files:
+                included = self._include(f)
+                if included is not None:
+                    for item in self._walk(included, depth + 1):
+                        yield item
+
+    def _all_entries(self):
+        for item in self._walk(self.conf):
+            yield item
+
+        # postgresql.auto.conf always goes last
+        for item in self._walk(self.auto_conf):
+            yield item
+
+    def _effective(self):
+        return dict((name, value) for _, name, value in self._all_entries())
+
+    def _files(self):
+        return [self.conf, self.auto_conf, self.hba] + \
+            list(self._includes.values())
+
+    def get(self, name, default=None):
+        """
+        Return effective value of a setting (as a string).
+        """
+
+        return self._effective().get(name.lower(), default)
+
+    def set(self, name, value):
+        """
+        Set a new value. The file which currently defines
+        the effective value is modified, else postgresql.conf.
+
+        Returns:
+            This instance of NodeSettings.
+        """
+
+        defined_in = self.conf
+        for f, n, _ in self._all_entries():
+            if n == name.lower():
+                defined_in = f
+
+        defined_in.set(name, value)
+
+        return self
+
+    def update(self, *args, **kwargs):
+        """
+        Set several values at once (same as dict.update()).
+
+        Returns:
+            This instance of NodeSettings.
+        """
+
+        for name, value in dict(*args, **kwargs).items():
+            self.set(name, value)
+
+        return self
+
+    def remove(self, name):
+        """
+        Remove a setting from all config files (i.e. reset to default).
+
+        Returns:
+            This instance of NodeSettings.
+        """
+
+        # make sure includes have been loaded
+        self._effective()
+
+        for f in self._files():
+            if isinstance(f, ConfigFile):
+                f.remove(name)
+
+        return self
+
+    def changed(self):
+        """
+        Return a set of names of settings whose values have changed.
+        """
+
+        old, new = self._original, self._effective()
+        names = set(old.keys()) | set(new.keys())
+
+        return set(n for n in names if old.get(n) != new.get(n))
+
+    def save(self):
+        """
+        Write modified config files (does not touch the node).
+
+        Returns:
+            This instance of NodeSettings.
+        """
+
+        for f in self._files():
+            f.save()
+
+        return self
+
+    def required_action(self):
+        """
+        Figure out what should be done to apply pending changes
+        to a running node (uses pg_settings.context).
+
+        Returns:
+            An instance of ConfigAction.
+        """
+
+        names = self.changed()
+        hba_changed = self.hba.lines != self._original_hba
+
+        if not names:
+            return ConfigAction.Reload if hba_changed else ConfigAction.Nothing
+
+        query = u"select name, context from pg_settings where name in ({})"
+        query = query.format(u", ".join(
+            u"'{}'".format(n.replace("'", "''")) for n in names))
+
+        contexts = dict(self.node.execute('postgres', query))
+
+        # unknown settings might need a restart (e.g. extension's GUCs)
+        if all(contexts.get(n) in _RELOAD_CONTEXTS for n in names):
+            return ConfigAction.Reload
+
+        return ConfigAction.Restart
+
+    def apply(self):
+        """
+        Write modified config files and reload or restart
+        the node if it's running and it's really necessary.
+
+        Returns:
+            An instance of ConfigAction (what has been done).
+        """
+
+        action = ConfigAction.Nothing
+
+        if self.node.status():
+            action = self.required_action()
+
+        self.save()
+
+        if action == ConfigAction.Reload:
+            self.node.reload()
+        elif action == ConfigAction.Restart:
+            self.node.restart()
+
+        # new baseline for subsequent changes
+        self._original = self._effective()
+        self._original_hba = list(self.hba.lines)
+
+        return action
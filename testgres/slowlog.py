@@ -0,0 +1,197 @@
+# coding: utf-8
+"""
+Slow statements logged by log_min_duration_statement and auto_explain.
+"""
+
+import io
+import json
+import re
+
+from collections import namedtuple
+
+from .plan import QueryPlan
+
+SlowQuery = namedtuple('SlowQuery', [
+    'pid',          # backend's PID (if log_line_prefix contains %p)
+    'duration',     # ms
+    'statement',    # query text
+    'plan'          # QueryPlan (auto_explain only) or None
+])
+
+# e.g. "2024-01-01 00:00:00.000 UTC [42] LOG:  duration: 1.5 ms  statement: "
+_LOG_RE = re.compile(r'^(?P<prefix>.*?)LOG:  (?P<message>.*)$')
+
+# text is missing if statement has been logged by log_statement
+_DURATION_RE = re.compile(
+    r'^duration: (?P<duration>\d+(?:\.\d+)?) ms'
+    r'(?:  (?P<kind>[^:]+):\s?(?P<text>.*))?$', re.DOTALL)
+
+# logged by log_statement
+_STATEMENT_RE = re.compile(r'^(?:statement|execute [^:]+): (?P<text>.*)$',
+                           re.DOTALL)
+
+_PID_RE = re.compile(r'\[(\d+)\]')
+
+
+def read_log(path, offset=0):
+    """
+    Read a log file starting at a given offset (in bytes).
+    """
+
+    with io.open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read().decode('utf-8', 'replace')
+
+
+def _messages(text):
+    """
+    Yield (pid, message) of LOG messages, multi-line messages are joined.
+    """
+
+    record = None
+
+    for line in text.splitlines():
+        # message continues on lines starting with tab
+        if line.startswith('\t'):
+            if record is not None:
+                record[1].append(line[1:])
+            continue
+
+        if record is not None:
+            yield record[0], '\n'.join(record[1])
+            record = None
+
+        m = _LOG_RE.match(line)
+        if m:
+            pid = _PID_RE.search(m.group('prefix'))
+            record = (int(pid.group(1)) if pid else None,
+                      [m.group('message')])
+
+    if record is not None:
+        yield record[0], '\n'.join(record[1])
+
+
+def _is_statement(kind):
+    # parse and bind steps are logged separately, skip them
+    return kind == 'statement' or kind.startswith('execute ')
+
+
+def _records(text):
+    """
+    Yield (pid, duration, kind, text) of duration messages.
+    """
+
+    statements = {}    # pid -> last statement logged by log_statement
+
+    for pid, message in _messages(text):
+        m = _STATEMENT_RE.match(message)
+        if m:
+            statements[pid] = m.group('text')
+            continue
+
+        m = _DURATION_RE.match(message)
+        if not m:
+            continue
+
+        duration = float(m.group('duration'))
+        kind = m.group('kind')
+
+        if kind is None:
+            # bare duration of a statement logged by log_statement
+            statement = statements.pop(pid, None)
+            if statement is not None:
+                yield pid, duration, 'statement', statement
+        elif kind == 'plan' or _is_statement(kind):
+            yield pid, duration, kind, m.group('text')
+
+
+def _parse_plan(text):
+    try:
+        return QueryPlan.from_json(text)
+    except (ValueError, KeyError):
+        return None    # not a JSON plan
+
+
+def parse_slow_queries(text):
+    """
+    Parse messages of log_min_duration_statement and auto_explain
+    (with auto_explain.log_format = json).
+
+    Returns:
+        A list of SlowQuery records.
+    """
+
+    result = []
+    plans = {}    # pid -> (duration, plan, query text)
+
+    for pid, duration, kind, text in _records(text):
+        if kind == 'plan':
+            plan = _parse_plan(text)
+            query = plan.raw.get('Query Text') if plan is not None else None
+            plans[pid] = (duration, plan, query)
+            continue
+
+        # auto_explain logs plan before statement is finished
+        pending = plans.pop(pid, None)
+        plan = pending[1] if pending is not None else None
+
+        result.append(SlowQuery(pid, duration, text, plan))
+
+    # plans of statements which haven't been logged themselves
+    for pid, (duration, plan, query) in plans.items():
+        result.append(SlowQuery(pid, duration, query, plan))
+
+    return result
+
+
+class SlowQueryLog(object):
+    """
+    Slow statements logged during a window (see capture_slow_queries()).
+    """
+
+    def __init__(self, queries=None):
+        self.queries = queries or []
+
+    def __iter__(self):
+        return iter(self.queries)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __repr__(self):
+        return '<SlowQueryLog queries={} max={}ms>'.format(
+            len(self.queries), self.max_duration)
+
+    @property
+    def max_duration(self):
+        if not self.queries:
+            return None
+
+        return max(q.duration for q in self.queries)
+
+    def slowest(self, n=10):
+        return sorted(self.queries, key=lambda q: -q.duration)[:n]
+
+    def exceeding(self, duration):
+        """
+        Return statements which took longer than duration (ms).
+
+        >>> assert not log.exceeding(100), log.slowest()
+        """
+
+        return [q for q in self.queries if q.duration > duration]
+
+    def to_dict(self):
+        return [
+            dict(pid=q.pid,
+                 duration=q.duration,
+                 statement=q.statement,
+                 plan=q.plan.raw if q.plan is not None else None)
+            for q in self.queries
+        ]
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        return self
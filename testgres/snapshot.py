@@ -0,0 +1,264 @@
+# coding: utf-8
+"""
+Snapshots of cumulative statistics (pg_stat_*) and their deltas.
+"""
+
+import numbers
+import time
+
+from collections import OrderedDict
+
+from .utils import pg_version_ge as _pg_version_ge
+
+_DATABASE_QUERY = """
+select * from pg_stat_database where datname = current_database()
+"""
+
+_TABLES_QUERY = """
+select s.*,
+       io.heap_blks_read, io.heap_blks_hit,
+       io.idx_blks_read, io.idx_blks_hit,
+       io.toast_blks_read, io.toast_blks_hit,
+       io.tidx_blks_read, io.tidx_blks_hit
+from pg_stat_user_tables s join pg_statio_user_tables io using (relid)
+"""
+
+# replicas don't insert WAL, but replay it
+_WAL_LSN_QUERY = """
+select (case when pg_is_in_recovery()
+             then pg_last_wal_replay_lsn()
+             else pg_current_wal_lsn() end)::text
+"""
+
+_XLOG_LOCATION_QUERY = """
+select (case when pg_is_in_recovery()
+             then pg_last_xlog_replay_location()
+             else pg_current_xlog_location() end)::text
+"""
+
+_HAS_PGSS_QUERY = """
+select count(*) from pg_extension where extname = 'pg_stat_statements'
+"""
+
+
+def _lsn_to_int(lsn):
+    hi, lo = lsn.split('/')
+    return (int(hi, 16) << 32) + int(lo, 16)
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def _fetch_dicts(con, query):
+    rows = con.execute(query) or []
+    names = [d[0] for d in con.cursor.description]
+
+    return [OrderedDict(zip(names, row)) for row in rows]
+
+
+def _fetch_dict(con, query):
+    rows = _fetch_dicts(con, query)
+    return rows[0] if rows else OrderedDict()
+
+
+def _diff_row(old, new):
+    """
+    Subtract numeric columns, keep labels (names, query texts).
+    """
+
+    result = OrderedDict()
+
+    for name, value in new.items():
+        if _is_number(value):
+            prev = old.get(name)
+            result[name] = value - prev if _is_number(prev) else value
+        elif not isinstance(value, bool):
+            result[name] = value
+
+    return result
+
+
+def _changed(row):
+    return any(_is_number(v) and v != 0 for v in row.values())
+
+
+def _diff_rows(old, new):
+    """
+    Diff two dicts {key: row}, drop rows which haven't changed.
+    """
+
+    result = OrderedDict()
+
+    for key, row in new.items():
+        delta = _diff_row(old.get(key, {}), row)
+        if _changed(delta):
+            result[key] = delta
+
+    return result
+
+
+def reset_stats(con):
+    """
+    Reset statistics of current database and shared statistics.
+    """
+
+    shared = ['bgwriter']
+    if _pg_version_ge('14'):
+        shared.append('wal')
+    if _pg_version_ge('16'):
+        shared.append('io')
+    if _pg_version_ge('17'):
+        shared.append('checkpointer')
+
+    con.execute('select pg_stat_reset()')
+    for target in shared:
+        con.execute('select pg_stat_reset_shared(%s)', target)
+
+    if con.execute(_HAS_PGSS_QUERY)[0][0]:
+        con.execute('select pg_stat_statements_reset()')
+
+    con.commit()
+
+
+class StatsSnapshot(object):
+    """
+    Values of statistics views taken in a single transaction.
+
+    Attributes:
+        time: unix timestamp.
+        wal_lsn: current WAL insert position (int).
+        database: pg_stat_database row of current database.
+        tables: {schema.table: pg_stat_user_tables + pg_statio_user_tables}.
+        bgwriter: pg_stat_bgwriter.
+        checkpointer: pg_stat_checkpointer (PG 17+).
+        wal: pg_stat_wal (PG 14+).
+        io: {(backend_type, object, context): pg_stat_io row} (PG 16+).
+        statements: {(userid, dbid, queryid): pg_stat_statements row}
+            (if pg_stat_statements is installed in this database).
+    """
+
+    def __init__(self):
+        self.time = None
+        self.wal_lsn = None
+        self.database = OrderedDict()
+        self.tables = OrderedDict()
+        self.bgwriter = OrderedDict()
+        self.checkpointer = OrderedDict()
+        self.wal = OrderedDict()
+        self.io = OrderedDict()
+        self.statements = OrderedDict()
+
+    def __sub__(self, other):
+        return StatsDelta(other, self)
+
+    @classmethod
+    def take(cls, con):
+        """
+        Read all statistics using a connection (NodeConnection).
+        """
+
+        snap = cls()
+
+        # all views should show the same moment
+        con.begin()
+        try:
+            if _pg_version_ge('15'):
+                con.execute("set local stats_fetch_consistency = 'snapshot'")
+
+            snap.time = time.time()
+
+            if _pg_version_ge('10'):
+                lsn = con.execute(_WAL_LSN_QUERY)
+            else:
+                lsn = con.execute(_XLOG_LOCATION_QUERY)
+            snap.wal_lsn = _lsn_to_int(lsn[0][0])
+
+            snap.database = _fetch_dict(con, _DATABASE_QUERY)
+            snap.bgwriter = _fetch_dict(con, 'select * from pg_stat_bgwriter')
+
+            for row in _fetch_dicts(con, _TABLES_QUERY):
+                name = '{}.{}'.format(row['schemaname'], row['relname'])
+                snap.tables[name] = row
+
+            if _pg_version_ge('17'):
+                snap.checkpointer = _fetch_dict(
+                    con, 'select * from pg_stat_checkpointer')
+
+            if _pg_version_ge('14'):
+                snap.wal = _fetch_dict(con, 'select * from pg_stat_wal')
+
+            if _pg_version_ge('16'):
+                for row in _fetch_dicts(con, 'select * from pg_stat_io'):
+                    key = (row['backend_type'], row['object'], row['context'])
+                    snap.io[key] = row
+
+            if con.execute(_HAS_PGSS_QUERY)[0][0]:
+                query = 'select * from pg_stat_statements'
+                for row in _fetch_dicts(con, query):
+                    key = (row['userid'], row['dbid'], row['queryid'])
+                    snap.statements[key] = row
+        finally:
+            con.rollback()
+
+        return snap
+
+
+class StatsDelta(object):
+    """
+    Difference between two StatsSnapshots (unchanged rows are omitted).
+    """
+
+    def __init__(self, before=None, after=None):
+        self.duration = None
+        self.wal_bytes = None
+        self.database = OrderedDict()
+        self.tables = OrderedDict()
+        self.bgwriter = OrderedDict()
+        self.checkpointer = OrderedDict()
+        self.wal = OrderedDict()
+        self.io = OrderedDict()
+        self.statements = OrderedDict()
+
+        if before is not None and after is not None:
+            self._compute(before, after)
+
+    def _compute(self, before, after):
+        self.duration = after.time - before.time
+        self.wal_bytes = after.wal_lsn - before.wal_lsn
+        self.database = _diff_row(before.database, after.database)
+        self.tables = _diff_rows(before.tables, after.tables)
+        self.bgwriter = _diff_row(before.bgwriter, after.bgwriter)
+        self.checkpointer = _diff_row(before.checkpointer, after.checkpointer)
+        self.wal = _diff_row(before.wal, after.wal)
+        self.io = _diff_rows(before.io, after.io)
+        self.statements = _diff_rows(before.statements, after.statements)
+
+    def __repr__(self):
+        return ('<StatsDelta blocks_hit={} blocks_read={} '
+                'wal_bytes={} temp_bytes={}>').format(
+                    self.blocks_hit, self.blocks_read,
+                    self.wal_bytes, self.temp_bytes)
+
+    @property
+    def blocks_hit(self):
+        return self.database.get('blks_hit')
+
+    @property
+    def blocks_read(self):
+        return self.database.get('blks_read')
+
+    @property
+    def temp_bytes(self):
+        return self.database.get('temp_bytes')
+
+    @property
+    def tuples(self):
+        """
+        Tuples returned/fetched/inserted/updated/deleted in this database.
+        """
+
+        return OrderedDict(
+            (name, self.database.get('tup_' + name))
+            for name in ('returned', 'fetched', 'inserted', 'updated',
+                         'deleted'))
@@ -0,0 +1,103 @@
+# coding: utf-8
+
+import os
+import shutil
+import tempfile
+
+from six import raise_from
+
+from .config import TestgresConfig
+from .exceptions import TestgresException
+
+
+def get_free_space(path):
+    """
+    Return amount of free space (bytes) available to unprivileged users.
+    """
+
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def get_memory_dir(min_free=None):
+    """
+    Return a RAM-backed directory (see TestgresConfig.tmpfs_dir)
+    if it exists and has enough free space, else None.
+
+    Args:
+        min_free: required free space (see TestgresConfig.tmpfs_min_free).
+    """
+
+    path = TestgresConfig.tmpfs_dir
+
+    if min_free is None:
+        min_free = TestgresConfig.tmpfs_min_free
+
+    if not path or not os.path.isdir(path):
+        return None
+
+    if get_free_space(path) < min_free:
+        return None
+
+    return path
+
+
+def make_temp_dir(memory=False, location=None):
+    """
+    Create a temp dir, possibly on tmpfs or a custom mount point.
+
+    Args:
+        memory: should we try a RAM-backed directory first?
+        location: parent directory (overrides 'memory').
+
+    Returns:
+        A tuple of (path, in_memory).
+    """
+
+    if location:
+        return tempfile.mkdtemp(dir=location), False
+
+    memory_dir = get_memory_dir() if memory else None
+
+    # fall back to default temp dir
+    if memory_dir is None:
+        return tempfile.mkdtemp(), False
+
+    return tempfile.mkdtemp(dir=memory_dir), True
+
+
+def relocate_dir(path, location=None):
+    """
+    Move a directory to tmpfs (or a custom mount point)
+    and replace it with a symlink.
+
+    Args:
+        path: directory to be moved (e.g. pg_wal).
+        location: parent directory (tmpfs by default).
+
+    Returns:
+        New parent dir, or None if there's no suitable place.
+    """
+
+    location = location or get_memory_dir()
+    if not location:
+        return None
+
+    new_dir = tempfile.mkdtemp(dir=location)
+    new_path = os.path.join(new_dir, os.path.basename(path))
+
+    try:
+        shutil.move(path, new_path)
+    except Exception as e:
+        shutil.rmtree(new_dir, ignore_errors=True)
+        raise_from(TestgresException('Failed to move files'), e)
+
+    try:
+        os.symlink(new_path, path)
+    except Exception as e:
+        # put files back
+        shutil.move(new_path, path)
+        shutil.rmtree(new_dir, ignore_errors=True)
+        raise_from(TestgresException('Failed to create symlink'), e)
+
+    return new_dir
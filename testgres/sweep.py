@@ -0,0 +1,278 @@
+# coding: utf-8
+"""
+Run a workload over a grid of configurations.
+
+Data is prepared once, then each configuration gets its own clone
+of the seeded node. Configurations run concurrently, optionally
+pinned to disjoint sets of CPUs.
+"""
+
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from six import iteritems, string_types
+from six.moves import queue
+
+from .compare import run_workload
+
+from .consts import STORAGE_DISK as _STORAGE_DISK
+
+from .exceptions import TestgresException
+
+from .resources import \
+    get_cpu_count as _get_cpu_count, \
+    split_cpus as _split_cpus
+
+# CPUs a configuration (server + pgbench) is expected to use
+DEFAULT_CPUS_PER_CONFIG = 2
+
+
+def expand_grid(grid):
+    """
+    Build all combinations of a parameter grid.
+
+    Args:
+        grid: dict {setting: [values]}, a single value is allowed too.
+
+    Returns:
+        A list of OrderedDicts of settings.
+    """
+
+    names = list(grid.keys())
+    values = []
+
+    for name in names:
+        v = grid[name]
+        if isinstance(v, string_types) or not hasattr(v, '__iter__'):
+            v = [v]
+        values.append(list(v))
+
+    return [OrderedDict(zip(names, c)) for c in itertools.product(*values)]
+
+
+def _pgbench_workload(options):
+    options = list(options)
+
+    # we want latency percentiles
+    if not any(o == '-l' or o.startswith('--log') for o in options):
+        options.append('--log')
+
+    return options
+
+
+class SweepResult(object):
+    """
+    Tidy table of a sweep: one row per (configuration, repetition).
+    Each row contains settings, metrics, duration and error (if any).
+    """
+
+    def __init__(self, settings, rows):
+        self.settings = settings
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def columns(self):
+        columns = []
+        for row in self.rows:
+            for name in row:
+                if name not in columns:
+                    columns.append(name)
+        return columns
+
+    def best(self, metric='tps', highest=True):
+        """
+        Return the row with the best value of a metric.
+        """
+
+        rows = [r for r in self.rows if r.get(metric) is not None]
+        if not rows:
+            return None
+
+        pick = max if highest else min
+        return pick(rows, key=lambda r: r[metric])
+
+    def to_csv(self, path):
+        columns = self.columns
+
+        # csv module wants bytes in python 2
+        mode = 'w' if str is not bytes else 'wb'
+        kwargs = {'newline': ''} if str is not bytes else {}
+
+        with io.open(path, mode, **kwargs) as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            for row in self.rows:
+                writer.writerow(row)
+
+        return self
+
+    def to_json(self, path):
+        with io.open(path, 'w') as f:
+            data = json.dumps(self.rows, indent=2)
+            f.write(data if isinstance(data, type(u'')) else data.decode())
+
+        return self
+
+
+class _SweepRunner(object):
+    def __init__(self, template, workload, warmup, repeat, dbname):
+        self.template = template
+        self.workload = workload
+        self.warmup = warmup
+        self.repeat = repeat
+        self.dbname = dbname
+
+        self.tasks = queue.Queue()
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def run_config(self, number, conf):
+        node = None
+
+        try:
+            node = self.template.clone('sweep_{}'.format(number))
+            node.settings().update(conf).save()
+            node.start()
+
+            if self.warmup is not None:
+                run_workload(node, self.warmup, self.dbname)
+
+            for i in range(self.repeat):
+                row = OrderedDict([('config', number), ('run', i)])
+                row.update(conf)
+
+                started = time.time()
+                row.update(run_workload(node, self.workload, self.dbname))
+                row['duration'] = time.time() - started
+                row['error'] = None
+
+                self.add_row(row)
+        except Exception as e:
+            row = OrderedDict([('config', number), ('run', None)])
+            row.update(conf)
+            row['error'] = str(e)
+
+            self.add_row(row)
+        finally:
+            if node is not None:
+                node.cleanup()
+                node.free_port()
+
+    def add_row(self, row):
+        with self.lock:
+            self.rows.append(row)
+
+    def worker(self, cpus):
+        # NOTE: affinity is per-thread on Linux, and it's inherited
+        # by child processes (pg_ctl -> postmaster -> backends, pgbench)
+        if cpus is not None:
+            os.sched_setaffinity(0, cpus)
+
+        while True:
+            try:
+                number, conf = self.tasks.get_nowait()
+            except queue.Empty:
+                return
+
+            self.run_config(number, conf)
+
+
+def run_sweep(grid,
+              workload,
+              setup=None,
+              warmup=None,
+              repeat=1,
+              jobs=None,
+              pin_cpus=False,
+              base=None,
+              storage=_STORAGE_DISK,
+              dbname='postgres'):
+    """
+    Run a workload on every configuration of a parameter grid.
+
+    Args:
+        grid: dict {setting: [values]} (or a list of dicts of settings).
+        workload: pgbench options (list) or callable(node) returning
+            a PgbenchResult, a dict {metric: value} or tps (number).
+        setup: callable(node) which prepares data (pgbench -i by default).
+        warmup: workload to be run before measurements (not measured).
+        repeat: number of measurements per configuration.
+        jobs: how many configurations run at once (depends on CPUs).
+        pin_cpus: pin each job to a disjoint set of CPUs.
+        base: settings of all nodes (dict).
+        storage: where to keep nodes' files ('disk' | 'memory').
+        dbname: database for pgbench workloads.
+
+    Returns:
+        An instance of SweepResult.
+    """
+
+    from .api import get_new_node
+
+    configs = expand_grid(grid) if isinstance(grid, dict) else list(grid)
+
+    if not callable(workload):
+        workload = _pgbench_workload(workload)
+
+        if setup is None:
+
+            def setup(node):
+                node.pgbench_run(dbname=dbname, options=['-i'])
+
+    if jobs is None:
+        jobs = max(_get_cpu_count() // DEFAULT_CPUS_PER_CONFIG, 1)
+    jobs = max(min(jobs, len(configs)), 1)
+
+    cpu_sets = [None] * jobs
+    if pin_cpus:
+        if not hasattr(os, 'sched_setaffinity'):
+            raise TestgresException('CPU pinning is not supported')
+
+        # server and pgbench of a job share its CPUs
+        cpu_sets = [s.server for s in _split_cpus(jobs, clients=False)]
+
+    with get_new_node('sweep_template', storage=storage) as template:
+        template.init()
+        template.settings().update(base or {}).save()
+
+        # prepare data once, every configuration gets a copy
+        if setup is not None:
+            template.start()
+            setup(template)
+            template.stop()
+
+        runner = _SweepRunner(template, workload, warmup, repeat, dbname)
+        for task in enumerate(configs):
+            runner.tasks.put(task)
+
+        threads = [
+            threading.Thread(target=runner.worker, args=(cpus, ))
+            for cpus in cpu_sets
+        ]
+
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+    # keep order of the grid
+    rows = sorted(runner.rows, key=lambda r: (r['config'], r['run'] or 0))
+    settings = []
+    for conf in configs:
+        settings.extend(k for k, _ in iteritems(conf) if k not in settings)
+
+    return SweepResult(settings, rows)
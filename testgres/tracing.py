@@ -0,0 +1,124 @@
+# coding: utf-8
+"""
+Timeline of node operations in Chrome trace-event format.
+
+Open the file in chrome://tracing or https://ui.perfetto.dev
+to see which operations of which nodes overlapped.
+"""
+
+import io
+import json
+import os
+import threading
+
+from .metrics import add_hook, remove_hook
+
+
+class ChromeTracer(object):
+    """
+    Records a span for each node operation and utility (see add_hook()).
+
+    >>> with ChromeTracer('/tmp/trace.json'):
+    ...     node.init().start()
+    """
+
+    def __init__(self, path=None):
+        """
+        Create a new tracer.
+
+        Args:
+            path: file to be written by stop() (optional).
+        """
+
+        self.path = path
+
+        self._events = []
+        self._threads = {}    # thread name -> tid
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    def _tid(self, thread):
+        tid = self._threads.get(thread)
+        if tid is None:
+            tid = self._threads[thread] = len(self._threads) + 1
+        return tid
+
+    def _on_record(self, record):
+        args = {'node': record.node}
+
+        if record.exit_code is not None:
+            args['exit_code'] = record.exit_code
+        if record.output_size is not None:
+            args['output_size'] = record.output_size
+        if record.error is not None:
+            args['error'] = record.error
+
+        # yapf: disable
+        with self._lock:
+            self._events.append({
+                'name': record.operation,
+                'cat': record.category,
+                'ph': 'X',    # complete event
+                'ts': record.started * 1e6,
+                'dur': record.duration * 1e6,
+                'pid': self._pid,
+                'tid': self._tid(record.thread),
+                'args': args
+            })
+
+    def start(self):
+        """
+        Start recording spans.
+        """
+
+        add_hook(self._on_record)
+        return self
+
+    def stop(self):
+        """
+        Stop recording spans and write file (if path was given).
+        """
+
+        remove_hook(self._on_record)
+
+        if self.path:
+            self.save(self.path)
+
+        return self
+
+    def events(self):
+        """
+        Return a list of trace events (including thread names).
+        """
+
+        with self._lock:
+            meta = [{
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': self._pid,
+                'tid': tid,
+                'args': {'name': name}
+            } for name, tid in self._threads.items()]
+
+            return meta + list(self._events)
+
+    def save(self, path):
+        """
+        Write trace to a JSON file.
+        """
+
+        data = json.dumps({
+            'traceEvents': self.events(),
+            'displayTimeUnit': 'ms'
+        })
+
+        with io.open(path, 'w') as f:
+            f.write(data if isinstance(data, type(u'')) else data.decode())
+
+        return self
@@ -12,6 +12,10 @@ from distutils.version import LooseVersion
 from .config import TestgresConfig
 from .exceptions import ExecUtilException
 
+from .metrics import \
+    CATEGORY_UTILITY as _CATEGORY_UTILITY, \
+    measure as _measure
+
 # rows returned by PG_CONFIG
 _pg_config_data = {}
 
@@ -58,29 +62,56 @@ def generate_app_name():
     return ''.join(['testgres-', str(uuid.uuid4())])
 
 
-def execute_utility(args, logfile):
+def execute_utility(args, logfile, preexec_fn=None):
     """
     Execute utility (pg_ctl, pg_dump etc).
 
     Args:
         args: utility + arguments (list).
         logfile: path to file to store stdout and stderr.
+        preexec_fn: called in the child process (see isolate_command()).
 
     Returns:
         stdout of executed utility.
     """
 
-    # run utility
-    process = subprocess.Popen(
-        args,    # util + params
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT)
+    utility = os.path.basename(args[0])
+
+    with _measure(utility, category=_CATEGORY_UTILITY) as span:
+        # run utility
+        process = subprocess.Popen(
+            args,    # util + params
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            preexec_fn=preexec_fn)
+
+        # get result and decode it
+        out, _ = process.communicate()
+        out = '' if not out else out.decode('utf-8')
+
+        if span is not None:
+            span.exit_code = process.returncode
+            span.output_size = len(out)
+
+        # write new log entry if possible
+        write_utility_log(logfile, args, out)
 
-    # get result and decode it
-    out, _ = process.communicate()
-    out = '' if not out else out.decode('utf-8')
+        # format exception, if needed
+        error_code = process.returncode
+        if error_code:
+            error_text = (u"{} failed with exit code {}\n"
+                          u"log:\n----\n{}\n").format(args[0], error_code, out)
+
+            raise ExecUtilException(error_text, error_code)
+
+    return out
+
+
+def write_utility_log(logfile, args, out):
+    """
+    Append utility's args and output to a log file (if possible).
+    """
 
-    # write new log entry if possible
     try:
         with io.open(logfile, 'a') as file_out:
             # write util's name and args
@@ -96,15 +127,25 @@ def execute_utility(args, logfile):
     except IOError:
         pass
 
-    # format exception, if needed
-    error_code = process.returncode
-    if error_code:
-        error_text = (u"{} failed with exit code {}\n"
-                      u"log:\n----\n{}\n").format(args[0], error_code, out)
 
-        raise ExecUtilException(error_text, error_code)
+def get_dump_format(path):
+    """
+    Detect format of pg_dump's output ('plain' | 'custom' | 'directory' | 'tar').
+    """
 
-    return out
+    if os.path.isdir(path):
+        return 'directory'
+
+    with io.open(path, 'rb') as f:
+        header = f.read(512)
+
+    if header.startswith(b'PGDMP'):
+        return 'custom'
+
+    if header[257:262] == b'ustar':
+        return 'tar'
+
+    return 'plain'
 
 
 def get_bin_path(filename):
@@ -0,0 +1,521 @@
+# coding: utf-8
+"""
+Load generator which runs Python transactions in several processes.
+
+>>> workload = Workload()
+>>> @workload.transaction(weight=9)
+... def read(con):
+...     con.execute('select * from t where id = %s', random.randint(1, 100))
+>>> result = workload.run(node, processes=4, connections=8, duration=30)
+>>> result.tps, result.percentiles()
+"""
+
+from __future__ import division
+
+import bisect
+import multiprocessing
+import random
+import threading
+import time
+
+from collections import OrderedDict
+from six.moves import queue as _queue
+
+from .connection import close_quietly as _close_quietly
+from .exceptions import TestgresException
+from .histogram import LatencyHistogram
+from .querystats import QueryStatsCollector
+from .resources import get_cpu_count as _get_cpu_count
+
+# how often should parent check that workers are alive (seconds)
+_POLL_INTERVAL = 1.0
+
+
+def _mp_context():
+    # workers inherit the node and transaction functions
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+
+    return multiprocessing
+
+
+class TransactionStats(object):
+    """
+    Statistics of a transaction type.
+
+    Attributes:
+        count: number of committed transactions.
+        errors: {exception class name: count}.
+        latency: LatencyHistogram (us), includes schedule lag (rate only).
+        lag: LatencyHistogram of delays after scheduled start (us).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = OrderedDict()
+        self.latency = LatencyHistogram()
+        self.lag = LatencyHistogram()
+
+    def __repr__(self):
+        return '<TransactionStats "{}" count={} errors={}>'.format(
+            self.name, self.count, self.error_count)
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+    def record(self, latency, lag, error=None):
+        """
+        Add a transaction (durations are measured in seconds).
+        """
+
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+            return
+
+        self.count += 1
+        self.latency.record(latency * 1e6)
+        self.lag.record(lag * 1e6)
+
+    def merge(self, other):
+        self.count += other.count
+        self.latency.merge(other.latency)
+        self.lag.merge(other.lag)
+
+        for error, count in other.errors.items():
+            self.errors[error] = self.errors.get(error, 0) + count
+
+        return self
+
+    def percentiles(self, ps=(50, 95, 99)):
+        """
+        Return latency percentiles (ms).
+        """
+
+        return dict((p, v / 1000 if v is not None else None)
+                    for p, v in self.latency.percentiles(ps).items())
+
+    def to_dict(self):
+        return OrderedDict([
+            ('name', self.name),
+            ('count', self.count),
+            ('errors', self.errors),
+            ('latency', self.latency.to_dict()),
+            ('lag', self.lag.to_dict()),
+        ])
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['name'])
+        stats.count = data['count']
+        stats.errors = OrderedDict(data['errors'])
+        stats.latency = LatencyHistogram.from_dict(data['latency'])
+        stats.lag = LatencyHistogram.from_dict(data['lag'])
+
+        return stats
+
+
+class WorkloadResult(object):
+    """
+    Merged results of all workers.
+
+    Attributes:
+        transactions: {name: TransactionStats}.
+        clients: total number of connections.
+        duration: measured time (seconds), warmup excluded.
+    """
+
+    def __init__(self, transactions, clients, duration):
+        self.transactions = transactions
+        self.clients = clients
+        self.duration = duration
+
+    def __repr__(self):
+        return '<WorkloadResult tps={:.1f} errors={}>'.format(
+            self.tps, self.errors)
+
+    def __getitem__(self, name):
+        return self.transactions[name]
+
+    @property
+    def count(self):
+        return sum(t.count for t in self.transactions.values())
+
+    @property
+    def errors(self):
+        return sum(t.error_count for t in self.transactions.values())
+
+    @property
+    def tps(self):
+        return self.count / self.duration if self.duration else 0.0
+
+    @property
+    def latency(self):
+        """
+        LatencyHistogram (us) of all transaction types.
+        """
+
+        result = LatencyHistogram()
+        for stats in self.transactions.values():
+            result.merge(stats.latency)
+
+        return result
+
+    @property
+    def latency_avg(self):
+        mean = self.latency.mean
+        return mean / 1000 if mean is not None else None
+
+    def percentiles(self, ps=(50, 95, 99)):
+        """
+        Return latency percentiles (ms) of all transaction types.
+        """
+
+        return dict((p, v / 1000 if v is not None else None)
+                    for p, v in self.latency.percentiles(ps).items())
+
+    def metrics(self):
+        """
+        Return {metric: value} (see compare_configs()).
+        """
+
+        metrics = OrderedDict()
+        metrics['tps'] = self.tps
+        metrics['latency_avg'] = self.latency_avg
+
+        for p, value in sorted(self.percentiles().items()):
+            metrics['latency_p{:g}'.format(p)] = value
+
+        return metrics
+
+    def to_dict(self):
+        return OrderedDict([
+            ('clients', self.clients),
+            ('duration', self.duration),
+            ('transactions', [t.to_dict()
+                              for t in self.transactions.values()]),
+        ])
+
+
+class _Options(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Workload(object):
+    """
+    A set of weighted transactions, each one is a function
+    which receives a NodeConnection. Transaction is committed
+    after the function returns and rolled back if it raises.
+    """
+
+    def __init__(self):
+        self._names = []
+        self._funcs = []
+        self._weights = []
+        self._on_connect = None
+
+    def add(self, func, weight=1, name=None):
+        """
+        Register a transaction.
+
+        Args:
+            func: function(con), con is a NodeConnection.
+            weight: relative frequency of this transaction.
+            name: name in results (function's name by default).
+
+        Returns:
+            This instance of Workload.
+        """
+
+        if weight <= 0:
+            raise TestgresException('Weight must be positive')
+
+        name = name or func.__name__
+        if name in self._names:
+            raise TestgresException('Duplicate transaction "{}"'.format(name))
+
+        self._names.append(name)
+        self._funcs.append(func)
+        self._weights.append(weight)
+
+        return self
+
+    def transaction(self, weight=1, name=None):
+        """
+        Decorator form of add().
+        """
+
+        def decorator(func):
+            self.add(func, weight=weight, name=name)
+            return func
+
+        return decorator
+
+    def on_connect(self, func):
+        """
+        Call func(con) for each new connection (e.g. to set GUCs).
+        """
+
+        self._on_connect = func
+        return func
+
+    def run(self,
+            node,
+            processes=None,
+            connections=1,
+            duration=None,
+            transactions=None,
+            rate=None,
+            think_time=0,
+            warmup=0,
+            dbname='postgres',
+            username=None,
+            seed=None):
+        """
+        Run transactions in a pool of processes.
+
+        Args:
+            node: PostgresNode to be loaded.
+            processes: number of processes (CPU count by default).
+            connections: connections per process (each has its thread).
+            duration: measured time, seconds (like pgbench -T).
+            transactions: transactions per connection (like pgbench -t).
+            rate: target total rate, transactions per second (like -R).
+            think_time: pause after each transaction (seconds).
+            warmup: run for some seconds before measuring.
+            dbname: database name to connect to.
+            username: database user name.
+            seed: seed of random generators (for reproducible runs).
+
+        Returns:
+            An instance of WorkloadResult.
+        """
+
+        if not self._funcs:
+            raise TestgresException('Workload has no transactions')
+
+        if duration is None and transactions is None:
+            raise TestgresException('Either duration or transactions '
+                                    'should be specified')
+
+        processes = processes or _get_cpu_count()
+        clients = processes * connections
+
+        options = _Options(connections=connections,
+                           duration=duration,
+                           transactions=transactions,
+                           rate=rate / clients if rate else None,
+                           think_time=think_time,
+                           warmup=warmup,
+                           dbname=dbname,
+                           username=username,
+                           seed=seed)
+
+        ctx = _mp_context()
+        results = ctx.Queue()
+        go = ctx.Event()
+        start_time = ctx.Value('d', 0.0)
+
+        workers = [
+            ctx.Process(target=self._worker,
+                        args=(node, options, i, results, go, start_time))
+            for i in range(processes)
+        ]
+
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            # all connections should be established before start
+            self._collect(results, workers, 'ready')
+
+            start_time.value = time.time()
+            go.set()
+
+            done = self._collect(results, workers, 'done')
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+        merged = OrderedDict((name, TransactionStats(name))
+                             for name in self._names)
+        finished = start_time.value + warmup
+
+        for data in done:
+            finished = max(finished, data['finished'])
+
+            for item in data['transactions']:
+                merged[item['name']].merge(TransactionStats.from_dict(item))
+
+            if node.query_stats is not None and data['query_stats']:
+                node.query_stats.merge(
+                    QueryStatsCollector.from_dict(data['query_stats']))
+
+        # workers may stop before the deadline (transaction limit),
+        # while the last transactions may end a bit after it
+        measured = finished - (start_time.value + warmup)
+        if duration:
+            measured = min(measured, duration)
+
+        return WorkloadResult(merged, clients, measured)
+
+    @staticmethod
+    def _collect(results, workers, kind):
+        messages = []
+
+        while len(messages) < len(workers):
+            try:
+                msg_kind, index, data = results.get(timeout=_POLL_INTERVAL)
+            except _queue.Empty:
+                if not any(w.is_alive() for w in workers):
+                    raise TestgresException('Workload processes have died')
+                continue
+
+            if msg_kind == 'error':
+                raise TestgresException(
+                    'Workload process {} has failed: {}'.format(index, data))
+
+            assert msg_kind == kind
+            messages.append(data)
+
+        return messages
+
+    def _connect(self, node, options):
+        con = node.connect(options.dbname, options.username)
+
+        if self._on_connect is not None:
+            self._on_connect(con)
+            con.commit()
+
+        return con
+
+    def _worker(self, node, options, index, results, go, start_time):
+        try:
+            # statistics of this process only
+            if node.query_stats is not None:
+                node.query_stats = QueryStatsCollector()
+
+            cons = [self._connect(node, options)
+                    for _ in range(options.connections)]
+
+            results.put(('ready', index, None))
+            go.wait()
+
+            stats = [
+                OrderedDict((name, TransactionStats(name))
+                            for name in self._names)
+                for _ in cons
+            ]
+            errors = []
+
+            threads = []
+            for i, con in enumerate(cons):
+                seed = None
+                if options.seed is not None:
+                    seed = (options.seed, index, i)
+
+                t = threading.Thread(target=self._client,
+                                     args=(node, con, options, stats[i],
+                                           start_time.value, seed, errors))
+                t.start()
+                threads.append(t)
+
+            for t in threads:
+                t.join()
+
+            if errors:
+                raise errors[0]
+
+            merged = stats[0]
+            for other in stats[1:]:
+                for name, s in other.items():
+                    merged[name].merge(s)
+
+            query_stats = None
+            if node.query_stats is not None:
+                query_stats = node.query_stats.to_dict()
+
+            data = {
+                'finished': time.time(),
+                'transactions': [s.to_dict() for s in merged.values()],
+                'query_stats': query_stats,
+            }
+
+            results.put(('done', index, data))
+        except Exception as e:
+            results.put(('error', index, '{}: {}'.format(type(e).__name__, e)))
+
+    def _client(self, node, con, options, stats, start, seed, errors):
+        try:
+            self._client_loop(node, con, options, stats, start, seed)
+        except Exception as e:
+            errors.append(e)
+
+    def _client_loop(self, node, con, options, stats, start, seed):
+        rnd = random.Random(str(seed) if seed is not None else None)
+
+        # cumulative weights for weighted choice
+        bounds = []
+        total = 0
+        for weight in self._weights:
+            total += weight
+            bounds.append(total)
+
+        measure_from = start + options.warmup
+        deadline = None
+        if options.duration is not None:
+            deadline = measure_from + options.duration
+
+        scheduled = start
+        done = 0
+
+        while True:
+            if options.rate:
+                # Poisson arrivals, like pgbench -R
+                scheduled += rnd.expovariate(options.rate)
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.time()
+
+            if deadline is not None and scheduled >= deadline:
+                break
+
+            i = bisect.bisect_right(bounds, rnd.random() * total)
+            name, func = self._names[i], self._funcs[i]
+
+            started = time.time()
+            error = None
+            try:
+                func(con)
+                con.commit()
+            except Exception as e:
+                error = type(e).__name__
+                try:
+                    con.rollback()
+                except Exception:
+                    # connection might be broken
+                    _close_quietly(con)
+                    con = self._connect(node, options)
+
+            finished = time.time()
+
+            if scheduled >= measure_from:
+                stats[name].record(finished - scheduled,
+                                   started - scheduled,
+                                   error)
+
+                done += 1
+                if options.transactions and done >= options.transactions:
+                    break
+
+            if options.think_time:
+                time.sleep(options.think_time)
+
+        con.close()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Benchmarks of testgres' own hot paths (node lifecycle, queries).
+
+Usage:
+    ./tests/benchmark.py --repeat 20 --save baseline.json
+    ./tests/benchmark.py --baseline baseline.json --threshold 0.2
+
+Exit code is 1 if a median got worse than baseline by more than threshold.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import io
+import json
+import math
+import sys
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from testgres import \
+    TestgresConfig, \
+    get_new_node, \
+    get_pg_version
+
+
+@contextmanager
+def initdb_cache(enabled):
+    old = TestgresConfig.cache_initdb
+    TestgresConfig.cache_initdb = enabled
+    try:
+        yield
+    finally:
+        TestgresConfig.cache_initdb = old
+
+
+class Timer(object):
+    """
+    Collects durations of a measured block.
+    """
+
+    def __init__(self):
+        self.durations = []
+
+    @contextmanager
+    def measure(self):
+        started = time.time()
+        yield
+        self.durations.append(time.time() - started)
+
+
+def bench_init_no_cache(timer, repeat):
+    with initdb_cache(False):
+        for _ in range(repeat):
+            with get_new_node() as node:
+                with timer.measure():
+                    node.init()
+
+
+def bench_init_cache(timer, repeat):
+    with initdb_cache(True):
+        # fill the cache
+        get_new_node().init().cleanup().free_port()
+
+        for _ in range(repeat):
+            with get_new_node() as node:
+                with timer.measure():
+                    node.init()
+
+
+def bench_start(timer, repeat):
+    with get_new_node() as node:
+        node.init()
+        for _ in range(repeat):
+            with timer.measure():
+                node.start()
+            node.stop()
+
+
+def bench_stop(timer, repeat):
+    with get_new_node() as node:
+        node.init()
+        for _ in range(repeat):
+            node.start()
+            with timer.measure():
+                node.stop()
+
+
+def bench_restart(timer, repeat):
+    with get_new_node() as node:
+        node.init().start()
+        for _ in range(repeat):
+            with timer.measure():
+                node.restart()
+
+
+def bench_status(timer, repeat):
+    with get_new_node() as node:
+        node.init().start()
+        for _ in range(repeat):
+            with timer.measure():
+                node.status()
+
+
+def bench_execute(timer, repeat):
+    with get_new_node() as node:
+        node.init().start()
+        for _ in range(repeat):
+            with timer.measure():
+                node.execute('postgres', 'select 1')
+
+
+def bench_safe_psql(timer, repeat):
+    with get_new_node() as node:
+        node.init().start()
+        for _ in range(repeat):
+            with timer.measure():
+                node.safe_psql('postgres', 'select 1')
+
+
+def bench_backup_replica(timer, repeat):
+    with get_new_node() as master:
+        master.init(allow_streaming=True).start()
+        for _ in range(repeat):
+            with timer.measure():
+                with master.backup() as backup:
+                    replica = backup.spawn_replica()
+            replica.cleanup()
+            replica.free_port()
+
+
+def bench_catchup(timer, repeat):
+    with get_new_node() as master:
+        master.init(allow_streaming=True).start()
+        master.safe_psql('postgres', 'create table t(v int)')
+
+        with master.replicate().start() as replica:
+            for _ in range(repeat):
+                master.safe_psql('postgres', 'insert into t values (1)')
+                with timer.measure():
+                    replica.catchup()
+
+
+def bench_cleanup(timer, repeat):
+    for _ in range(repeat):
+        node = get_new_node().init().start()
+        with timer.measure():
+            node.cleanup()
+        node.free_port()
+
+
+# yapf: disable
+BENCHMARKS = OrderedDict([
+    ('init', bench_init_no_cache),
+    ('init_cached', bench_init_cache),
+    ('start', bench_start),
+    ('stop', bench_stop),
+    ('restart', bench_restart),
+    ('status', bench_status),
+    ('execute', bench_execute),
+    ('safe_psql', bench_safe_psql),
+    ('backup_replica', bench_backup_replica),
+    ('catchup', bench_catchup),
+    ('cleanup', bench_cleanup),
+])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    rank = max(int(math.ceil(p / 100 * len(values))), 1)
+    return values[rank - 1]
+
+
+def summarize(durations):
+    """
+    Distribution of durations (ms).
+    """
+
+    ms = [d * 1000 for d in durations]
+    mean = sum(ms) / len(ms)
+    var = sum((v - mean)**2 for v in ms) / max(len(ms) - 1, 1)
+
+    return OrderedDict([
+        ('count', len(ms)),
+        ('min', min(ms)),
+        ('median', percentile(ms, 50)),
+        ('mean', mean),
+        ('p95', percentile(ms, 95)),
+        ('max', max(ms)),
+        ('stddev', math.sqrt(var)),
+    ])
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compare medians with baseline.
+
+    Returns:
+        A list of (name, baseline median, new median).
+    """
+
+    regressions = []
+
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+
+        if stats['median'] > old['median'] * (1 + threshold):
+            regressions.append((name, old['median'], stats['median']))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='repetitions of each benchmark')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                        help='run only these benchmarks')
+    parser.add_argument('--save', help='save results to JSON file')
+    parser.add_argument('--baseline', help='compare with saved results')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='max allowed slowdown of median (0.2 == 20%%)')
+    args = parser.parse_args(argv)
+
+    results = OrderedDict()
+
+    print('PostgreSQL {}, {} repetitions\n'.format(
+        get_pg_version(), args.repeat))
+    print('{:<16} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'benchmark (ms)', 'min', 'median', 'mean', 'p95', 'max'))
+
+    for name, bench in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+
+        timer = Timer()
+        bench(timer, args.repeat)
+
+        stats = results[name] = summarize(timer.durations)
+        print('{:<16} {min:>10.2f} {median:>10.2f} {mean:>10.2f} '
+              '{p95:>10.2f} {max:>10.2f}'.format(name, **stats))
+
+    if args.save:
+        with io.open(args.save, 'w') as f:
+            data = json.dumps(results, indent=2)
+            f.write(data if isinstance(data, type(u'')) else data.decode())
+
+    if args.baseline:
+        with io.open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print('REGRESSION: {}: {:.2f} ms -> {:.2f} ms ({:+.1f}%)'.format(
+                name, old, new, (new / old - 1) * 100))
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
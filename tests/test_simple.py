@@ -2,6 +2,7 @@
 # coding: utf-8
 
 import os
+import shutil
 import subprocess
 import tempfile
 import testgres
@@ -28,6 +29,8 @@ from testgres import \
 from testgres import \
     NodeStatus, \
     IsolationLevel, \
+    ConfigAction, \
+    ConfigFile, \
     get_new_node
 
 from testgres import \
@@ -51,6 +54,23 @@ def util_is_executable(util):
             return True
 
 
+def module_exists(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def numpy_has_generator():
+    # datasets require numpy >= 1.17
+    try:
+        import numpy
+        return hasattr(numpy.random, 'default_rng')
+    except ImportError:
+        return False
+
+
 class SimpleTest(unittest.TestCase):
     def test_custom_init(self):
         with get_new_node('test') as node:
@@ -374,6 +394,59 @@ class SimpleTest(unittest.TestCase):
             # finally, remove dump
             os.remove(dump)
 
+    def test_dump_formats(self):
+        with get_new_node('node1') as node1:
+            node1.init().start()
+            node1.safe_psql('postgres',
+                            'create table test as '
+                            'select generate_series(1, 100) val;'
+                            'create index on test(val)')
+
+            for fmt in ('plain', 'custom', 'directory', 'tar'):
+                dump = node1.dump('postgres', format=fmt, jobs=2)
+
+                with get_new_node('node2') as node2:
+                    timings = node2.init().start().restore('postgres', dump)
+
+                    if fmt == 'plain':
+                        self.assertListEqual(list(timings.keys()), ['script'])
+                    else:
+                        self.assertListEqual(list(timings.keys()),
+                                             ['pre-data', 'data', 'post-data'])
+
+                    res = node2.execute('postgres', 'select count(*) from test')
+                    self.assertListEqual(res, [(100, )])
+
+                    # errors are not ignored anymore
+                    with self.assertRaises(ExecUtilException):
+                        node2.restore('postgres', dump)
+
+                if os.path.isdir(dump):
+                    shutil.rmtree(dump)
+                else:
+                    os.remove(dump)
+
+            # copy database without temp files
+            with get_new_node('node2') as node2:
+                node2.init().start()
+                node1.copy_database_to(node2, 'postgres', target_dbname='copy')
+
+                res = node2.execute('copy', 'select count(*) from test')
+                self.assertListEqual(res, [(100, )])
+
+                # names with quotes are escaped
+                node1.copy_database_to(node2, 'postgres',
+                                       target_dbname="it's \"q\"")
+
+                res = node2.execute("it's \"q\"", 'select count(*) from test')
+                self.assertListEqual(res, [(100, )])
+
+                # restore error is reported along with dump's
+                with self.assertRaises(ExecUtilException) as ctx:
+                    node1.copy_database_to(node2, 'postgres',
+                                           target_dbname='copy')
+                self.assertIn('pg_restore', str(ctx.exception))
+
     def test_users(self):
         with get_new_node('master') as node:
             node.init().start()
@@ -519,6 +592,958 @@ class SimpleTest(unittest.TestCase):
 
             self.assertTrue('tps' in out)
 
+    @unittest.skipUnless(
+        util_is_executable("pgbench"), "pgbench may be missing")
+    def test_pgbench_result(self):
+        with get_new_node('node') as node:
+            node.init().start()
+            node.pgbench_run(options=['-i'])
+
+            res = node.pgbench_run(options=['-T2', '-r', '--log'])
+            self.assertTrue('tps' in str(res))
+            self.assertTrue(res.tps > 0)
+            self.assertTrue(res.latency_avg > 0)
+            self.assertEqual(res.failed_transactions, 0)
+            self.assertTrue(len(res.statements) > 0)
+
+            # every transaction has been logged
+            self.assertEqual(res.histogram.count, res.transactions)
+            p = res.percentiles()
+            self.assertTrue(p[50] <= p[99] <= p[99.9])
+
+            res = node.pgbench_run(options=['-T3', '--log',
+                                            '--aggregate-interval=1'])
+            self.assertTrue(len(res.intervals) >= 2)
+
+            # logs of previous runs with the same prefix are ignored
+            log_dir = tempfile.mkdtemp()
+            try:
+                prefix = os.path.join(log_dir, 'run')
+                for _ in range(2):
+                    res = node.pgbench_run(options=['-t10', '--log',
+                                                    '--log-prefix', prefix])
+                    self.assertEqual(res.histogram.count, 10)
+                self.assertEqual(len(os.listdir(log_dir)), 2)
+            finally:
+                shutil.rmtree(log_dir, ignore_errors=True)
+
+    @unittest.skipUnless(
+        util_is_executable("pgbench"), "pgbench may be missing")
+    def test_pgbench_scripts(self):
+        from testgres.pgbench import has_custom_scripts
+
+        self.assertFalse(has_custom_scripts(None))
+        self.assertFalse(has_custom_scripts([('select-only', 2)]))
+        self.assertTrue(has_custom_scripts(['tpcb-like', 'select 1']))
+
+        # temp files are removed once poll() sees the process exit
+        script_dir = tempfile.mkdtemp()
+        proc = testgres.PgbenchProcess(['true'], script_dir=script_dir)
+        while proc.poll() is None:
+            time.sleep(0.01)
+        self.assertFalse(os.path.exists(script_dir))
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.pgbench_run(options=['-i'])
+
+            # custom scripts with weights
+            res = node.pgbench_run(
+                options=['-T2', '-c2', '-n'],
+                scripts=[('select 1', 3), ('select-only', 1)])
+            self.assertEqual(len(res.scripts), 2)
+            self.assertEqual(res.scripts[0].weight, 3)
+            self.assertTrue(res.threads >= 1)
+
+            # watch progress and stop early
+            proc = node.pgbench(options=['-T60', '-n'],
+                                scripts=['select 1'],
+                                progress=1)
+
+            samples = []
+            for sample in proc.progress():
+                samples.append(sample)
+                if len(samples) == 2:
+                    proc.stop()
+                    break
+
+            self.assertTrue(all(s.tps > 0 for s in samples))
+            self.assertNotEqual(proc.returncode, 0)
+
+    def test_pgbench_output(self):
+        out = ("transaction type: <builtin: TPC-B (sort of)>\n"
+               "scaling factor: 1\n"
+               "number of clients: 4\n"
+               "number of transactions actually processed: 3000\n"
+               "number of failed transactions: 2 (0.067%)\n"
+               "latency average = 1.667 ms\n"
+               "latency stddev = 0.500 ms\n"
+               "initial connection time = 6.520 ms\n"
+               "tps = 600.120 (without initial connection time)\n"
+               "statement latencies in milliseconds and failures:\n"
+               "         0.002           0  \\set aid random(1, 10)\n"
+               "         0.300           2  BEGIN;\n")
+
+        res = testgres.PgbenchResult(out)
+        self.assertEqual(res.clients, 4)
+        self.assertEqual(res.transactions, 3000)
+        self.assertEqual(res.failed_transactions, 2)
+        self.assertEqual(res.latency_avg, 1.667)
+        self.assertEqual(res.latency_stddev, 0.5)
+        self.assertEqual(res.initial_connection_time, 6.52)
+        self.assertEqual(res.tps, 600.12)
+        self.assertEqual(len(res.statements), 2)
+        self.assertEqual(res.statements[1].command, 'BEGIN;')
+        self.assertEqual(res.statements[1].failures, 2)
+
+    def test_latency_histogram(self):
+        hist = testgres.LatencyHistogram()
+        for i in range(1, 10001):
+            hist.record(i)
+
+        self.assertEqual(hist.count, 10000)
+        self.assertEqual(hist.min, 1)
+        self.assertEqual(hist.max, 10000)
+        self.assertEqual(hist.mean, 5000.5)
+
+        # relative error is less than 1%
+        for p, value in hist.percentiles((50, 99, 99.9)).items():
+            self.assertAlmostEqual(value, p * 100, delta=p)
+
+        # histograms can be merged
+        copy = testgres.LatencyHistogram.from_dict(hist.to_dict())
+        merged = copy + hist
+        self.assertEqual(merged.count, 20000)
+        self.assertEqual(merged.percentile(50), hist.percentile(50))
+
+    def test_metric_comparison(self):
+        from testgres.compare import welch_test
+
+        # reference values: t = 1, df = 8
+        diff, ci, p_value = welch_test([1, 2, 3, 4, 5], [2, 3, 4, 5, 6])
+        self.assertEqual(diff, 1)
+        self.assertAlmostEqual(p_value, 0.3466, places=4)
+        self.assertAlmostEqual(ci[0], -1.306, places=3)
+
+        tps = testgres.MetricComparison('tps', [100, 101, 99, 100],
+                                        [110, 111, 109, 112])
+        self.assertTrue(tps.significant)
+        self.assertEqual(tps.verdict, 'better')
+        self.assertAlmostEqual(tps.diff_pct, 10.5)
+
+        # same values for latency, but lower is better
+        lat = testgres.MetricComparison('latency_avg', tps.a, tps.b)
+        self.assertEqual(lat.verdict, 'worse')
+
+    @unittest.skipUnless(
+        util_is_executable("pgbench"), "pgbench may be missing")
+    def test_compare_configs(self):
+        res = testgres.compare_configs(workload=['-T1', '-n', '-S'],
+                                       delta={'work_mem': '8MB'},
+                                       rounds=2)
+
+        self.assertIn('tps', res.metrics)
+        self.assertEqual(len(res['tps'].a), 2)
+        self.assertIn(res['tps'].verdict, ('better', 'worse', 'same'))
+        self.assertIn('tps', str(res))
+
+    def test_sweep_grid(self):
+        from testgres.sweep import expand_grid
+
+        configs = expand_grid({'work_mem': ['4MB', '64MB'], 'jit': 'off'})
+        self.assertEqual(len(configs), 2)
+        self.assertEqual(list(configs[1].items()),
+                         [('work_mem', '64MB'), ('jit', 'off')])
+
+        res = testgres.SweepResult(['work_mem'], [
+            {'work_mem': '4MB', 'tps': 10.0, 'error': None},
+            {'work_mem': '64MB', 'tps': 20.0, 'error': None},
+        ])
+        self.assertEqual(res.best()['work_mem'], '64MB')
+
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            res.to_csv(f.name)
+            with open(f.name) as g:
+                self.assertEqual(g.readline().strip(), 'work_mem,tps,error')
+
+    @unittest.skipUnless(
+        util_is_executable("pgbench"), "pgbench may be missing")
+    def test_sweep(self):
+        res = testgres.run_sweep(grid={'work_mem': ['1MB', '4MB', 'bad']},
+                                 workload=['-t10', '-n', '-S'],
+                                 jobs=2)
+
+        self.assertEqual(len(res), 3)
+        self.assertEqual(res.settings, ['work_mem'])
+
+        # broken configuration doesn't stop the sweep
+        ok = [r for r in res if r['error'] is None]
+        self.assertEqual(len(ok), 2)
+        self.assertTrue(all(r['tps'] > 0 for r in ok))
+        self.assertTrue(all('latency_p99' in r for r in ok))
+
+    def test_metrics_hooks(self):
+        from testgres.utils import execute_utility
+
+        records = []
+        testgres.add_hook(records.append)
+
+        try:
+            with tempfile.NamedTemporaryFile() as log:
+                execute_utility(['echo', 'hello'], log.name)
+
+                with self.assertRaises(ExecUtilException):
+                    execute_utility(['false'], log.name)
+        finally:
+            testgres.remove_hook(records.append)
+
+        self.assertEqual([r.operation for r in records], ['echo', 'false'])
+        self.assertEqual(records[0].output_size, len('hello\n'))
+        self.assertEqual(records[1].exit_code, 1)
+        self.assertEqual(records[1].error, 'ExecUtilException')
+
+        # disabled by default
+        with tempfile.NamedTemporaryFile() as log:
+            execute_utility(['echo'], log.name)
+        self.assertEqual(len(records), 2)
+
+    def test_node_metrics(self):
+        configure_testgres(collect_metrics=True)
+
+        try:
+            with get_new_node('node') as node:
+                node.init().start()
+                node.execute('postgres', 'select 1')
+                node.stop()
+
+                metrics = node.metrics(reset=True)
+                for op in ('init', 'start', 'execute', 'stop', 'pg_ctl'):
+                    self.assertIn(op, metrics)
+
+                self.assertEqual(metrics['execute']['count'], 1)
+                self.assertEqual(metrics['execute']['errors'], 0)
+                self.assertEqual(node.metrics(), {})
+        finally:
+            configure_testgres(collect_metrics=False)
+
+    def test_chrome_tracer(self):
+        import json
+        import threading
+        from testgres.utils import execute_utility
+
+        def run_echo(log_name):
+            execute_utility(['echo', 'hello'], log_name)
+
+        with tempfile.NamedTemporaryFile() as log, \
+                tempfile.NamedTemporaryFile(suffix='.json') as trace:
+
+            with testgres.ChromeTracer(trace.name):
+                run_echo(log.name)
+
+                t = threading.Thread(target=run_echo, args=(log.name, ))
+                t.start()
+                t.join()
+
+            # tracer is not active anymore
+            run_echo(log.name)
+
+            with open(trace.name) as f:
+                events = json.load(f)['traceEvents']
+
+        spans = [e for e in events if e['ph'] == 'X']
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0]['name'], 'echo')
+        self.assertEqual(spans[0]['args']['exit_code'], 0)
+
+        # different threads have different lanes
+        self.assertNotEqual(spans[0]['tid'], spans[1]['tid'])
+        names = [e['args']['name'] for e in events if e['ph'] == 'M']
+        self.assertEqual(len(names), 2)
+
+    def test_query_stats(self):
+        from testgres.querystats import normalize_query
+
+        query = "select * from t where id in (1, 2) and s = 'a''b' and x = $1"
+        self.assertEqual(normalize_query(query),
+                         "select * from t where id in (?, ...) "
+                         "and s = ? and x = $1")
+
+        a = testgres.QueryStatsCollector()
+        a.record('select 1', 0.002, 1)
+        a.record('select 2', 0.004, 1)
+        self.assertEqual(len(a), 1)
+        self.assertEqual(a['select ?'].count, 2)
+
+        # collectors can be serialized and merged
+        b = testgres.QueryStatsCollector.from_dict(a.to_dict())
+        merged = a + b
+        self.assertEqual(merged['select ?'].count, 4)
+        self.assertEqual(merged['select ?'].total.max, 4000)
+        self.assertEqual(merged.diff(a)['select ?'][99], (4.0, 4.0))
+
+        with get_new_node('node') as node:
+            node.init().start()
+            stats = node.enable_query_stats()
+
+            node.execute('postgres', 'select generate_series(1, 10)')
+            with node.connect() as con:
+                con.execute('create table test(val int)')
+                con.execute('select * from test')
+
+            self.assertEqual(stats['select generate_series(?, ?)'].rows, 10)
+            self.assertEqual(stats['select * from test'].rows, 0)
+
+            total = stats['create table test(val int)'].total
+            self.assertEqual(total.count, 1)
+
+            self.assertIs(node.disable_query_stats(), stats)
+            node.execute('postgres', 'select 1')
+            self.assertNotIn('select ?', stats)
+
+    def test_stats_delta(self):
+        before = testgres.StatsSnapshot()
+        before.time, before.wal_lsn = 10, 100
+        before.database = {'datname': 'postgres', 'blks_hit': 5}
+        before.tables = {'public.a': {'n_tup_ins': 1}, 'public.b': {}}
+
+        after = testgres.StatsSnapshot()
+        after.time, after.wal_lsn = 12, 164
+        after.database = {'datname': 'postgres', 'blks_hit': 9}
+        after.tables = {'public.a': {'n_tup_ins': 3}, 'public.b': {}}
+
+        delta = after - before
+        self.assertEqual(delta.duration, 2)
+        self.assertEqual(delta.wal_bytes, 64)
+        self.assertEqual(delta.blocks_hit, 4)
+        self.assertEqual(delta.database['datname'], 'postgres')
+
+        # unchanged tables are omitted
+        self.assertEqual(list(delta.tables), ['public.a'])
+        self.assertEqual(delta.tables['public.a']['n_tup_ins'], 2)
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres', 'create table test(val int)')
+
+            with node.stats_delta(reset=True) as delta:
+                node.safe_psql('postgres',
+                               'insert into test select generate_series(1, 100)')
+
+            self.assertTrue(delta.wal_bytes > 0)
+            self.assertIn('public.test', node.stats_snapshot().tables)
+
+    def test_wait_event_sampler(self):
+        profile = testgres.WaitEventProfile(
+            {
+                ('CPU', 'CPU', 'select ?'): 3,
+                ('Lock', 'tuple', 'update t set v = ?'): 5,
+                ('Lock', 'tuple', 'delete from t'): 1
+            },
+            samples=10,
+            duration=0.1)
+
+        self.assertEqual(profile.top(1), [(('Lock', 'tuple'), 6)])
+        self.assertIn('update t set v = ?;Lock;tuple 5', profile.folded())
+        self.assertIn('select ?;CPU 3', profile.folded())
+
+        with get_new_node('node') as node:
+            node.init().start()
+
+            with node.wait_event_sampler(interval=0.005) as sampler:
+                node.execute('postgres', 'select pg_sleep(0.5)')
+
+            profile = sampler.profile()
+            self.assertTrue(profile.samples > 10)
+
+            queries = [key[2] for key in profile.counts]
+            self.assertIn('select pg_sleep(?)', queries)
+
+    def test_resource_usage(self):
+        from testgres.procfs import backend_type_from_title
+
+        self.assertEqual(backend_type_from_title('postgres -D data'),
+                         'postmaster')
+        self.assertEqual(backend_type_from_title('postgres: checkpointer'),
+                         'checkpointer')
+        self.assertEqual(backend_type_from_title('postgres: writer process'),
+                         'background writer')
+        self.assertEqual(
+            backend_type_from_title('postgres: user db [local] idle'),
+            'client backend')
+
+        # current process is a fine example
+        before = testgres.ResourceUsage.collect(os.getpid())
+        sum(range(10**6))
+        after = testgres.ResourceUsage.collect(os.getpid())
+
+        delta = after - before
+        self.assertTrue(delta.total['processes'] >= 1)
+        self.assertTrue(delta.total['cpu_user'] >= 0)
+        self.assertTrue(delta.total['rss'] > 0)
+
+        with get_new_node('node') as node:
+            node.init().start()
+
+            with node.resource_monitor(interval=0.1) as monitor:
+                node.safe_psql('postgres', 'select count(*) from pg_class')
+
+            usage = node.resource_usage()
+            self.assertIn('postmaster', usage.by_backend_type)
+            self.assertIn('checkpointer', usage.by_backend_type)
+
+            self.assertTrue(len(monitor.samples) >= 2)
+            self.assertTrue(monitor.peak('rss') > 0)
+
+    def test_cpu_isolation(self):
+        from testgres.resources import isolate_command
+
+        sets = testgres.split_cpus(2, cpus=range(8))
+        self.assertEqual(sets[0], ({0, 1, 2}, {3}))
+        self.assertEqual(sets[1], ({4, 5, 6}, {7}))
+
+        sets = testgres.split_cpus(2, clients=False, cpus=range(4))
+        self.assertEqual([s.server for s in sets], [{0, 1}, {2, 3}])
+
+        with self.assertRaises(testgres.TestgresException):
+            testgres.split_cpus(3, cpus=range(2))
+
+        args, preexec_fn = isolate_command(['pgbench'])
+        self.assertEqual(args, ['pgbench'])
+        self.assertIsNone(preexec_fn)
+
+        # utility's name is kept (e.g. for metrics)
+        args, preexec_fn = isolate_command(['cat', '/proc/self/stat'],
+                                           nice=1,
+                                           ionice=('best-effort', 7))
+        self.assertEqual(args, ['cat', '/proc/self/stat'])
+
+        # field 19 is niceness
+        out = subprocess.check_output(args, preexec_fn=preexec_fn)
+        self.assertEqual(int(out.split()[18]), os.nice(0) + 1)
+
+        with self.assertRaises(testgres.TestgresException):
+            isolate_command(['pgbench'], ionice='fastest')
+
+        # CPU affinity is available on Python 3 only
+        if not hasattr(os, 'sched_setaffinity'):
+            return
+
+        with get_new_node('node') as node:
+            cpus = sorted(os.sched_getaffinity(0))[:1]
+            node.init().start(cpus=cpus, nice=1)
+
+            self.assertEqual(os.sched_getaffinity(node.pid), set(cpus))
+
+            # restart keeps the same CPUs
+            node.restart()
+            self.assertEqual(os.sched_getaffinity(node.pid), set(cpus))
+
+    def test_explain(self):
+        import json
+        from testgres.plan import QueryPlan
+
+        def scan(node_type, **extra):
+            plan = {'Node Type': node_type, 'Relation Name': 't',
+                    'Plan Rows': 10, 'Actual Rows': 1000, 'Actual Loops': 1,
+                    'Shared Hit Blocks': 5}
+            plan.update(extra)
+            return [{'Plan': {'Node Type': 'Aggregate', 'Strategy': 'Plain',
+                              'Plan Rows': 1, 'Plans': [plan]}}]
+
+        seq = QueryPlan.from_json(json.dumps(scan('Seq Scan')))
+        idx = QueryPlan(scan('Index Scan', **{'Index Name': 't_pkey'}))
+
+        self.assertEqual(seq.root.children[0].buffers['shared_hit_blocks'], 5)
+        self.assertEqual(seq.find('Seq Scan')[0].label, 'Seq Scan on t')
+        self.assertEqual(len(seq.misestimates()), 1)
+
+        # costs and row counts don't affect shape
+        other = scan('Seq Scan', **{'Plan Rows': 999, 'Total Cost': 1.0})
+        self.assertEqual(seq.fingerprint(), QueryPlan(other).fingerprint())
+        self.assertNotEqual(seq.fingerprint(), idx.fingerprint())
+
+        self.assertEqual(testgres.diff_plans(seq, seq), [])
+        self.assertEqual(testgres.diff_plans(idx, seq), [
+            testgres.PlanChange('0.0', 'Index Scan using t_pkey on t',
+                                'Seq Scan on t')
+        ])
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres',
+                           'create table t as select generate_series(1, 1000) i;'
+                           'create index on t(i); analyze t')
+
+            plan = node.explain('postgres', 'select * from t where i = 1')
+            self.assertTrue(plan.execution_time is not None)
+            self.assertEqual(len(plan.find('Seq Scan')), 0)
+
+            plan = node.explain('postgres', 'delete from t', analyze=True)
+            self.assertEqual(plan.root.node_type, 'Delete')
+
+            # analyzed query has been rolled back
+            self.assertEqual(node.execute('postgres', 'select count(*) from t'),
+                             [(1000, )])
+
+    def test_slow_queries(self):
+        from testgres.slowlog import parse_slow_queries
+
+        plan = ('{"Query Text": "select pg_sleep(0.1)", "Plan": '
+                '{"Node Type": "Result", "Plan Rows": 1}}')
+        text = '\n'.join([
+            '2024-01-01 00:00:00.000 UTC [42] LOG:  statement: select 1',
+            '2024-01-01 00:00:00.100 UTC [42] LOG:  duration: 100.5 ms  plan:',
+            '\t' + plan,
+            '2024-01-01 00:00:00.100 UTC [42] LOG:  duration: 101.0 ms  '
+            'statement: select',
+            '\tpg_sleep(0.1)',
+            '2024-01-01 00:00:00.200 UTC [43] LOG:  duration: 0.5 ms  '
+            'execute S_1: select 2',
+        ])
+
+        queries = parse_slow_queries(text)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[0].pid, 42)
+        self.assertEqual(queries[0].duration, 101.0)
+        self.assertEqual(queries[0].statement, 'select\npg_sleep(0.1)')
+        self.assertEqual(queries[0].plan.root.node_type, 'Result')
+        self.assertEqual(queries[1].statement, 'select 2')
+        self.assertIsNone(queries[1].plan)
+
+        log = testgres.SlowQueryLog(queries)
+        self.assertEqual(log.max_duration, 101.0)
+        self.assertEqual(log.exceeding(1), queries[:1])
+
+        # log_statement = 'all' (default) makes durations bare
+        text = '\n'.join([
+            '2024-01-01 00:00:00.000 UTC [44] LOG:  duration: 0.1 ms  '
+            'parse <unnamed>: select pg_sleep(0.2)',
+            '2024-01-01 00:00:00.000 UTC [44] LOG:  duration: 0.1 ms  '
+            'bind <unnamed>: select pg_sleep(0.2)',
+            '2024-01-01 00:00:00.000 UTC [44] LOG:  '
+            'execute <unnamed>: select pg_sleep(0.2)',
+            '2024-01-01 00:00:00.000 UTC [45] LOG:  statement: select 3',
+            '2024-01-01 00:00:00.200 UTC [44] LOG:  duration: 200.0 ms',
+        ])
+
+        queries = parse_slow_queries(text)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0].pid, 44)
+        self.assertEqual(queries[0].duration, 200.0)
+        self.assertEqual(queries[0].statement, 'select pg_sleep(0.2)')
+
+        with get_new_node('node') as node:
+            node.init().start()
+
+            with node.capture_slow_queries(min_duration=50) as log:
+                node.execute('postgres', 'select pg_sleep(0.1)')
+                node.execute('postgres', 'select 1')
+
+            self.assertEqual(len(log), 1)
+            self.assertTrue(log.max_duration >= 100)
+            self.assertIn('pg_sleep', log.slowest()[0].statement)
+            self.assertIsNone(log.slowest()[0].plan)
+
+            with node.capture_slow_queries(min_duration=50,
+                                           auto_explain=True) as log:
+                node.execute('postgres', 'select pg_sleep(0.1)')
+                node.execute('postgres', 'select 1')
+
+            self.assertEqual(len(log), 1)
+            self.assertTrue(log.max_duration >= 100)
+            self.assertIsNotNone(log.slowest()[0].plan)
+
+            # settings have been reverted
+            self.assertNotIn('log_min_duration_statement', node.settings())
+
+    def test_workload(self):
+        from testgres.workload import TransactionStats
+
+        a, b = TransactionStats('read'), TransactionStats('read')
+        a.record(0.001, 0)
+        a.record(0.002, 0, error='InternalError')
+        b.record(0.003, 0.001)
+
+        stats = TransactionStats.from_dict(a.to_dict()).merge(b)
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(stats.errors, {'InternalError': 1})
+        self.assertEqual(stats.latency.max, 3000)
+
+        result = testgres.WorkloadResult({'read': stats}, clients=1,
+                                         duration=2)
+        self.assertEqual(result.tps, 1)
+        self.assertEqual(result.errors, 1)
+        self.assertIn('latency_p99', result.metrics())
+
+        workload = testgres.Workload()
+        with self.assertRaises(testgres.TestgresException):
+            workload.run(None, duration=1)
+
+        @workload.transaction(weight=3)
+        def read(con):
+            con.execute('select count(*) from t')
+
+        @workload.transaction()
+        def fail(con):
+            con.execute('select 1 / 0')
+
+        with self.assertRaises(testgres.TestgresException):
+            workload.add(read)
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres', 'create table t as select 1 as i')
+
+            result = workload.run(node,
+                                  processes=2,
+                                  connections=2,
+                                  transactions=20,
+                                  warmup=0.1)
+
+            self.assertEqual(result.clients, 4)
+            self.assertEqual(result.count + result.errors, 80)
+            self.assertTrue(result['read'].count > 0)
+            self.assertEqual(result['fail'].count, 0)
+            self.assertTrue(result['fail'].error_count > 0)
+
+            result = workload.run(node, processes=1, duration=1, rate=50)
+            self.assertTrue(20 < result.count + result.errors < 100)
+            self.assertTrue(result.duration <= 1)
+
+            # transaction limit is reached long before the deadline
+            result = workload.run(node, duration=60, transactions=5)
+            self.assertTrue(result.duration < 60)
+
+    def test_workload_replay(self):
+        text = '\n'.join([
+            '2024-01-01 00:00:00.000 UTC [10] LOG:  statement: begin',
+            '2024-01-01 00:00:00.500 UTC [11] LOG:  duration: 0.100 ms  '
+            'parse <unnamed>: select $1, $10',
+            '2024-01-01 00:00:00.500 UTC [11] LOG:  execute <unnamed>: '
+            'select $1, $10',
+            '2024-01-01 00:00:00.500 UTC [11] DETAIL:  '
+            "parameters: $1 = 'a''b', $10 = NULL",
+            '2024-01-01 00:00:01.000 UTC [10] LOG:  statement: select',
+            '\t1',
+            # log_statement = 'all' makes durations bare
+            '2024-01-01 00:00:01.002 UTC [10] LOG:  duration: 2.000 ms',
+            '2024-01-01 00:00:01.500 UTC [10] ERROR:  oops',
+            '2024-01-01 00:00:01.503 UTC [11] LOG:  duration: 3.000 ms  '
+            'statement: select 2',
+            '2024-01-01 00:00:02.000 UTC [10] LOG:  statement: commit',
+        ])
+
+        captured = testgres.CapturedWorkload.from_log(text)
+        self.assertEqual(len(captured.sessions), 2)
+        self.assertEqual(captured.statement_count, 5)
+        self.assertEqual(captured.duration, 2)
+
+        s10, s11 = captured.sessions
+        self.assertEqual([st.query for st in s10.statements],
+                         ['begin', 'select\n1', 'commit'])
+        self.assertEqual(s10.statements[1].duration, 2)
+        self.assertIsNone(s10.statements[2].duration)
+        self.assertEqual([st.query for st in s11.statements],
+                         ["select 'a''b', NULL", 'select 2'])
+        self.assertEqual(s11.statements[1].duration, 3)
+        self.assertAlmostEqual(s11.statements[1].time - s11.statements[0].time,
+                               1.0)
+
+        # csvlog provides database and user names
+        csv_line = ('2024-01-01 00:00:00.000 UTC,"user","db",10,'
+                    '"[local]",5f00.a,1,"SELECT",2024-01-01 00:00:00 UTC,'
+                    '3/1,0,LOG,00000,"statement: select 1",,,,,,,,,"psql"\n')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(csv_line)
+            f.flush()
+
+            from_csv = testgres.CapturedWorkload.from_csvlog(f.name)
+            self.assertEqual(from_csv.sessions[0].dbname, 'db')
+            self.assertEqual(from_csv.sessions[0].statements[0].query,
+                             'select 1')
+
+        copy = testgres.CapturedWorkload.from_dict(captured.to_dict())
+        self.assertEqual(copy.sessions[0].statements, s10.statements)
+
+        with get_new_node('a') as a, get_new_node('b') as b:
+            a.init().start()
+            b.init().start()
+
+            with a.capture_workload() as captured:
+                with a.connect() as con:
+                    con.execute('select 1')
+                    con.execute("select 'x'")
+                    con.commit()
+
+            self.assertTrue(captured.statement_count >= 2)
+
+            # log_min_duration_statement = 0 during capture
+            self.assertIn('select ?', captured.query_stats())
+            self.assertNotIn('log_min_duration_statement', a.settings())
+
+            result = captured.replay(b, speed=None)
+            self.assertEqual(result.errors, {})
+            self.assertIn('select ?', result.query_stats)
+            self.assertIn('select ?', result.diff(captured.replay(a)))
+
+    def test_copy(self):
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres', 'create table t(i int, s text)')
+
+            with node.connect() as con:
+                chunks = (b'%d\tx%d\n' % (i, i) for i in range(1000))
+                self.assertEqual(con.copy_from('t', chunks), 1000)
+                self.assertEqual(con.copy_from('t', b'1\t\\N\n'), 1)
+                con.commit()
+
+                data = con.copy_to('select * from t where s is null')
+                self.assertEqual(data, b'1\t\\N\n')
+
+                data = con.copy_to('t', columns=['i'], format='csv')
+                self.assertEqual(len(data.splitlines()), 1001)
+
+    @unittest.skipUnless(numpy_has_generator(), 'numpy >= 1.17 may be missing')
+    def test_dataset(self):
+        from testgres.dataset import \
+            Categorical, Correlated, Normal, Sequence, Text, Timestamp, Zipf
+
+        def make(seed):
+            ds = testgres.Dataset('items', seed=seed)
+            ds.column('id', 'bigint', Sequence())
+            ds.column('hot', 'int', Zipf(100, s=1.5))
+            ds.column('price', 'float8', Normal(100, 10, decimals=2))
+            ds.column('tax', 'float8', Correlated('price', lambda p: p * 0.2))
+            ds.column('kind', 'text', Categorical(['a\tb', 'c'], [1, 3]),
+                      nulls=0.1)
+            ds.column('name', 'text', Text(8))
+            ds.column('ts', 'timestamp',
+                      Timestamp('2024-01-01', '2024-12-31'))
+            return ds
+
+        arrays, masks = make(1).generate(offset=10, size=1000, chunk=1)
+        self.assertEqual(arrays['id'][0], 11)
+        self.assertTrue(1 <= arrays['hot'].min() <= arrays['hot'].max() <= 100)
+        self.assertEqual(round(arrays['tax'][0], 2),
+                         round(arrays['price'][0] * 0.2, 2))
+
+        data = make(1).encode(arrays, masks)
+        self.assertEqual(len(data.splitlines()), 1000)
+        self.assertIn(b'a\\tb', data)
+        self.assertIn(b'\t\\N\t', data)
+
+        # same seed and chunk give same data
+        again = make(1).encode(*make(1).generate(10, 1000, 1))
+        self.assertEqual(data, again)
+        other = make(2).encode(*make(2).generate(10, 1000, 1))
+        self.assertNotEqual(data, other)
+
+        with get_new_node('node') as node:
+            node.init().start()
+
+            ds = make(42)
+            res = ds.load(node, rows=25000, chunk_size=10000,
+                          connections=2, create=True)
+            self.assertEqual(res.rows, 25000)
+
+            res = node.execute('postgres',
+                               'select count(*), max(id) from items')
+            self.assertEqual(res, [(25000, 25000)])
+
+    def test_bulk_load(self):
+        from testgres.loader import split_lines
+
+        self.assertEqual(split_lines(b'h\na\nb\nc\n', 2, skip_header=True),
+                         [(2, 6), (6, 8)])
+        self.assertEqual(split_lines(b'a\nb\n', 8), [(0, 2), (2, 4)])
+        self.assertEqual(split_lines(b'', 2), [])
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres', 'create table t(i int, s text)')
+
+            with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+                f.write(b'i,s\n')
+                for i in range(10000):
+                    f.write(b'%d,x\n' % i)
+                f.flush()
+
+                res = node.bulk_load('t', f.name,
+                                     connections=3,
+                                     format='csv',
+                                     header=True,
+                                     post_load=['create index on t(i)'])
+
+                # binary files can't be split at line breaks
+                with self.assertRaises(testgres.TestgresException):
+                    node.bulk_load('t', f.name, format='binary')
+
+            self.assertEqual(res.rows, 10000)
+            self.assertEqual(len(res.workers), 3)
+            self.assertTrue(all(w.rows > 0 for w in res.workers))
+            self.assertEqual(list(res.post_load),
+                             ['create index on t(i)', 'analyze t'])
+
+            # chunks may be produced lazily by workers
+            chunks = (lambda i=i: b'%d\ty\n' % i for i in range(100))
+            res = node.bulk_load('t', chunks, connections=2, analyze=False)
+            self.assertEqual(res.rows, 100)
+
+            count = node.execute('postgres', 'select count(*) from t')
+            self.assertEqual(count, [(10100, )])
+
+    @unittest.skipUnless(module_exists('numpy'), 'numpy may be missing')
+    def test_fetch_columns(self):
+        from testgres.columns import to_structured, _convert
+
+        self.assertEqual(_convert([1, 2], 23).dtype.name, 'int32')
+        self.assertEqual(_convert([1, None], 23).dtype.name, 'float64')
+        self.assertEqual(_convert(['a', None], 25).dtype.name, 'object')
+
+        arr = to_structured({'a': _convert([1, 2], 20)})
+        self.assertEqual(arr['a'].tolist(), [1, 2])
+
+        with get_new_node('node') as node:
+            node.init().start()
+
+            query = ('select i, i * 0.5 as half, i % 2 = 0 as even, '
+                     "'2024-01-01'::timestamp + i * interval '1s' as ts, "
+                     'nullif(i, 3) as maybe '
+                     'from generate_series(1, 2500) i')
+
+            with node.connect() as con:
+                # numeric column: server-side cursor, several batches
+                cols = con.fetch_columns(query, batch_size=1000)
+                self.assertEqual(list(cols),
+                                 ['i', 'half', 'even', 'ts', 'maybe'])
+                self.assertEqual(cols['i'].dtype.name, 'int32')
+                self.assertEqual(cols['i'].sum(), 2500 * 2501 // 2)
+                self.assertEqual(cols['half'].dtype.name, 'float64')
+                self.assertEqual(cols['even'].sum(), 1250)
+                self.assertEqual(cols['ts'].dtype.name, 'datetime64[us]')
+                self.assertEqual(cols['maybe'].dtype.name, 'float64')
+
+                # forced binary COPY: buffered, decoded in batches
+                copied = con.fetch_columns(query, batch_size=1000,
+                                           binary=True)
+                for name in cols:
+                    self.assertEqual(copied[name].tolist(),
+                                     cols[name].tolist())
+
+                # fixed-width columns: binary COPY or forced cursor
+                fixed = ('select i::int8 as i, i * 0.5::float8 as half '
+                         'from generate_series(1, 2500) i')
+                direct = con.fetch_columns(fixed)
+                cursor = con.fetch_columns(fixed, batch_size=1000,
+                                           binary=False)
+                self.assertEqual(direct['i'].dtype.name, 'int64')
+                self.assertEqual(direct['half'].sum(), 2500 * 2501 / 4.0)
+                for name in direct:
+                    self.assertEqual(direct[name].tolist(),
+                                     cursor[name].tolist())
+
+                arr = con.fetch_columns('select 1 as a, 2.5::float8 as b',
+                                        structured=True)
+                self.assertEqual(arr['b'][0], 2.5)
+
+                empty = con.fetch_columns('select 1 as a where false')
+                self.assertEqual(len(empty['a']), 0)
+
+    def test_copy_binary(self):
+        import datetime
+        import decimal
+        import uuid
+
+        types = ['smallint', 'int', 'bigint', 'real', 'float8', 'bool',
+                 'text', 'bytea', 'timestamp', 'uuid', 'numeric(10, 4)']
+        row = (1, -2, 3, 1.5, 0.25, True, u'été', b'\x00\xff',
+               datetime.datetime(1999, 12, 31, 23, 59, 59, 5),
+               uuid.UUID(int=42), decimal.Decimal('-12345.0670'))
+
+        enc = testgres.CopyEncoder(types)
+        dec = testgres.CopyDecoder(types)
+        data = enc.header() + enc.encode_rows([row, (None, ) * 11]) + \
+            enc.trailer()
+        self.assertEqual(dec.rows(data), [row, (None, ) * 11])
+        self.assertEqual(dec.rows(bytearray(data))[0], row)
+
+        # round values lose trailing zero groups on the wire
+        values = [decimal.Decimal(v) for v in
+                  ['1E+30', '1E+100', '-1E+100', '1E-20', '0.000', 'NaN']]
+        enc = testgres.CopyEncoder(['numeric'])
+        dec = testgres.CopyDecoder(['numeric'])
+        data = enc.header() + enc.encode_rows([(v, ) for v in values]) + \
+            enc.trailer()
+        self.assertEqual([str(r[0]) for r in dec.rows(data)[:-1]],
+                         ['1' + '0' * 30, '1' + '0' * 100,
+                          '-1' + '0' * 100, '1E-20', '0.000'])
+        self.assertTrue(dec.rows(data)[-1][0].is_nan())
+
+        with self.assertRaises(testgres.TestgresException):
+            testgres.CopyEncoder(['int4', 'no_such_type'])
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres',
+                           'create table t(i int, u uuid, n numeric)')
+
+            rows = [(i, uuid.UUID(int=i), decimal.Decimal(i) / 4)
+                    for i in range(1000)] + [(None, None, None)]
+
+            with node.connect() as con:
+                types = ['int4', 'uuid', 'numeric']
+                self.assertEqual(con.copy_from('t', rows, types=types), 1001)
+                con.commit()
+
+                self.assertEqual(con.copy_to('t', types=types), rows)
+                self.assertEqual(
+                    con.copy_to('select n from t where i = 2',
+                                types=['numeric']),
+                    [(decimal.Decimal('0.50'), )])
+
+    @unittest.skipUnless(numpy_has_generator(), 'numpy >= 1.17 may be missing')
+    def test_copy_binary_numpy(self):
+        import numpy as np
+        from collections import OrderedDict
+        from testgres.dataset import Normal, Sequence, Timestamp
+
+        ds = testgres.Dataset('items', seed=1)
+        ds.column('id', 'bigint', Sequence())
+        ds.column('price', 'float8', Normal(100, 10))
+        ds.column('ts', 'timestamp', Timestamp('2024-01-01', '2024-12-31'))
+
+        arrays, masks = ds.generate(offset=0, size=100)
+        data = ds.encode(arrays, masks, format='binary')
+
+        # fixed-width columns without NULLs are read without copying rows
+        dec = testgres.CopyDecoder(['int8', 'float8', 'timestamp'])
+        for a, b in zip(dec.arrays(data), arrays.values()):
+            self.assertTrue((a == b).all())
+
+        with get_new_node('node') as node:
+            node.init().start()
+            node.safe_psql('postgres', ds.create_table_sql())
+
+            ds.load(node, rows=5000, chunk_size=1000, format='binary')
+
+            with node.connect() as con:
+                cols = con.fetch_columns('select * from items', binary=True)
+                self.assertEqual(cols['id'].sum(), 5000 * 5001 // 2)
+                self.assertEqual(cols['ts'].dtype.name, 'datetime64[us]')
+
+                with self.assertRaises(testgres.TestgresException):
+                    con.fetch_columns('select $1::int', 1, binary=True)
+
+                columns = OrderedDict([('id', np.arange(3)),
+                                       ('price', np.ones(3))])
+                con.copy_from('items', columns, columns=list(columns),
+                              types=['int8', 'float8'])
+                con.commit()
+
+            self.assertEqual(node.execute('postgres',
+                                          'select count(*) from items'),
+                             [(5003, )])
+
     def test_reload(self):
         with get_new_node('node') as node:
             node.init().start()
@@ -537,6 +1562,166 @@ class SimpleTest(unittest.TestCase):
             self.assertEqual('debug1', cmm_new[0][0].lower())
             self.assertNotEqual(cmm_old, cmm_new)
 
+    def test_settings(self):
+        with get_new_node('node') as node:
+            node.init().start()
+
+            # reload is enough for work_mem
+            with node.settings() as conf:
+                conf['work_mem'] = '8MB'
+                conf['client_min_messages'] = 'DEBUG1'
+            self.assertEqual(conf.apply(), ConfigAction.Nothing)
+
+            res = node.execute('postgres', 'show work_mem')
+            self.assertEqual(res[0][0], '8MB')
+
+            # shared_buffers needs restart
+            conf = node.settings()
+            conf['shared_buffers'] = '16MB'
+            self.assertEqual(conf.required_action(), ConfigAction.Restart)
+            self.assertEqual(conf.apply(), ConfigAction.Restart)
+
+            res = node.execute('postgres', 'show shared_buffers')
+            self.assertEqual(res[0][0], '16MB')
+
+            # no duplicates in postgresql.conf
+            node.settings().set('work_mem', '16MB').apply()
+            conf_file = os.path.join(node.data_dir, 'postgresql.conf')
+            with open(conf_file, 'r') as f:
+                lines = [s for s in f.readlines() if 'work_mem' in s]
+                self.assertEqual(lines, ['work_mem = 16MB\n'])
+
+    def test_config_file(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as f:
+            f.write("# comment\n"
+                    "port = 5432 # trailing comment\n"
+                    "work_mem='1MB'\n"
+                    "search_path = 'a, ''b'''\n"
+                    "WORK_MEM = 2MB\n")
+
+        try:
+            conf = ConfigFile(f.name)
+            self.assertEqual(conf.get('port'), '5432')
+            self.assertEqual(conf.get('work_mem'), '2MB')
+            self.assertEqual(conf.get('search_path'), "a, 'b'")
+
+            # duplicates are removed
+            self.assertTrue(conf.set('work_mem', '4MB'))
+            self.assertFalse(conf.set('work_mem', '4MB'))
+            self.assertTrue(conf.set('listen_addresses', '127.0.0.1'))
+            self.assertTrue(conf.set('fsync', False))
+            conf.save()
+
+            with open(f.name, 'r') as f2:
+                text = f2.read()
+                self.assertEqual(text.count('work_mem'), 1)
+                self.assertTrue('# comment' in text)
+                self.assertTrue("listen_addresses = '127.0.0.1'" in text)
+                self.assertTrue('fsync = off' in text)
+        finally:
+            os.remove(f.name)
+
+    def test_profiles(self):
+        with get_new_node('node') as node:
+            node.init(profile='fast-ephemeral').start()
+
+            res = node.execute('postgres', 'show synchronous_commit')
+            self.assertEqual(res[0][0], 'off')
+            res = node.execute('postgres', 'show wal_level')
+            self.assertEqual(res[0][0], 'minimal')
+
+        # dense profile scales with node's share of the host
+        small = testgres.HostResources(cpus=4, memory=8 * 1024**3)
+        conf = testgres.get_profile_settings('dense', 1000, resources=small)
+        self.assertEqual(conf['max_connections'], 5)
+        self.assertEqual(conf['shared_buffers'], '2MB')
+        self.assertEqual(conf['max_worker_processes'], 2)
+
+        big = testgres.HostResources(cpus=64, memory=256 * 1024**3)
+        conf = testgres.get_profile_settings('dense', 16, resources=big)
+        self.assertEqual(conf['max_connections'], 20)
+        self.assertEqual(conf['shared_buffers'], '32MB')
+        self.assertEqual(conf['max_worker_processes'], 4)
+
+        # run a few tiny nodes with replication
+        with get_new_node('master') as master:
+            master.init(profile='dense', nodes=100, allow_streaming=True)
+            master.start()
+
+            res = master.execute('postgres', 'show max_connections')
+            self.assertTrue(5 <= int(res[0][0]) <= 20)
+
+            with master.replicate().start() as replica:
+                master.execute('postgres', 'create table test (val int)')
+                replica.catchup()
+
+        # check unknown profile
+        with get_new_node('node') as node:
+            with self.assertRaises(testgres.TestgresException):
+                node.init(profile='unknown')
+
+    def test_resource_budget(self):
+        budget = testgres.ResourceBudget(max_nodes=1, timeout=1)
+        configure_testgres(resource_budget=budget)
+
+        try:
+            with get_new_node('node1') as node1, \
+                    get_new_node('node2') as node2:
+
+                node1.init().start()
+                node2.init()
+
+                # settings have been computed by budget
+                res = node1.execute('postgres', 'show max_connections')
+                self.assertEqual(int(res[0][0]),
+                                 budget.node_settings()['max_connections'])
+                self.assertEqual(budget.running(), 1)
+
+                # no room for one more node
+                with self.assertRaises(TimeoutException):
+                    node2.start()
+
+                # now it's possible
+                node1.stop()
+                node2.start()
+                self.assertEqual(budget.running(), 1)
+
+            self.assertEqual(budget.running(), 0)
+        finally:
+            configure_testgres(resource_budget=None)
+
+    def test_memory_storage(self):
+        tmpfs_dir = TestgresConfig.tmpfs_dir
+
+        with get_new_node('node', storage='memory') as node:
+            node.init().start()
+            node.safe_psql('postgres', 'select 1')
+
+            # node falls back to disk if there's no tmpfs
+            if node.storage == 'memory':
+                self.assertTrue(node.base_dir.startswith(tmpfs_dir))
+
+        with get_new_node('node', storage='memory-wal') as node:
+            node.init().start()
+            node.safe_psql('postgres', 'create table test as select 1')
+
+            if node.storage == 'memory-wal':
+                from testgres.utils import pg_version_ge
+
+                wal_dir = 'pg_wal' if pg_version_ge('10') else 'pg_xlog'
+                wal_dir = os.path.join(node.data_dir, wal_dir)
+                self.assertTrue(os.path.islink(wal_dir))
+
+            # create a tablespace on a chosen mount point
+            location = tempfile.mkdtemp()
+            path = node.create_tablespace('ts', location=location)
+            self.assertTrue(path.startswith(location))
+            node.safe_psql('postgres', 'create table t2 (v int) tablespace ts')
+
+            node.cleanup()
+            self.assertFalse(os.path.exists(path))
+            os.rmdir(location)
+
     def test_pg_ctl(self):
         with get_new_node('node') as node:
             node.init().start()